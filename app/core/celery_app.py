@@ -1,6 +1,7 @@
 from celery import Celery
 from kombu import Queue
 from app.core.config import settings
+from app.core.codec import register_celery_codec
 
 # Crear instancia de Celery
 celery_app = Celery(
@@ -10,11 +11,18 @@ celery_app = Celery(
     include=["app.tasks"]
 )
 
+# Serializer binario (msgpack/orjson + zstd sobre el umbral); "json" sigue
+# aceptado para mensajes encolados antes del cambio
+CODEC_SERIALIZER = register_celery_codec()
+MESSAGE_SERIALIZER = CODEC_SERIALIZER if settings.CELERY_USE_PAYLOAD_CODEC else "json"
+# El codec ya comprime los payloads grandes; gzip solo con serializer json
+MESSAGE_COMPRESSION = None if settings.CELERY_USE_PAYLOAD_CODEC else "gzip"
+
 # Configuración de Celery con tolerancia a fallos mejorada
 celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
+    task_serializer=MESSAGE_SERIALIZER,
+    accept_content=[CODEC_SERIALIZER, "json"],
+    result_serializer=MESSAGE_SERIALIZER,
     timezone="UTC",
     enable_utc=True,
     
@@ -23,7 +31,15 @@ celery_app.conf.update(
         "app.tasks.create_inscription_task": {"queue": "inscripciones"},
         "app.tasks.bulk_create_inscriptions_task": {"queue": "inscripciones_bulk"},
         "app.tasks.create_single_group_inscription_task": {"queue": "inscripciones_individual"},
+        "app.tasks.group_inscription_chord_task": {"queue": "inscripciones"},
+        "app.tasks.add_validated_group_task": {"queue": "inscripciones_individual"},
+        "app.tasks.finalize_group_inscription_task": {"queue": "inscripciones"},
         "app.tasks.health_check_task": {"queue": "health_check"},
+        "app.tasks.refresh_historial_reports_task": {"queue": "inscripciones_bulk"},
+        "app.tasks.rebuild_historial_reports_task": {"queue": "inscripciones_bulk"},
+        "app.tasks.import_historial_task": {"queue": "inscripciones_bulk"},
+        # Cola que consumen todos los workers (start_all.sh / start_worker*.sh)
+        "app.tasks.recover_orphaned_sagas_task": {"queue": "inscripciones"},
     },
     
     # Configuración de colas detallada
@@ -64,8 +80,8 @@ celery_app.conf.update(
     broker_connection_max_retries=10,
     
     # Configuración de serialización segura
-    task_compression='gzip',
-    result_compression='gzip',
+    task_compression=MESSAGE_COMPRESSION,
+    result_compression=MESSAGE_COMPRESSION,
     
     # Configuración de monitoreo
     worker_send_task_events=True,
@@ -76,9 +92,40 @@ celery_app.conf.update(
     worker_concurrency=4,           # 4 threads por worker
 )
 
+# Métricas de tareas por señales (published_at en el publicador, contadores en el worker)
+from app.core import task_metrics  # noqa: E402,F401
+
 # Configuración de colas
 celery_app.conf.task_default_queue = settings.DEFAULT_QUEUE_NAME
 
+# Tareas periódicas (requieren celery beat)
+celery_app.conf.beat_schedule = {}
+
+# Write-behind del ledger de cupos
+if settings.SEAT_LEDGER_ENABLED:
+    celery_app.conf.beat_schedule["reconcile-seat-ledger"] = {
+        "task": "app.tasks.reconcile_seat_ledger_task",
+        "schedule": settings.SEAT_LEDGER_FLUSH_INTERVAL,
+        "options": {"expires": settings.SEAT_LEDGER_FLUSH_INTERVAL * 5},
+    }
+
+# Refresco incremental de reportes de historial
+if settings.HISTORIAL_REPORTS_REFRESH_INTERVAL > 0:
+    celery_app.conf.beat_schedule["refresh-historial-reports"] = {
+        "task": "app.tasks.refresh_historial_reports_task",
+        "schedule": settings.HISTORIAL_REPORTS_REFRESH_INTERVAL,
+        "options": {"expires": settings.HISTORIAL_REPORTS_REFRESH_INTERVAL * 2},
+    }
+
+# Barrido periódico de sagas huérfanas: una saga recién caída todavía no
+# supera SAGA_ORPHAN_TIMEOUT cuando arranca el worker de reemplazo
+if settings.SAGA_RECOVERY_INTERVAL > 0:
+    celery_app.conf.beat_schedule["recover-orphaned-sagas"] = {
+        "task": "app.tasks.recover_orphaned_sagas_task",
+        "schedule": settings.SAGA_RECOVERY_INTERVAL,
+        "options": {"expires": settings.SAGA_RECOVERY_INTERVAL},
+    }
+
 # Configuración de handlers de señales para logging y monitoreo
 @celery_app.task(bind=True)
 def retry_task_with_backoff(self, func, *args, **kwargs):
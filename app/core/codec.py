@@ -0,0 +1,190 @@
+"""
+Codec binario para payloads guardados en Redis y mensajes de Celery.
+
+Un payload codificado es `0xC1` + un byte de flags + el cuerpo. `0xC1` es un
+byte que msgpack nunca usa y que no puede iniciar un JSON, así que los payloads
+anteriores (JSON plano o comprimido con gzip/zlib) se siguen leyendo sin
+migración.
+
+- Formato (bits 0-3): msgpack, orjson o json estándar. Con "auto" se usa el
+  primero disponible.
+- Compresión (bits 6-7): zstd (o zlib si `zstandard` no está instalado), solo
+  para cuerpos de al menos `PAYLOAD_COMPRESSION_THRESHOLD` bytes. Los mensajes
+  chicos de inscripción van sin comprimir.
+
+msgpack, orjson y zstandard son opcionales. Fechas, Decimal, UUID y enums se
+escriben como texto (igual que el `json.dumps(..., default=str)` anterior).
+
+El codec se registra en kombu como serializer "inscripcion" (ver
+`register_celery_codec`).
+"""
+import enum
+import gzip
+import json
+import zlib
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Optional
+from uuid import UUID
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+MAGIC = 0xC1
+
+FORMAT_JSON = 1
+FORMAT_ORJSON = 2
+FORMAT_MSGPACK = 3
+_FORMAT_NAMES = {"json": FORMAT_JSON, "orjson": FORMAT_ORJSON, "msgpack": FORMAT_MSGPACK}
+_FORMAT_MASK = 0x0F
+
+COMPRESSION_ZLIB = 0x40
+COMPRESSION_ZSTD = 0x80
+
+CELERY_SERIALIZER = "inscripcion"
+CELERY_CONTENT_TYPE = "application/x-inscripcion-codec"
+
+
+def _default(obj: Any) -> Any:
+    """Tipos que ni msgpack ni json saben escribir"""
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, (Decimal, UUID)):
+        return str(obj)
+    return str(obj)
+
+
+class PayloadCodec:
+    """Codificar/decodificar payloads con formato y compresión configurables"""
+
+    def __init__(self, format: str = "auto", compression_threshold: int = 1024, zstd_level: int = 3):
+        if format == "auto":
+            format = "msgpack" if MSGPACK_AVAILABLE else "orjson" if ORJSON_AVAILABLE else "json"
+        if format not in _FORMAT_NAMES:
+            raise ValueError(f"Formato de payload no soportado: {format}")
+        if format == "msgpack" and not MSGPACK_AVAILABLE:
+            raise ValueError("PAYLOAD_CODEC=msgpack requiere el paquete msgpack")
+        if format == "orjson" and not ORJSON_AVAILABLE:
+            raise ValueError("PAYLOAD_CODEC=orjson requiere el paquete orjson")
+        self.format = format
+        self.format_id = _FORMAT_NAMES[format]
+        self.compression_threshold = compression_threshold
+        self.zstd_level = zstd_level
+        self._zstd_compressor = zstandard.ZstdCompressor(level=zstd_level) if ZSTD_AVAILABLE else None
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if ZSTD_AVAILABLE else None
+
+    def _encode_body(self, obj: Any) -> bytes:
+        if self.format_id == FORMAT_MSGPACK:
+            return msgpack.packb(obj, default=_default, use_bin_type=True)
+        if self.format_id == FORMAT_ORJSON:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj, default=_default, separators=(",", ":")).encode("utf-8")
+
+    def dumps(self, obj: Any) -> bytes:
+        body = self._encode_body(obj)
+        flags = self.format_id
+        if 0 < self.compression_threshold <= len(body):
+            if self._zstd_compressor is not None:
+                body = self._zstd_compressor.compress(body)
+                flags |= COMPRESSION_ZSTD
+            else:
+                body = zlib.compress(body)
+                flags |= COMPRESSION_ZLIB
+        return bytes((MAGIC, flags)) + body
+
+    def loads(self, raw: Any) -> Any:
+        """Decodificar un payload propio o uno anterior (JSON, gzip o zlib)"""
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        raw = bytes(raw)
+        if not raw or raw[0] != MAGIC:
+            return _loads_legacy(raw)
+
+        flags = raw[1]
+        body = raw[2:]
+        if flags & COMPRESSION_ZSTD:
+            if self._zstd_decompressor is None:
+                raise ValueError("Payload comprimido con zstd pero zstandard no está instalado")
+            body = self._zstd_decompressor.decompress(body)
+        elif flags & COMPRESSION_ZLIB:
+            body = zlib.decompress(body)
+
+        format_id = flags & _FORMAT_MASK
+        if format_id == FORMAT_MSGPACK:
+            if not MSGPACK_AVAILABLE:
+                raise ValueError("Payload msgpack pero msgpack no está instalado")
+            return msgpack.unpackb(body, raw=False, strict_map_key=False)
+        if format_id == FORMAT_ORJSON and ORJSON_AVAILABLE:
+            return orjson.loads(body)
+        if format_id in (FORMAT_ORJSON, FORMAT_JSON):
+            return json.loads(body)
+        raise ValueError(f"Formato de payload desconocido: {format_id}")
+
+
+def _loads_legacy(raw: bytes) -> Any:
+    """JSON plano, gzip o zlib (el "gzip" de kombu es zlib)"""
+    if raw[:2] == b"\x1f\x8b":
+        raw = gzip.decompress(raw)
+    elif raw[:1] == b"\x78":
+        raw = zlib.decompress(raw)
+    return orjson.loads(raw) if ORJSON_AVAILABLE else json.loads(raw)
+
+
+_payload_codec: Optional[PayloadCodec] = None
+
+
+def get_payload_codec() -> PayloadCodec:
+    """Codec configurado del proceso (PAYLOAD_CODEC / PAYLOAD_COMPRESSION_THRESHOLD)"""
+    global _payload_codec
+    if _payload_codec is None:
+        from app.core.config import settings
+        _payload_codec = PayloadCodec(
+            format=settings.PAYLOAD_CODEC,
+            compression_threshold=settings.PAYLOAD_COMPRESSION_THRESHOLD,
+            zstd_level=settings.PAYLOAD_ZSTD_LEVEL,
+        )
+    return _payload_codec
+
+
+def dumps(obj: Any) -> bytes:
+    return get_payload_codec().dumps(obj)
+
+
+def loads(raw: Any) -> Any:
+    return get_payload_codec().loads(raw)
+
+
+def register_celery_codec() -> str:
+    """Registrar el codec como serializer de kombu y devolver su nombre"""
+    from kombu.serialization import register
+
+    register(
+        CELERY_SERIALIZER,
+        dumps,
+        loads,
+        content_type=CELERY_CONTENT_TYPE,
+        content_encoding="binary",
+    )
+    return CELERY_SERIALIZER
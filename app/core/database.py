@@ -1,17 +1,117 @@
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.pool import NullPool
 from app.core.config import settings
+from app.core.metrics import DB_POOL_WAIT, instrument_engine
+
+
+class PoolStats:
+    """Contadores de uso del pool de conexiones (checkouts, esperas, reconexiones)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.acquisitions = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        """Registrar el tiempo que una sesión esperó por una conexión"""
+        with self._lock:
+            self.acquisitions += 1
+            self.total_wait_seconds += seconds
+            if seconds > self.max_wait_seconds:
+                self.max_wait_seconds = seconds
+
+    def snapshot(self, engine) -> Dict[str, Any]:
+        """Obtener una foto de los contadores junto al estado actual del pool"""
+        pool = engine.sync_engine.pool
+        with self._lock:
+            data = {
+                "mode": settings.DB_POOL_MODE,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "acquisitions": self.acquisitions,
+                "avg_wait_ms": round(self.total_wait_seconds / self.acquisitions * 1000, 3) if self.acquisitions else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            }
+        if not isinstance(pool, NullPool):
+            data.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+            })
+        return data
+
+
+def build_engine_kwargs() -> Dict[str, Any]:
+    """Construir los argumentos del engine a partir de Settings"""
+    connect_args: Dict[str, Any] = {"sslmode": "require"}
+    if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"
+
+    kwargs: Dict[str, Any] = {
+        "echo": settings.DEBUG,
+        "future": True,
+        "connect_args": connect_args,
+    }
+
+    if settings.DB_POOL_MODE.lower() == "null":
+        # Modo explícito sin pool: cada sesión abre y cierra su propia conexión
+        kwargs["poolclass"] = NullPool
+    else:
+        kwargs.update({
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "pool_timeout": settings.DB_POOL_TIMEOUT,
+            "pool_recycle": settings.DB_POOL_RECYCLE,
+            "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        })
+    return kwargs
+
+
+def _attach_pool_listeners(engine, stats: PoolStats) -> None:
+    """Registrar eventos del pool para alimentar PoolStats"""
+    pool = engine.sync_engine.pool
+
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        stats.connects += 1
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.checkouts += 1
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        stats.checkins += 1
+
+    @event.listens_for(pool, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        stats.invalidations += 1
+
 
 # Create async engine with psycopg (compatible with Python 3.13)
 engine = create_async_engine(
     settings.DATABASE_URL.replace("postgresql://", "postgresql+psycopg://"),
-    poolclass=NullPool,
-    echo=settings.DEBUG,
-    future=True,
-    connect_args={"sslmode": "require"}
+    **build_engine_kwargs()
 )
 
+pool_stats = PoolStats()
+_attach_pool_listeners(engine, pool_stats)
+instrument_engine(engine)
+
 # Create async session maker
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
@@ -27,6 +127,12 @@ async def get_db():
     """Dependency to get database session"""
     async with AsyncSessionLocal() as session:
         try:
+            # Adquirir la conexión de inmediato para medir la espera en el pool
+            start = time.perf_counter()
+            await session.connection()
+            wait = time.perf_counter() - start
+            pool_stats.record_wait(wait)
+            DB_POOL_WAIT.observe(wait)
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
@@ -15,6 +15,17 @@ import sys
 import traceback
 from contextvars import ContextVar
 
+from app.core.logging import LazyMessage
+
+try:
+    import orjson
+
+    def _dumps(obj: Dict[str, Any]) -> str:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+except ImportError:  # orjson es opcional
+    def _dumps(obj: Dict[str, Any]) -> str:
+        return json.dumps(obj, default=str, separators=(',', ':'))
+
 # Context variables for tracking across async operations
 correlation_id_ctx: ContextVar[Optional[str]] = ContextVar('correlation_id', default=None)
 transaction_id_ctx: ContextVar[Optional[str]] = ContextVar('transaction_id', default=None)
@@ -54,6 +65,18 @@ class PerformanceMetrics:
         return asdict(self)
 
 
+class StructuredMessage(LazyMessage):
+    """Structured log entry serialized to JSON only when a handler writes it"""
+
+    __slots__ = ("entry",)
+
+    def __init__(self, entry: Dict[str, Any]):
+        self.entry = entry
+
+    def __str__(self) -> str:
+        return _dumps(self.entry)
+
+
 class StructuredLogger:
     """Enhanced structured logger with correlation tracking"""
     
@@ -74,14 +97,14 @@ class StructuredLogger:
         # Remove None values
         return {k: v for k, v in context.items() if v is not None}
     
-    def _format_message(
+    def _build_entry(
         self, 
         level: str, 
         message: str, 
         extra: Optional[Dict[str, Any]] = None,
         error: Optional[Exception] = None
-    ) -> str:
-        """Format structured log message"""
+    ) -> Dict[str, Any]:
+        """Build structured log entry (context and traceback are captured at call time)"""
         log_entry = {
             "level": level,
             "message": message,
@@ -100,27 +123,50 @@ class StructuredLogger:
                 }
             })
         
-        return json.dumps(log_entry, default=str, separators=(',', ':'))
+        return log_entry
+    
+    def _format_message(
+        self, 
+        level: str, 
+        message: str, 
+        extra: Optional[Dict[str, Any]] = None,
+        error: Optional[Exception] = None
+    ) -> str:
+        """Format structured log message"""
+        return _dumps(self._build_entry(level, message, extra, error))
+    
+    def _log(
+        self,
+        levelno: int,
+        level: str,
+        message: str,
+        extra: Optional[Dict[str, Any]] = None,
+        error: Optional[Exception] = None
+    ):
+        """Skip disabled levels before building anything; serialize lazily in the writer"""
+        if not self.logger.isEnabledFor(levelno):
+            return
+        self.logger.log(levelno, StructuredMessage(self._build_entry(level, message, extra, error)), stacklevel=3)
     
     def debug(self, message: str, **extra):
         """Debug level logging"""
-        self.logger.debug(self._format_message("DEBUG", message, extra))
+        self._log(logging.DEBUG, "DEBUG", message, extra)
     
     def info(self, message: str, **extra):
         """Info level logging"""
-        self.logger.info(self._format_message("INFO", message, extra))
+        self._log(logging.INFO, "INFO", message, extra)
     
     def warning(self, message: str, **extra):
         """Warning level logging"""
-        self.logger.warning(self._format_message("WARNING", message, extra))
+        self._log(logging.WARNING, "WARNING", message, extra)
     
     def error(self, message: str, error: Optional[Exception] = None, **extra):
         """Error level logging"""
-        self.logger.error(self._format_message("ERROR", message, extra, error))
+        self._log(logging.ERROR, "ERROR", message, extra, error)
     
     def critical(self, message: str, error: Optional[Exception] = None, **extra):
         """Critical level logging"""
-        self.logger.critical(self._format_message("CRITICAL", message, extra, error))
+        self._log(logging.CRITICAL, "CRITICAL", message, extra, error)
     
     def log_performance(self, metrics: PerformanceMetrics, **extra):
         """Log performance metrics"""
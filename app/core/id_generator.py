@@ -0,0 +1,358 @@
+"""
+Generación de códigos para claves de inscripcion/detalle_inscripcion.
+
+Los códigos tienen la forma `<prefijo><9 caracteres base36>` (10 caracteres,
+igual que `String(10)`). El número se codifica con ancho fijo, así que el orden
+lexicográfico coincide con el numérico y los códigos nuevos caen al final del
+índice B-tree.
+
+Implementaciones (settings.ID_GENERATOR):
+- "sequence": bloques de una secuencia de Postgres (`CREATE SEQUENCE ...
+  INCREMENT BY <bloque>`, creada al iniciar con `ensure_id_sequence`). Un
+  `nextval` reserva un bloque completo que el proceso reparte en memoria; sin
+  colisiones por construcción.
+- "snowflake": segundos desde EPOCH | nodo | secuencia, sin base de datos; a lo
+  sumo 1024 códigos por segundo y proceso. Cada proceso necesita un nodo
+  distinto: un lease en Redis (`id_generator:node:<n>`, SET NX EX renovado por
+  un hilo de heartbeat) o ID_NODE_ID fijo. ID_NODE_ID solo sirve para
+  despliegues de un único proceso: varios procesos (workers prefork, réplicas
+  de la API) con el mismo valor generan códigos repetidos. Si no hay nodo libre
+  o el lease vence sin renovarse, el generador deja de emitir códigos en lugar
+  de arriesgar colisiones.
+"""
+import asyncio
+import atexit
+from abc import ABC, abstractmethod
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Deque, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+CODE_WIDTH = 9
+NODE_LEASE_PREFIX = "id_generator:node:"
+_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+MAX_VALUE = 36 ** CODE_WIDTH - 1
+
+
+def encode_base36(value: int, width: int = CODE_WIDTH) -> str:
+    """Codificar un entero no negativo en base36 con ancho fijo"""
+    if value < 0 or value > 36 ** width - 1:
+        raise ValueError(f"Valor fuera de rango para {width} caracteres base36: {value}")
+    chars = []
+    for _ in range(width):
+        value, resto = divmod(value, 36)
+        chars.append(_ALPHABET[resto])
+    return "".join(reversed(chars))
+
+
+def format_code(prefix: str, value: int) -> str:
+    return f"{prefix}{encode_base36(value)}"
+
+
+class IdGenerator(ABC):
+    """Interfaz de los generadores de códigos"""
+
+    async def next_code(self, prefix: str, db: Optional[AsyncSession] = None) -> str:
+        return (await self.next_codes(prefix, 1, db))[0]
+
+    @abstractmethod
+    async def next_codes(self, prefix: str, count: int, db: Optional[AsyncSession] = None) -> List[str]:
+        """`count` códigos nuevos; `db` es la sesión que ya tiene quien llama (si la hay)"""
+
+
+class SequenceBlockIdGenerator(IdGenerator):
+    """
+    Reparte en memoria bloques reservados de una secuencia de Postgres. La
+    secuencia se crea al iniciar (`ensure_sequence`); los bloques se piden por
+    la conexión de la sesión de quien llama, sin tomar otra del pool.
+    """
+
+    def __init__(
+        self,
+        engine_getter: Callable[[], AsyncEngine],
+        sequence_name: str = "codigo_seq",
+        block_size: int = 1000
+    ):
+        self.engine_getter = engine_getter
+        self.sequence_name = sequence_name
+        self.block_size = block_size
+        self._increment: Optional[int] = None
+        self._values: Deque[int] = deque()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def ensure_sequence(self) -> None:
+        """Crear la secuencia si no existe (al iniciar la API o el worker)"""
+        async with self.engine_getter().begin() as conn:
+            await conn.execute(text(
+                f"CREATE SEQUENCE IF NOT EXISTS {self.sequence_name} "
+                f"INCREMENT BY {self.block_size} MINVALUE 1 START WITH 1"
+            ))
+            await self._read_increment(conn)
+
+    async def _read_increment(self, conn) -> None:
+        # El tamaño de bloque real es el de la secuencia, no el configurado
+        result = await conn.execute(
+            text("SELECT increment_by FROM pg_sequences WHERE sequencename = :name"),
+            {"name": self.sequence_name}
+        )
+        increment = result.scalar_one_or_none()
+        if increment is None:
+            raise RuntimeError(f"La secuencia {self.sequence_name} no existe (ver ensure_id_sequence)")
+        self._increment = int(increment)
+        if self._increment != self.block_size:
+            logger.warning(
+                f"Secuencia {self.sequence_name} usa bloques de {self._increment} "
+                f"(configurado {self.block_size})"
+            )
+
+    async def _fetch_blocks(self, conn, blocks: int) -> None:
+        # nextval no es transaccional: un rollback posterior de la sesión no devuelve el bloque
+        if self._increment is None:
+            await self._read_increment(conn)
+        result = await conn.execute(
+            text(f"SELECT nextval('{self.sequence_name}') FROM generate_series(1, :n)"),
+            {"n": blocks}
+        )
+        for (start,) in result:
+            self._values.extend(range(start, start + self._increment))
+
+    async def next_codes(self, prefix: str, count: int, db: Optional[AsyncSession] = None) -> List[str]:
+        if count <= 0:
+            return []
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if len(self._values) < count:
+                blocks = math.ceil((count - len(self._values)) / (self._increment or self.block_size))
+                if db is not None:
+                    await self._fetch_blocks(db, blocks)
+                else:
+                    async with self.engine_getter().connect() as conn:
+                        await self._fetch_blocks(conn, blocks)
+            return [format_code(prefix, self._values.popleft()) for _ in range(count)]
+
+
+class SnowflakeIdGenerator(IdGenerator):
+    """
+    46 bits = 30 bits de segundos desde EPOCH (~34 años) | 6 bits de nodo |
+    10 bits de secuencia (1024 códigos por segundo y nodo).
+
+    Nunca emite códigos de segundos futuros: si se agota la secuencia espera al
+    segundo siguiente, y el primer código de un generador nuevo es del segundo
+    posterior a su creación. Así un proceso que reinicia con el mismo nodo (o
+    toma el lease de otro) no repite códigos del anterior, siempre que el reloj
+    no retroceda entre ambos.
+    """
+
+    EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()
+    NODE_BITS = 6
+    SEQUENCE_BITS = 10
+    TIME_BITS = 30
+
+    def __init__(self, node_id: int, lease: Optional["NodeLease"] = None):
+        if not 0 <= node_id < (1 << self.NODE_BITS):
+            raise ValueError(f"node_id debe estar entre 0 y {(1 << self.NODE_BITS) - 1}")
+        self.node_id = node_id
+        self.lease = lease
+        self._lock = threading.Lock()
+        # Segundo actual marcado como agotado: se empieza en el siguiente
+        self._last_second = int(time.time() - self.EPOCH)
+        self._next_sequence = 1 << self.SEQUENCE_BITS
+
+    def _take(self, count: int) -> List[int]:
+        """Valores disponibles sin esperar (puede devolver menos de `count`)"""
+        with self._lock:
+            now = int(time.time() - self.EPOCH)
+            if now > self._last_second:
+                self._last_second = now
+                self._next_sequence = 0
+            if self._last_second >= (1 << self.TIME_BITS):
+                raise OverflowError("El reloj de SnowflakeIdGenerator excede su rango")
+            if self.lease is not None and self.EPOCH + self._last_second + 1 > self.lease.valid_until:
+                raise RuntimeError(f"Lease del nodo snowflake {self.node_id} vencido; no se emiten más códigos")
+            inicio = self._next_sequence
+            fin = min(inicio + count, 1 << self.SEQUENCE_BITS)
+            self._next_sequence = fin
+            base = (self._last_second << (self.NODE_BITS + self.SEQUENCE_BITS)) | (self.node_id << self.SEQUENCE_BITS)
+            return [base | sequence for sequence in range(inicio, fin)]
+
+    def _wait_seconds(self) -> float:
+        return max(self.EPOCH + self._last_second + 1 - time.time(), 0.0)
+
+    def next_codes_sync(self, prefix: str, count: int) -> List[str]:
+        codes: List[str] = []
+        while True:
+            codes.extend(format_code(prefix, v) for v in self._take(count - len(codes)))
+            if len(codes) >= count:
+                return codes
+            time.sleep(self._wait_seconds())
+
+    async def next_codes(self, prefix: str, count: int, db: Optional[AsyncSession] = None) -> List[str]:
+        codes: List[str] = []
+        while True:
+            codes.extend(format_code(prefix, v) for v in self._take(count - len(codes)))
+            if len(codes) >= count:
+                return codes
+            await asyncio.sleep(self._wait_seconds())
+
+
+# Renueva el TTL solo si la clave sigue siendo de este proceso
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class NodeLease:
+    """
+    Lease exclusivo de un nodo snowflake en Redis. `valid_until` (epoch) es el
+    instante hasta el que el nodo es seguro: se calcula desde el envío del último
+    SET/renovación exitoso, así que nunca supera el vencimiento real de la clave.
+    """
+
+    def __init__(self, client, ttl: int):
+        self.client = client
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.node_id: Optional[int] = None
+        self.valid_until = 0.0
+        self._renew = client.register_script(_RENEW_LUA)
+        self._release = client.register_script(_RELEASE_LUA)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def key(self) -> str:
+        return f"{NODE_LEASE_PREFIX}{self.node_id}"
+
+    def acquire(self) -> int:
+        """Tomar el primer nodo libre (desde un desplazamiento aleatorio) y arrancar el heartbeat"""
+        total = 1 << SnowflakeIdGenerator.NODE_BITS
+        inicio = random.randrange(total)
+        for i in range(total):
+            node_id = (inicio + i) % total
+            enviado = time.time()
+            if self.client.set(f"{NODE_LEASE_PREFIX}{node_id}", self.token, nx=True, ex=self.ttl):
+                self.node_id = node_id
+                self.valid_until = enviado + self.ttl
+                self._thread = threading.Thread(target=self._heartbeat, name="id-node-lease", daemon=True)
+                self._thread.start()
+                return node_id
+        raise RuntimeError(f"No hay nodos snowflake libres en Redis ({total} en uso)")
+
+    def renew(self) -> bool:
+        enviado = time.time()
+        if int(self._renew(keys=[self.key], args=[self.token, self.ttl * 1000])):
+            self.valid_until = enviado + self.ttl
+            return True
+        return False
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                if not self.renew():
+                    logger.error(f"Lease del nodo snowflake {self.node_id} perdido; el generador queda detenido")
+                    return
+            except Exception as e:
+                # Si Redis no vuelve antes de valid_until, el generador deja de emitir
+                logger.warning(f"No se pudo renovar el lease del nodo snowflake {self.node_id}: {e}")
+
+    def release(self) -> None:
+        self._stop.set()
+        if self.node_id is None:
+            return
+        try:
+            self._release(keys=[self.key], args=[self.token])
+        except Exception as e:
+            logger.warning(f"No se pudo liberar el lease del nodo snowflake {self.node_id}: {e}")
+        self.valid_until = 0.0
+
+
+def _snowflake_generator() -> SnowflakeIdGenerator:
+    """Snowflake con ID_NODE_ID fijo o con un nodo arrendado en Redis (falla si no hay)"""
+    if settings.ID_NODE_ID is not None:
+        return SnowflakeIdGenerator(settings.ID_NODE_ID)
+    import redis
+    lease = NodeLease(redis.Redis.from_url(settings.REDIS_URL), settings.ID_NODE_LEASE_TTL)
+    node_id = lease.acquire()
+    atexit.register(lease.release)
+    logger.info(f"Nodo snowflake {node_id} arrendado en Redis (TTL {lease.ttl}s)")
+    return SnowflakeIdGenerator(node_id, lease)
+
+
+def _default_engine() -> AsyncEngine:
+    """Engine del worker si su runtime está activo; si no, el de la API"""
+    from app.core.worker_runtime import get_worker_runtime
+    runtime = get_worker_runtime()
+    if runtime.is_running:
+        return runtime.engine
+    from app.core.database import engine
+    return engine
+
+
+_id_generator: Optional[IdGenerator] = None
+_id_generator_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    """El hijo no hereda el nodo del padre (su heartbeat no existe en el hijo)"""
+    global _id_generator, _id_generator_lock
+    _id_generator = None
+    _id_generator_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_id_generator() -> IdGenerator:
+    """Obtener el generador de códigos configurado para este proceso"""
+    global _id_generator
+    if _id_generator is None:
+        with _id_generator_lock:
+            if _id_generator is None:
+                if settings.ID_GENERATOR == "snowflake":
+                    _id_generator = _snowflake_generator()
+                else:
+                    _id_generator = SequenceBlockIdGenerator(
+                        _default_engine,
+                        sequence_name=settings.ID_SEQUENCE_NAME,
+                        block_size=settings.ID_BLOCK_SIZE
+                    )
+    return _id_generator
+
+
+async def ensure_id_sequence() -> None:
+    """Crear la secuencia de códigos al iniciar (no-op con snowflake)"""
+    generator = get_id_generator()
+    if isinstance(generator, SequenceBlockIdGenerator):
+        await generator.ensure_sequence()
+
+
+async def new_inscripcion_code(db: Optional[AsyncSession] = None) -> str:
+    return await get_id_generator().next_code("I", db)
+
+
+async def new_detalle_codes(count: int, db: Optional[AsyncSession] = None) -> List[str]:
+    return await get_id_generator().next_codes("D", count, db)
@@ -2,18 +2,32 @@
 Idempotency implementation for inscription system
 Ensures that repeated requests with the same idempotency key produce the same result
 """
+import asyncio
 import hashlib
+import inspect
 import json
+import time
 import uuid
 from datetime import datetime, timedelta
 from typing import Any, Dict, Optional, Union
 from dataclasses import dataclass, asdict
-import redis
+import redis.asyncio as aioredis
 import logging
 
+from app.core import codec
+from app.core.redis_client import get_async_redis
+
 logger = logging.getLogger(__name__)
 
 
+class OperationInProgressError(Exception):
+    """Another process holds the in-progress lease and did not finish in time"""
+    
+    def __init__(self, idempotency_key: str):
+        self.idempotency_key = idempotency_key
+        super().__init__(f"Operation still in progress for idempotency key: {idempotency_key}")
+
+
 @dataclass
 class IdempotencyResult:
     """Result of an idempotent operation"""
@@ -88,13 +102,123 @@ class IdempotencyKeyGenerator:
         return data
 
 
+# Cached entries are indexed in a sorted set (member = idempotency key,
+# score = expiry timestamp) and counted in a stats hash, so statistics never
+# walk the keyspace. Expired members are pruned lazily and counted as
+# expirations.
+
+# KEYS[1] = cache key, KEYS[2] = index, KEYS[3] = stats hash, KEYS[4] = lease
+# ARGV[1] = idempotency key, ARGV[2] = ttl, ARGV[3] = payload, ARGV[4] = now,
+# ARGV[5] = operation name, ARGV[6] = lease token ('' when executed without lease)
+_STORE_LUA = """
+local expired = redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[4])
+if expired > 0 then
+    redis.call('HINCRBY', KEYS[3], 'expired', expired)
+end
+redis.call('SET', KEYS[1], ARGV[3], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], tonumber(ARGV[4]) + tonumber(ARGV[2]), ARGV[1])
+redis.call('HINCRBY', KEYS[3], 'stored', 1)
+redis.call('HINCRBY', KEYS[3], 'stored:' .. ARGV[5], 1)
+if ARGV[6] ~= '' and redis.call('GET', KEYS[4]) == ARGV[6] then
+    redis.call('DEL', KEYS[4])
+end
+return 1
+"""
+
+# KEYS[1] = stats hash; ARGV[1] = counter, ARGV[2] = operation name
+_COUNT_LUA = """
+redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+redis.call('HINCRBY', KEYS[1], ARGV[1] .. ':' .. ARGV[2], 1)
+return 1
+"""
+
+# KEYS[1] = cache key, KEYS[2] = index, KEYS[3] = stats hash; ARGV[1] = idempotency key
+_INVALIDATE_LUA = """
+local deleted = redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+if deleted > 0 then
+    redis.call('HINCRBY', KEYS[3], 'invalidated', 1)
+end
+return deleted
+"""
+
+# In-progress leases (single-flight): KEYS[1] = lease key, ARGV[1] = token
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS[1] = lease key; ARGV[1] = token, ARGV[2] = lease in milliseconds
+_EXTEND_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS[1] = index, KEYS[2] = stats hash; ARGV[1] = now, ARGV[2] = sample size
+_STATS_LUA = """
+local expired = redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if expired > 0 then
+    redis.call('HINCRBY', KEYS[2], 'expired', expired)
+end
+local sample = {}
+if tonumber(ARGV[2]) > 0 then
+    sample = redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+end
+return {redis.call('ZCARD', KEYS[1]), sample, redis.call('HGETALL', KEYS[2])}
+"""
+
+
+def _operation_name(idempotency_key: str) -> str:
+    """Operation part of an `operation:user_id:hash` key"""
+    return idempotency_key.split(":", 1)[0] or "unknown"
+
+
+def _text(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
 class IdempotencyManager:
     """Manages idempotency for operations using Redis as storage"""
     
-    def __init__(self, redis_client: redis.Redis, default_ttl: int = 3600):
+    def __init__(
+        self,
+        redis_client: aioredis.Redis,
+        default_ttl: int = 3600,
+        stats_sample_size: int = 5,
+        lock_lease: float = 30.0,
+        wait_timeout: float = 60.0,
+        poll_interval: float = 0.05,
+        max_poll_interval: float = 0.5
+    ):
         self.redis_client = redis_client
         self.default_ttl = default_ttl  # Default TTL in seconds (1 hour)
+        self.stats_sample_size = stats_sample_size
+        self.lock_lease = lock_lease  # In-progress lease, renewed while executing
+        self.wait_timeout = wait_timeout  # Max wait for another process's result
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
         self.key_prefix = "idempotency:"
+        self.lock_prefix = "idempotency_meta:inflight:"
+        self.index_key = "idempotency_meta:index"
+        self.stats_key = "idempotency_meta:stats"
+        self._store = redis_client.register_script(_STORE_LUA)
+        self._count = redis_client.register_script(_COUNT_LUA)
+        self._invalidate = redis_client.register_script(_INVALIDATE_LUA)
+        self._stats = redis_client.register_script(_STATS_LUA)
+        self._release = redis_client.register_script(_RELEASE_LUA)
+        self._extend = redis_client.register_script(_EXTEND_LUA)
+        self._inflight: Dict[str, asyncio.Future] = {}
+    
+    async def _record(self, counter: str, idempotency_key: str) -> None:
+        """Increment a hit/miss counter (total and per operation); never fails the caller"""
+        try:
+            await self._count(keys=[self.stats_key], args=[counter, _operation_name(idempotency_key)])
+        except Exception as e:
+            logger.warning(f"Error recording idempotency {counter} for key {idempotency_key}: {e}")
     
     async def get_or_execute(
         self,
@@ -105,7 +229,11 @@ class IdempotencyManager:
         **kwargs
     ) -> IdempotencyResult:
         """
-        Get cached result or execute operation if not cached
+        Get cached result or execute operation if not cached.
+        
+        Concurrent calls with the same key are single-flight: inside a process
+        they share one in-flight future, and across processes only the holder
+        of the in-progress lease executes while the others wait for its result.
         
         Args:
             idempotency_key: Unique key for this operation
@@ -115,76 +243,186 @@ class IdempotencyManager:
         
         Returns:
             IdempotencyResult with operation result
+        
+        Raises:
+            OperationInProgressError: another process still holds the lease
+                after wait_timeout seconds
         """
-        cache_key = f"{self.key_prefix}{idempotency_key}"
-        ttl = ttl or self.default_ttl
+        while True:
+            inflight = self._inflight.get(idempotency_key)
+            if inflight is None:
+                break
+            logger.info(f"Coalescing with in-flight operation for key: {idempotency_key}")
+            try:
+                leader_result = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if inflight.cancelled():
+                    continue  # The leader was cancelled: try again
+                raise
+            return IdempotencyResult(
+                result=leader_result.result,
+                created_at=leader_result.created_at,
+                is_cached=True,
+                metadata={**(leader_result.metadata or {}), "coalesced": True}
+            )
         
-        # Try to get cached result
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[idempotency_key] = future
         try:
-            cached_data = self.redis_client.get(cache_key)
-            if cached_data:
-                try:
-                    cached_result = json.loads(cached_data)
-                    logger.info(f"Idempotency cache hit for key: {idempotency_key}")
-                    return IdempotencyResult(
-                        result=cached_result["result"],
-                        created_at=datetime.fromisoformat(cached_result["created_at"]),
-                        is_cached=True,
-                        metadata=cached_result.get("metadata")
-                    )
-                except (json.JSONDecodeError, KeyError) as e:
-                    logger.warning(f"Invalid cached data for key {idempotency_key}: {e}")
-                    # Continue to execute operation
+            result = await self._single_flight(idempotency_key, operation_func, args, kwargs, ttl or self.default_ttl)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Followers may not exist; mark it as retrieved
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(idempotency_key, None)
+    
+    async def _get_cached(self, idempotency_key: str) -> Optional[IdempotencyResult]:
+        """Cached result for the key, or None (also on Redis or payload errors)"""
+        try:
+            cached_data = await self.redis_client.get(f"{self.key_prefix}{idempotency_key}")
         except Exception as e:
             logger.error(f"Error accessing cache for key {idempotency_key}: {e}")
-            # Continue to execute operation
+            return None
+        if not cached_data:
+            return None
+        try:
+            cached_result = codec.loads(cached_data)
+            result = IdempotencyResult(
+                result=cached_result["result"],
+                created_at=datetime.fromisoformat(cached_result["created_at"]),
+                is_cached=True,
+                metadata=cached_result.get("metadata")
+            )
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Invalid cached data for key {idempotency_key}: {e}")
+            return None
+        logger.info(f"Idempotency cache hit for key: {idempotency_key}")
+        await self._record("hits", idempotency_key)
+        return result
+    
+    async def _single_flight(self, idempotency_key: str, operation_func, args, kwargs, ttl: int) -> IdempotencyResult:
+        """Return the cached result, execute as lease holder, or wait for the holder"""
+        cached = await self._get_cached(idempotency_key)
+        if cached is not None:
+            return cached
         
-        # Execute operation
+        lock_key = f"{self.lock_prefix}{idempotency_key}"
+        token = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_timeout
+        delay = self.poll_interval
+        while True:
+            try:
+                acquired = await self.redis_client.set(lock_key, token, nx=True, px=int(self.lock_lease * 1000))
+            except Exception as e:
+                logger.error(f"Error acquiring in-progress lease for key {idempotency_key}, executing without it: {e}")
+                return await self._execute(idempotency_key, operation_func, args, kwargs, ttl)
+            if acquired:
+                return await self._execute(idempotency_key, operation_func, args, kwargs, ttl, lock_key, token)
+            
+            # Another process is executing: poll for its result. If the lease
+            # is released without a result (failure or expiry) the next SET NX
+            # takes over.
+            if loop.time() >= deadline:
+                raise OperationInProgressError(idempotency_key)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+            cached = await self._get_cached(idempotency_key)
+            if cached is not None:
+                return cached
+    
+    async def _execute(
+        self,
+        idempotency_key: str,
+        operation_func,
+        args,
+        kwargs,
+        ttl: int,
+        lock_key: Optional[str] = None,
+        token: Optional[str] = None
+    ) -> IdempotencyResult:
+        """Execute the operation, cache its result and release the lease"""
+        await self._record("misses", idempotency_key)
         logger.info(f"Executing operation for idempotency key: {idempotency_key}")
+        heartbeat = asyncio.create_task(self._renew_lease(lock_key, token)) if lock_key else None
         try:
-            if hasattr(operation_func, '__call__'):
-                if hasattr(operation_func, '__await__'):
-                    # Async function
-                    result = await operation_func(*args, **kwargs)
-                else:
-                    # Sync function
-                    result = operation_func(*args, **kwargs)
-            else:
+            if not callable(operation_func):
                 raise ValueError("operation_func must be callable")
-            
-            # Cache the result
-            cache_data = {
-                "result": result,
-                "created_at": datetime.now().isoformat(),
-                "metadata": {
-                    "operation_args_count": len(args),
-                    "operation_kwargs_keys": list(kwargs.keys())
-                }
+            result = operation_func(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+        except BaseException as e:
+            if heartbeat is not None:
+                heartbeat.cancel()
+            if lock_key:
+                await self._release_lease(lock_key, token)
+            if isinstance(e, Exception):
+                logger.error(f"Operation failed for idempotency key {idempotency_key}: {e}")
+            raise
+        if heartbeat is not None:
+            heartbeat.cancel()
+        
+        # Cache the result (releasing the lease in the same script)
+        cache_data = {
+            "result": result,
+            "created_at": datetime.now().isoformat(),
+            "metadata": {
+                "operation_args_count": len(args),
+                "operation_kwargs_keys": list(kwargs.keys())
             }
-            
-            try:
-                self.redis_client.setex(
-                    cache_key,
+        }
+        try:
+            await self._store(
+                keys=[f"{self.key_prefix}{idempotency_key}", self.index_key, self.stats_key, lock_key or ""],
+                args=[
+                    idempotency_key,
                     ttl,
-                    json.dumps(cache_data, default=str)
-                )
-                logger.info(f"Cached result for idempotency key: {idempotency_key}")
-            except Exception as e:
-                logger.error(f"Error caching result for key {idempotency_key}: {e}")
-                # Don't fail the operation just because caching failed
-            
-            return IdempotencyResult(
-                result=result,
-                created_at=datetime.now(),
-                is_cached=False,
-                metadata=cache_data["metadata"]
+                    codec.dumps(cache_data),
+                    int(time.time()),
+                    _operation_name(idempotency_key),
+                    token or "",
+                ]
             )
-            
+            logger.info(f"Cached result for idempotency key: {idempotency_key}")
         except Exception as e:
-            logger.error(f"Operation failed for idempotency key {idempotency_key}: {e}")
-            raise
+            logger.error(f"Error caching result for key {idempotency_key}: {e}")
+            # Don't fail the operation just because caching failed
+            if lock_key:
+                await self._release_lease(lock_key, token)
+        
+        return IdempotencyResult(
+            result=result,
+            created_at=datetime.now(),
+            is_cached=False,
+            metadata=cache_data["metadata"]
+        )
     
-    def invalidate(self, idempotency_key: str) -> bool:
+    async def _renew_lease(self, lock_key: str, token: str) -> None:
+        """Extend the in-progress lease while the operation runs"""
+        interval = self.lock_lease / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await self._extend(keys=[lock_key], args=[token, int(self.lock_lease * 1000)]):
+                    logger.warning(f"In-progress lease lost for {lock_key}")
+                    return
+            except Exception as e:
+                logger.warning(f"Error renewing in-progress lease {lock_key}: {e}")
+    
+    async def _release_lease(self, lock_key: str, token: str) -> None:
+        try:
+            await self._release(keys=[lock_key], args=[token])
+        except Exception as e:
+            logger.warning(f"Error releasing in-progress lease {lock_key}: {e}")
+    
+    async def invalidate(self, idempotency_key: str) -> bool:
         """
         Invalidate cached result for an idempotency key
         
@@ -196,7 +434,9 @@ class IdempotencyManager:
         """
         cache_key = f"{self.key_prefix}{idempotency_key}"
         try:
-            result = self.redis_client.delete(cache_key)
+            result = await self._invalidate(
+                keys=[cache_key, self.index_key, self.stats_key], args=[idempotency_key]
+            )
             if result:
                 logger.info(f"Invalidated idempotency cache for key: {idempotency_key}")
             return bool(result)
@@ -204,24 +444,43 @@ class IdempotencyManager:
             logger.error(f"Error invalidating cache for key {idempotency_key}: {e}")
             return False
     
-    def get_stats(self) -> Dict[str, Any]:
-        """Get statistics about idempotency cache"""
+    async def get_stats(self) -> Dict[str, Any]:
+        """
+        Get statistics about idempotency cache in O(1): counters from the stats
+        hash, entry count from the index and a bounded sample of the keys that
+        expire last (the most recently cached ones)
+        """
         try:
-            pattern = f"{self.key_prefix}*"
-            keys = list(self.redis_client.scan_iter(match=pattern))
+            total, sample, raw_counters = await self._stats(
+                keys=[self.index_key, self.stats_key],
+                args=[int(time.time()), self.stats_sample_size]
+            )
             
-            stats = {
-                "total_cached_operations": len(keys),
+            counters: Dict[str, int] = {}
+            per_operation: Dict[str, Dict[str, int]] = {}
+            for field, value in zip(raw_counters[::2], raw_counters[1::2]):
+                field, value = _text(field), int(value)
+                if ":" in field:
+                    counter, operation = field.split(":", 1)
+                    per_operation.setdefault(operation, {})[counter] = value
+                else:
+                    counters[field] = value
+            
+            hits = counters.get("hits", 0)
+            misses = counters.get("misses", 0)
+            return {
+                "total_cached_operations": int(total),
                 "cache_prefix": self.key_prefix,
-                "default_ttl": self.default_ttl
+                "default_ttl": self.default_ttl,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+                "stored": counters.get("stored", 0),
+                "expired": counters.get("expired", 0),
+                "invalidated": counters.get("invalidated", 0),
+                "operations": per_operation,
+                "sample_keys": [_text(key) for key in sample],
             }
-            
-            # Get some sample keys for debugging
-            if keys:
-                sample_keys = keys[:5]  # First 5 keys
-                stats["sample_keys"] = [key.decode('utf-8') for key in sample_keys]
-            
-            return stats
         except Exception as e:
             logger.error(f"Error getting idempotency stats: {e}")
             return {"error": str(e)}
@@ -230,7 +489,7 @@ class IdempotencyManager:
 class InscriptionIdempotency:
     """Specific idempotency implementation for inscription operations"""
     
-    def __init__(self, redis_client: redis.Redis):
+    def __init__(self, redis_client: aioredis.Redis):
         self.manager = IdempotencyManager(redis_client, default_ttl=7200)  # 2 hours
     
     def generate_inscription_key(
@@ -323,19 +582,19 @@ _idempotency_manager: Optional[IdempotencyManager] = None
 _inscription_idempotency: Optional[InscriptionIdempotency] = None
 
 
-def get_idempotency_manager(redis_client: redis.Redis) -> IdempotencyManager:
-    """Get or create global idempotency manager"""
+def get_idempotency_manager(redis_client: Optional[aioredis.Redis] = None) -> IdempotencyManager:
+    """Get or create global idempotency manager (defaults to the shared async pool)"""
     global _idempotency_manager
     if _idempotency_manager is None:
-        _idempotency_manager = IdempotencyManager(redis_client)
+        _idempotency_manager = IdempotencyManager(redis_client or get_async_redis())
     return _idempotency_manager
 
 
-def get_inscription_idempotency(redis_client: redis.Redis) -> InscriptionIdempotency:
-    """Get or create global inscription idempotency manager"""
+def get_inscription_idempotency(redis_client: Optional[aioredis.Redis] = None) -> InscriptionIdempotency:
+    """Get or create global inscription idempotency manager (defaults to the shared async pool)"""
     global _inscription_idempotency
     if _inscription_idempotency is None:
-        _inscription_idempotency = InscriptionIdempotency(redis_client)
+        _inscription_idempotency = InscriptionIdempotency(redis_client or get_async_redis())
     return _inscription_idempotency
 
 
@@ -371,9 +630,7 @@ def idempotent_operation(
                 data=data
             )
             
-            # Get Redis client (this should be injected properly in production)
-            from app.routers.queue import redis_client
-            manager = get_idempotency_manager(redis_client)
+            manager = get_idempotency_manager()
             
             # Execute with idempotency
             return await manager.get_or_execute(
@@ -2,13 +2,19 @@
 Configuración centralizada de logging para el microservicio de registro académico.
 """
 
+import atexit
+import copy
 import logging
 import logging.config
 import os
+import queue
 import sys
+import threading
+from abc import ABC, abstractmethod
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional
 
 
 class ColoredFormatter(logging.Formatter):
@@ -57,11 +63,237 @@ class RequestFormatter(logging.Formatter):
         return super().format(record)
 
 
+class LazyMessage(ABC):
+    """
+    Mensaje cuyo texto se arma recién en el hilo escritor (p. ej. JSON
+    estructurado). Debe capturar en el constructor todo lo que dependa del
+    contexto de la llamada.
+    """
+
+    @abstractmethod
+    def __str__(self) -> str:
+        ...
+
+
+_PRIMITIVE_TYPES = (str, int, float, bool, type(None), bytes)
+_exception_formatter = logging.Formatter()
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Encola registros en una cola acotada hacia el hilo escritor.
+
+    Cada handler lleva los handlers reales de su logger (`targets`) para que un
+    único listener los despache. Si la cola está llena:
+    - "drop_new": se descarta el registro nuevo
+    - "drop_old": se descarta el más antiguo de la cola
+    - "block": se espera hasta `block_timeout` segundos
+    Con "drop_new"/"drop_old" nunca se bloquea: un registro ERROR o superior
+    reemplaza al registro de menor nivel más antiguo de la cola.
+    """
+
+    def __init__(self, log_queue, targets: List[logging.Handler], pipeline: "LogPipeline"):
+        super().__init__(log_queue)
+        self.targets = tuple(targets)
+        self.pipeline = pipeline
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info:
+            # El traceback se formatea aquí: los frames no deben cruzar de hilo
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        # Formato perezoso solo si los argumentos no pueden mutar antes de escribirse
+        if record.args and not all(isinstance(a, _PRIMITIVE_TYPES) for a in (
+            record.args.values() if isinstance(record.args, dict) else record.args
+        )):
+            record.msg = record.getMessage()
+            record.args = None
+        elif not isinstance(record.msg, (str, LazyMessage)):
+            record.msg = str(record.msg)
+        record._log_targets = self.targets
+        return record
+
+    def enqueue(self, record):
+        self.pipeline.put(record)
+
+
+class RoutingQueueListener(QueueListener):
+    """Despacha cada registro a los handlers de su logger de origen"""
+
+    def handle(self, record):
+        record = self.prepare(record)
+        for handler in getattr(record, "_log_targets", self.handlers):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def enqueue_sentinel(self):
+        # Con la cola llena put_nowait fallaría y el hilo no terminaría
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    """Cola acotada + hilo escritor compartidos por todos los loggers del proceso"""
+
+    OVERFLOW_POLICIES = ("drop_new", "drop_old", "block")
+
+    def __init__(self, maxsize: int = 10000, overflow: str = "drop_new", block_timeout: float = 1.0):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Política de desborde inválida: {overflow}")
+        self.queue: "queue.Queue" = queue.Queue(maxsize=maxsize)
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.enqueued = 0
+        self.dropped = 0
+        self._counter_lock = threading.Lock()
+        self.listener = RoutingQueueListener(self.queue)
+
+    def put(self, record) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if not self._put_on_overflow(record):
+                with self._counter_lock:
+                    self.dropped += 1
+                return
+        with self._counter_lock:
+            self.enqueued += 1
+
+    def _put_on_overflow(self, record) -> bool:
+        # Solo "block" espera: los demás modos corren en el event loop de la API
+        if self.overflow == "block":
+            try:
+                self.queue.put(record, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                return False
+        if record.levelno >= logging.ERROR and self._replace_lower_level(record):
+            return True
+        if self.overflow == "drop_old":
+            try:
+                self.queue.get_nowait()
+                with self._counter_lock:
+                    self.dropped += 1
+                self.queue.put_nowait(record)
+                return True
+            except (queue.Empty, queue.Full):
+                return False
+        return False
+
+    def _replace_lower_level(self, record) -> bool:
+        """Cambiar el registro de nivel < ERROR más antiguo por `record` (sin esperar)"""
+        with self.queue.mutex:
+            pendientes = self.queue.queue
+            for i, anterior in enumerate(pendientes):
+                # El centinela del listener no es un registro y no se descarta
+                if getattr(anterior, "levelno", logging.CRITICAL) < logging.ERROR:
+                    del pendientes[i]
+                    pendientes.append(record)
+                    break
+            else:
+                return False
+        with self._counter_lock:
+            self.dropped += 1
+        return True
+
+    def handler_for(self, targets: Iterable[logging.Handler]) -> BoundedQueueHandler:
+        return BoundedQueueHandler(self.queue, list(targets), self)
+
+    def start(self) -> None:
+        if self.listener._thread is None:
+            self.listener.start()
+
+    def stop(self) -> None:
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def restart_after_fork(self) -> None:
+        # El hilo escritor no sobrevive a fork(): el hijo arranca uno propio
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.listener = RoutingQueueListener(self.queue)
+        for handler in _pipeline_queue_handlers:
+            handler.queue = self.queue
+        self.start()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "overflow_policy": self.overflow,
+        }
+
+
+_pipeline: Optional[LogPipeline] = None
+_pipeline_queue_handlers: List[BoundedQueueHandler] = []
+
+
+def get_log_pipeline() -> Optional[LogPipeline]:
+    """Pipeline de logging del proceso (None si los handlers escriben directo)"""
+    return _pipeline
+
+
+def _install_queue_pipeline(logger_names: Iterable[str], maxsize: int, overflow: str) -> None:
+    """
+    Reemplazar los handlers de cada logger configurado por un único
+    BoundedQueueHandler con sus handlers efectivos (propios + heredados por
+    propagación, sin duplicados) y cortar la propagación.
+    """
+    global _pipeline
+    if _pipeline is not None:
+        _pipeline.stop()
+        _pipeline_queue_handlers.clear()
+    _pipeline = LogPipeline(maxsize=maxsize, overflow=overflow)
+
+    routes = {}
+    for name in logger_names:
+        lg = logging.getLogger(name or None)
+        targets: List[logging.Handler] = []
+        current = lg
+        while current is not None:
+            for handler in current.handlers:
+                if handler not in targets:
+                    targets.append(handler)
+            if not current.propagate:
+                break
+            current = current.parent
+        routes[lg] = targets
+
+    for lg, targets in routes.items():
+        handler = _pipeline.handler_for(targets)
+        _pipeline_queue_handlers.append(handler)
+        lg.handlers = [handler]
+        if lg is not logging.getLogger():
+            lg.propagate = False
+
+    _pipeline.start()
+
+
+def _stop_pipeline() -> None:
+    if _pipeline is not None:
+        _pipeline.stop()
+
+
+def _restart_pipeline_in_child() -> None:
+    if _pipeline is not None:
+        _pipeline.restart_after_fork()
+
+
+atexit.register(_stop_pipeline)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_pipeline_in_child)
+
+
 def setup_logging(
     log_level: str = "INFO",
     log_dir: str = "logs",
     console_output: bool = True,
-    file_output: bool = True
+    file_output: bool = True,
+    queue_enabled: bool = True,
+    queue_size: int = 10000,
+    queue_overflow: str = "drop_new"
 ) -> None:
     """
     Configura el sistema de logging.
@@ -71,6 +303,9 @@ def setup_logging(
         log_dir: Directorio donde guardar los logs
         console_output: Si mostrar logs en consola
         file_output: Si guardar logs en archivo
+        queue_enabled: Escribir desde un hilo dedicado a través de una cola acotada
+        queue_size: Capacidad de la cola de registros
+        queue_overflow: Política con la cola llena ("drop_new", "drop_old", "block")
     """
     
     # Crear directorio de logs si no existe
@@ -236,6 +471,10 @@ def setup_logging(
     # Aplicar configuración
     logging.config.dictConfig(config)
     
+    # Los handlers reales pasan al hilo escritor; los loggers solo encolan
+    if queue_enabled:
+        _install_queue_pipeline(config['loggers'].keys(), queue_size, queue_overflow)
+    
     # Log inicial
     logger = logging.getLogger('app.config.logging')
     logger.info(f"Sistema de logging configurado - Nivel: {log_level}")
@@ -375,7 +614,12 @@ def configure_uvicorn_logging():
         handler.setFormatter(logging.Formatter(fmt))
         level = os.getenv('LOG_LEVEL', 'INFO').upper()
         uv_logger.setLevel(logging.getLevelName(level))
-        uv_logger.addHandler(handler)
+        if _pipeline is not None:
+            queue_handler = _pipeline.handler_for([handler])
+            _pipeline_queue_handlers.append(queue_handler)
+            uv_logger.addHandler(queue_handler)
+        else:
+            uv_logger.addHandler(handler)
         uv_logger.propagate = False
 
 
@@ -384,10 +628,16 @@ log_level = os.getenv('LOG_LEVEL', 'INFO').upper()
 log_dir = os.getenv('LOG_DIR', 'logs')
 console_output = os.getenv('LOG_CONSOLE', 'true').lower() == 'true'
 file_output = os.getenv('LOG_FILE', 'true').lower() == 'true'
+queue_enabled = os.getenv('LOG_QUEUE_ENABLED', 'true').lower() == 'true'
+queue_size = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+queue_overflow = os.getenv('LOG_QUEUE_OVERFLOW', 'drop_new').lower()
 
 setup_logging(
     log_level=log_level,
     log_dir=log_dir,
     console_output=console_output,
-    file_output=file_output
+    file_output=file_output,
+    queue_enabled=queue_enabled,
+    queue_size=queue_size,
+    queue_overflow=queue_overflow
 )
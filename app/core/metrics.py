@@ -0,0 +1,289 @@
+"""
+Métricas Prometheus del API.
+
+- HTTP: latencia por ruta (plantilla, no path real) y requests en curso, desde
+  `app.middleware.metrics_middleware.PrometheusMiddleware`.
+- Base de datos: duración de queries por operación (eventos de cursor del
+  engine) y estado del pool (leído de `PoolStats` en cada scrape).
+- Redis: duración de comandos y pipelines de los clientes instrumentados.
+- Circuit breakers: estado y fallos de ambos registros.
+- Celery: contadores, cuantiles y colas tomados del snapshot de
+  `app.services.queue_stats` (sin broadcasts en el scrape).
+- Logging: registros encolados y descartados por el pipeline de `app.core.logging`.
+
+Los valores de pool, circuit breakers y Celery se calculan solo al hacer scrape;
+en el camino de cada request solo se actualizan contadores e histogramas.
+"""
+import time
+from functools import wraps
+from typing import Any, Dict, Iterable, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Buckets en segundos pensados para un API con acceso a base de datos remota
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "Requests HTTP atendidos", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latencia de requests HTTP", ["method", "route"],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests HTTP en curso", ["method"]
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Duración de sentencias SQL", ["operation"],
+    buckets=FAST_BUCKETS + (2.5, 5.0, 10.0, 30.0)
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total", "Sentencias SQL con error", ["operation"]
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds", "Espera por una conexión del pool", buckets=FAST_BUCKETS
+)
+REDIS_LATENCY = Histogram(
+    "redis_command_duration_seconds", "Duración de comandos Redis", ["command"],
+    buckets=FAST_BUCKETS
+)
+
+_SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK"}
+_CIRCUIT_STATES = ("closed", "open", "half_open")
+
+
+def render_latest() -> Tuple[bytes, str]:
+    """Cuerpo y content-type de la exposición de métricas"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+# ----- base de datos -----
+
+def _sql_operation(statement: str) -> str:
+    head = statement.lstrip()[:10].split(None, 1)
+    operation = head[0].upper() if head else ""
+    return operation if operation in _SQL_OPERATIONS else "OTHER"
+
+
+def instrument_engine(engine) -> None:
+    """Medir cada sentencia del engine (async o sync) por operación"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("_metrics_query_start")
+        if starts:
+            DB_QUERY_LATENCY.labels(_sql_operation(statement)).observe(time.perf_counter() - starts.pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None:
+            starts = conn.info.get("_metrics_query_start")
+            if starts:
+                starts.pop()
+        DB_QUERY_ERRORS.labels(_sql_operation(exception_context.statement or "")).inc()
+
+
+class PoolCollector:
+    """Estado del pool leído de PoolStats en cada scrape"""
+
+    def __init__(self, engine, stats):
+        self.engine = engine
+        self.stats = stats
+
+    def collect(self) -> Iterable:
+        snapshot = self.stats.snapshot(self.engine)
+        for key in ("connects", "checkouts", "checkins", "invalidations"):
+            yield CounterMetricFamily(f"db_pool_{key}", f"Eventos {key} del pool", value=snapshot[key])
+        for key in ("size", "checked_out", "checked_in", "overflow"):
+            if key in snapshot:
+                yield GaugeMetricFamily(f"db_pool_{key}", f"Conexiones {key} del pool", value=snapshot[key])
+
+
+# ----- redis -----
+
+def _observe_redis(command: str, started: float) -> None:
+    REDIS_LATENCY.labels(command).observe(time.perf_counter() - started)
+
+
+def instrument_redis(client):
+    """Medir comandos y pipelines de un cliente redis (sync o asyncio); devuelve el cliente"""
+    if getattr(client, "_metrics_instrumented", False):
+        return client
+    is_async = client.__class__.__module__.startswith("redis.asyncio")
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    if is_async:
+        @wraps(execute_command)
+        async def timed_execute_command(*args, **options):
+            started = time.perf_counter()
+            try:
+                return await execute_command(*args, **options)
+            finally:
+                _observe_redis(str(args[0]).upper() if args else "UNKNOWN", started)
+    else:
+        @wraps(execute_command)
+        def timed_execute_command(*args, **options):
+            started = time.perf_counter()
+            try:
+                return execute_command(*args, **options)
+            finally:
+                _observe_redis(str(args[0]).upper() if args else "UNKNOWN", started)
+
+    @wraps(pipeline)
+    def timed_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+        if is_async:
+            async def timed_execute(*a, **kw):
+                started = time.perf_counter()
+                try:
+                    return await execute(*a, **kw)
+                finally:
+                    _observe_redis("PIPELINE", started)
+        else:
+            def timed_execute(*a, **kw):
+                started = time.perf_counter()
+                try:
+                    return execute(*a, **kw)
+                finally:
+                    _observe_redis("PIPELINE", started)
+        pipe.execute = timed_execute
+        return pipe
+
+    client.execute_command = timed_execute_command
+    client.pipeline = timed_pipeline
+    client._metrics_instrumented = True
+    return client
+
+
+# ----- circuit breakers -----
+
+class CircuitBreakerCollector:
+    """Estado de los circuit breakers (app.circuit_breaker y app.core.circuit_breaker)"""
+
+    def _all_stats(self) -> Dict[str, Dict[str, Any]]:
+        stats: Dict[str, Dict[str, Any]] = {}
+        try:
+            from app.circuit_breaker import circuit_breaker_registry
+            stats.update(circuit_breaker_registry.get_all_stats())
+        except Exception as e:
+            logger.debug(f"Circuit breakers de app.circuit_breaker no disponibles: {e}")
+        try:
+            from app.core.circuit_breaker import CircuitBreakerRegistry
+            stats.update(CircuitBreakerRegistry.get_all_stats())
+        except Exception as e:
+            logger.debug(f"Circuit breakers de app.core.circuit_breaker no disponibles: {e}")
+        return stats
+
+    def collect(self) -> Iterable:
+        state = GaugeMetricFamily(
+            "circuit_breaker_state", "Estado del circuit breaker (1 = estado actual)", labels=["name", "state"]
+        )
+        failures = GaugeMetricFamily(
+            "circuit_breaker_failures", "Fallos contados por el circuit breaker", labels=["name"]
+        )
+        for name, stats in self._all_stats().items():
+            for candidate in _CIRCUIT_STATES:
+                state.add_metric([name, candidate], 1.0 if stats.get("state") == candidate else 0.0)
+            failures.add_metric([name], stats.get("failure_count", 0))
+        yield state
+        yield failures
+
+
+# ----- celery -----
+
+class CeleryCollector:
+    """Métricas de Celery desde el último snapshot del colector de estadísticas"""
+
+    def collect(self) -> Iterable:
+        from app.services.queue_stats import get_queue_stats_collector
+        snapshot = get_queue_stats_collector().snapshot()
+
+        yield GaugeMetricFamily("celery_workers_online", "Workers que respondieron al inspect",
+                                value=snapshot["workers_online"])
+        yield GaugeMetricFamily("celery_active_tasks", "Tareas en ejecución", value=snapshot["active_tasks"])
+        yield GaugeMetricFamily("celery_pending_tasks", "Tareas reservadas o programadas",
+                                value=snapshot["pending_tasks"])
+        if snapshot["age_seconds"] is not None:
+            yield GaugeMetricFamily("celery_stats_age_seconds", "Antigüedad del snapshot de Celery",
+                                    value=snapshot["age_seconds"])
+
+        queue_length = GaugeMetricFamily("celery_queue_length", "Mensajes en la cola del broker", labels=["queue"])
+        for queue, length in snapshot["queue_lengths"].items():
+            queue_length.add_metric([queue], length)
+        yield queue_length
+
+        metrics = snapshot.get("task_metrics")
+        if not metrics:
+            return
+        tasks = CounterMetricFamily("celery_tasks", "Eventos de tareas", labels=["task", "queue", "event"])
+        runtime = GaugeMetricFamily("celery_task_runtime_quantile_seconds", "Cuantiles de duración de tareas",
+                                    labels=["task", "queue", "quantile"])
+        wait = GaugeMetricFamily("celery_task_queue_wait_quantile_seconds", "Cuantiles de espera en cola",
+                                 labels=["task", "queue", "quantile"])
+        for entry in metrics["tasks"]:
+            for event_name, n in entry["counters"].items():
+                if ":" not in event_name:
+                    tasks.add_metric([entry["task"], entry["queue"], event_name], n)
+            for family, key in ((runtime, "runtime"), (wait, "queue_wait")):
+                summary = entry.get(key)
+                if not summary:
+                    continue
+                for quantile, field in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+                    if summary[field] is not None:
+                        family.add_metric([entry["task"], entry["queue"], quantile], summary[field] / 1000)
+        yield tasks
+        yield runtime
+        yield wait
+
+        throughput = GaugeMetricFamily("celery_throughput_per_second", "Tareas terminadas por segundo",
+                                       labels=["queue"])
+        for queue, value in metrics["throughput_by_queue"].items():
+            throughput.add_metric([queue], value)
+        yield throughput
+
+
+class LogPipelineCollector:
+    """Registros encolados/descartados por el pipeline de logging"""
+
+    def collect(self) -> Iterable:
+        from app.core.logging import get_log_pipeline
+        pipeline = get_log_pipeline()
+        if pipeline is None:
+            return
+        stats = pipeline.stats()
+        yield CounterMetricFamily("log_records_enqueued", "Registros encolados hacia el hilo escritor",
+                                  value=stats["enqueued"])
+        yield CounterMetricFamily("log_records_dropped", "Registros descartados por cola llena",
+                                  value=stats["dropped"])
+        yield GaugeMetricFamily("log_queue_depth", "Registros pendientes en la cola de logging",
+                                value=stats["queued"])
+
+
+_collectors_registered = False
+
+
+def register_collectors(engine, pool_stats) -> None:
+    """Registrar los collectors calculados en el scrape (una vez por proceso)"""
+    global _collectors_registered
+    if _collectors_registered:
+        return
+    REGISTRY.register(PoolCollector(engine, pool_stats))
+    REGISTRY.register(CircuitBreakerCollector())
+    REGISTRY.register(CeleryCollector())
+    REGISTRY.register(LogPipelineCollector())
+    _collectors_registered = True
@@ -0,0 +1,67 @@
+"""
+Pool compartido de conexiones redis.asyncio para el proceso.
+
+Todo el código async que habla con `settings.REDIS_URL` (routers, idempotencia,
+sagas, cachés y ledgers) usa `get_async_redis()`: un único
+`redis.asyncio.ConnectionPool` por proceso, instrumentado para Prometheus, en
+lugar de un cliente (y pool) por módulo. En la API el pool se abre y se cierra
+en el lifespan de FastAPI; en los workers vive en el loop del runtime async.
+
+El cliente síncrono (`redis.Redis`) queda solo para código de workers de Celery
+que no corre en un event loop.
+"""
+import os
+from typing import Optional
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.metrics import instrument_redis
+
+logger = get_logger(__name__)
+
+_pool: Optional[aioredis.ConnectionPool] = None
+_client: Optional[aioredis.Redis] = None
+
+
+def get_async_redis() -> aioredis.Redis:
+    """Cliente redis.asyncio sobre el pool compartido del proceso"""
+    global _pool, _client
+    if _client is None:
+        _pool = aioredis.ConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            health_check_interval=30,
+        )
+        _client = instrument_redis(aioredis.Redis(connection_pool=_pool))
+    return _client
+
+
+async def init_async_redis() -> bool:
+    """Abrir el pool y verificar la conexión (no falla si Redis no responde)"""
+    try:
+        await get_async_redis().ping()
+        return True
+    except Exception as e:
+        logger.warning(f"Redis no disponible al iniciar: {e}")
+        return False
+
+
+def _reset_after_fork() -> None:
+    """El pool heredado está ligado al loop del padre: el hijo abre el suyo"""
+    global _pool, _client
+    _pool = None
+    _client = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+async def close_async_redis() -> None:
+    """Cerrar el pool compartido (shutdown de la API o del worker)"""
+    global _pool, _client
+    if _pool is not None:
+        await _pool.disconnect()
+    _pool = None
+    _client = None
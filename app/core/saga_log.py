@@ -0,0 +1,343 @@
+"""
+Durable saga log backed by Redis
+Records every saga and step transition so sagas survive the process that ran them
+
+Keys:
+- saga:log:<id>    stream, one entry per transition (append-only history)
+- saga:state:<id>  hash with the latest snapshot and the data needed to
+                   compensate completed steps (compensation name and kwargs)
+- saga:index       sorted set (all scores 0) of "<created_ms>:<id>" members,
+                   read with ZREVRANGEBYLEX for cluster-wide keyset pagination
+- saga:active      sorted set of unfinished sagas scored by last transition (ms)
+
+Finished sagas leave saga:active and their state/stream expire after the
+retention period. A saga whose last transition is older than the orphan
+timeout is assumed to belong to a dead worker: SagaRecoverySweeper claims it
+atomically and compensates its completed steps in reverse order using the
+compensation resolver registered for the saga kind. Compensations must be
+idempotent, since the interrupted step may or may not have been applied.
+"""
+import os
+import socket
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from app.core import codec
+from app.core.config import settings
+from app.core.logging import get_logger
+
+if TYPE_CHECKING:
+    from app.core.saga_pattern import SagaStep, SagaTransaction
+
+logger = get_logger(__name__)
+
+STATE_PREFIX = "saga:state:"
+STREAM_PREFIX = "saga:log:"
+INDEX_KEY = "saga:index"
+ACTIVE_KEY = "saga:active"
+
+TERMINAL_STATUSES = {"completed", "compensated", "failed", "aborted"}
+# Step states whose effects may exist and therefore need compensation
+COMPENSABLE_STEP_STATUSES = {"completed", "executing", "compensating"}
+
+# KEYS[1] = state hash, KEYS[2] = stream, KEYS[3] = index, KEYS[4] = active
+# ARGV: 1 id, 2 now_ms, 3 event, 4 status, 5 terminal (0/1), 6 snapshot,
+#       7 recovery, 8 index member, 9 owner, 10 kind, 11 step, 12 step status,
+#       13 retention seconds, 14 stream maxlen
+_RECORD_LUA = """
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[14], '*',
+    'event', ARGV[3], 'status', ARGV[4], 'step', ARGV[11], 'step_status', ARGV[12],
+    'owner', ARGV[9], 'ts', ARGV[2])
+redis.call('HSET', KEYS[1], 'status', ARGV[4], 'updated_at', ARGV[2], 'snapshot', ARGV[6],
+    'recovery', ARGV[7], 'owner', ARGV[9], 'kind', ARGV[10], 'index_member', ARGV[8])
+redis.call('ZADD', KEYS[3], 0, ARGV[8])
+if ARGV[5] == '1' then
+    redis.call('ZREM', KEYS[4], ARGV[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[13])
+    redis.call('EXPIRE', KEYS[2], ARGV[13])
+else
+    redis.call('ZADD', KEYS[4], ARGV[2], ARGV[1])
+    redis.call('PERSIST', KEYS[1])
+    redis.call('PERSIST', KEYS[2])
+end
+return 1
+"""
+
+# KEYS[1] = active; ARGV[1] = stale cutoff (ms), ARGV[2] = now (ms), ARGV[3] = limit.
+# Claiming bumps the score, so a crashed sweeper's claims become stale again.
+_CLAIM_LUA = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[3])
+for _, id in ipairs(ids) do
+    redis.call('ZADD', KEYS[1], ARGV[2], id)
+end
+return ids
+"""
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _text(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+def process_owner() -> str:
+    """Identifier of the process recording transitions (diagnostics only)"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def step_recovery_info(step: "SagaStep") -> Dict[str, Any]:
+    """What a recovery process needs to compensate a step without its callables"""
+    kwargs = dict(step.compensation_kwargs)
+    if step.result and step.result.compensation_data:
+        kwargs.update(step.result.compensation_data)
+    return {
+        "name": step.name,
+        "status": step.status.value,
+        "compensation": getattr(step.compensation, "__name__", None) if step.compensation else None,
+        "compensation_args": list(step.compensation_args),
+        "compensation_kwargs": kwargs,
+    }
+
+
+class SagaLog:
+    """Append-only saga transition log with per-saga state, shared by all processes"""
+
+    def __init__(
+        self,
+        redis_client: aioredis.Redis,
+        retention_seconds: int = 7 * 24 * 3600,
+        stream_maxlen: int = 1000
+    ):
+        self.redis_client = redis_client
+        self.retention_seconds = retention_seconds
+        self.stream_maxlen = stream_maxlen
+        self._record = redis_client.register_script(_RECORD_LUA)
+        self._claim = redis_client.register_script(_CLAIM_LUA)
+
+    async def record(self, saga: "SagaTransaction", event: str, step: Optional["SagaStep"] = None) -> None:
+        """Record a transition of a running saga; logging failures never fail the saga"""
+        await self.record_state(
+            transaction_id=saga.transaction_id,
+            created_ms=int(saga.created_at.timestamp() * 1000),
+            kind=saga.kind or "",
+            event=event,
+            status=saga.status.value,
+            snapshot=saga.get_status(),
+            recovery=[step_recovery_info(s) for s in saga.steps],
+            step_name=step.name if step else "",
+            step_status=step.status.value if step else "",
+        )
+
+    async def record_state(
+        self,
+        transaction_id: str,
+        created_ms: int,
+        kind: str,
+        event: str,
+        status: str,
+        snapshot: Dict[str, Any],
+        recovery: List[Dict[str, Any]],
+        step_name: str = "",
+        step_status: str = "",
+        owner: Optional[str] = None
+    ) -> None:
+        try:
+            await self._record(
+                keys=[STATE_PREFIX + transaction_id, STREAM_PREFIX + transaction_id, INDEX_KEY, ACTIVE_KEY],
+                args=[
+                    transaction_id,
+                    _now_ms(),
+                    event,
+                    status,
+                    "1" if status in TERMINAL_STATUSES else "0",
+                    codec.dumps(snapshot),
+                    codec.dumps(recovery),
+                    f"{created_ms:015d}:{transaction_id}",
+                    owner or process_owner(),
+                    kind,
+                    step_name,
+                    step_status,
+                    self.retention_seconds,
+                    self.stream_maxlen,
+                ]
+            )
+        except Exception as e:
+            logger.warning(f"Error recording saga {transaction_id} event '{event}': {e}")
+
+    async def load(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        """Latest state of a saga: snapshot, recovery info, kind, owner and update time"""
+        raw = await self.redis_client.hgetall(STATE_PREFIX + transaction_id)
+        if not raw:
+            return None
+        fields = {_text(k): v for k, v in raw.items()}
+        return {
+            "snapshot": codec.loads(fields["snapshot"]),
+            "recovery": codec.loads(fields["recovery"]),
+            "kind": _text(fields.get("kind", b"")),
+            "owner": _text(fields.get("owner", b"")),
+            "updated_at": int(fields.get("updated_at", 0)),
+            "index_member": _text(fields.get("index_member", b"")),
+        }
+
+    async def get_status(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        state = await self.load(transaction_id)
+        return state["snapshot"] if state else None
+
+    async def history(self, transaction_id: str, count: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Transitions recorded for a saga, oldest first"""
+        entries = await self.redis_client.xrange(STREAM_PREFIX + transaction_id, count=count)
+        return [
+            {"id": _text(entry_id), **{_text(k): _text(v) for k, v in fields.items()}}
+            for entry_id, fields in entries
+        ]
+
+    async def list(self, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Sagas of the whole cluster, newest first, keyset-paginated. The cursor
+        is the index member of the last saga of the previous page.
+        """
+        items: List[Dict[str, Any]] = []
+        upper = f"({cursor}" if cursor else "+"
+        while len(items) < limit:
+            members = await self.redis_client.zrevrangebylex(INDEX_KEY, upper, "-", start=0, num=limit - len(items))
+            if not members:
+                return items, None
+            members = [_text(m) for m in members]
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for member in members:
+                    pipe.hget(STATE_PREFIX + member.split(":", 1)[1], "snapshot")
+                snapshots = await pipe.execute()
+            expired = [m for m, s in zip(members, snapshots) if s is None]
+            if expired:
+                # State already past retention: drop it from the index
+                await self.redis_client.zrem(INDEX_KEY, *expired)
+            items.extend(codec.loads(s) for s in snapshots if s is not None)
+            upper = f"({members[-1]}"
+        return items, upper[1:]
+
+    async def count(self) -> Dict[str, int]:
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.zcard(INDEX_KEY)
+            pipe.zcard(ACTIVE_KEY)
+            total, active = await pipe.execute()
+        return {"total": int(total), "active": int(active)}
+
+    async def claim_orphans(self, orphan_timeout: float, limit: int = 100) -> List[str]:
+        """Atomically claim unfinished sagas without transitions for orphan_timeout seconds"""
+        now = _now_ms()
+        ids = await self._claim(keys=[ACTIVE_KEY], args=[now - int(orphan_timeout * 1000), now, limit])
+        return [_text(i) for i in ids]
+
+
+# Compensation resolvers by saga kind: factory(db_session) -> object whose
+# methods are the compensations named in the log
+_resolvers: Dict[str, Callable[[Any], Any]] = {}
+
+
+def register_saga_resolver(kind: str, factory: Callable[[Any], Any]) -> None:
+    """Register how to rebuild the compensation target for sagas of a kind"""
+    _resolvers[kind] = factory
+
+
+class SagaRecoverySweeper:
+    """Compensates sagas orphaned by crashed workers"""
+
+    def __init__(
+        self,
+        log: SagaLog,
+        session_factory,
+        orphan_timeout: float = 900.0,
+        resolvers: Optional[Dict[str, Callable[[Any], Any]]] = None
+    ):
+        self.log = log
+        self.session_factory = session_factory
+        self.orphan_timeout = orphan_timeout
+        self.resolvers = resolvers if resolvers is not None else _resolvers
+
+    async def run(self, limit: int = 100) -> Dict[str, int]:
+        """Claim and compensate orphaned sagas; returns counts per outcome"""
+        outcome = {"claimed": 0, "compensated": 0, "aborted": 0, "failed": 0}
+        for transaction_id in await self.log.claim_orphans(self.orphan_timeout, limit):
+            outcome["claimed"] += 1
+            try:
+                result = await self._recover(transaction_id)
+            except Exception as e:
+                logger.error(f"Saga recovery failed for {transaction_id}: {e}")
+                result = "failed"
+            outcome[result] += 1
+        if outcome["claimed"]:
+            logger.info(f"Saga recovery: {outcome}")
+        return outcome
+
+    async def _recover(self, transaction_id: str) -> str:
+        state = await self.log.load(transaction_id)
+        if state is None:
+            # State expired or never written: just forget the active marker
+            await self.log.redis_client.zrem(ACTIVE_KEY, transaction_id)
+            return "aborted"
+
+        snapshot, recovery = state["snapshot"], state["recovery"]
+        created_ms = int(state["index_member"].split(":", 1)[0] or 0)
+        owner = f"recovery:{process_owner()}"
+        pending = [s for s in reversed(recovery) if s["status"] in COMPENSABLE_STEP_STATUSES]
+
+        async def record(event: str, status: str, step: Optional[Dict[str, Any]] = None) -> None:
+            snapshot["status"] = status
+            if step is not None:
+                for snap_step in snapshot.get("steps", []):
+                    if snap_step["name"] == step["name"]:
+                        snap_step["status"] = step["status"]
+            await self.log.record_state(
+                transaction_id, created_ms, state["kind"], event, status, snapshot, recovery,
+                step_name=step["name"] if step else "", step_status=step["status"] if step else "",
+                owner=owner
+            )
+
+        if not pending:
+            snapshot["error"] = "Recovered after worker crash: no steps to compensate"
+            await record("recovery_aborted", "aborted")
+            return "aborted"
+
+        factory = self.resolvers.get(state["kind"])
+        if factory is None:
+            snapshot["error"] = f"Recovered after worker crash: no compensation resolver for kind '{state['kind']}'"
+            await record("recovery_failed", "failed")
+            return "failed"
+
+        await record("recovery_started", "compensating")
+        failed = False
+        async with self.session_factory() as db:
+            target = factory(db)
+            for step in pending:
+                if not step["compensation"]:
+                    continue
+                try:
+                    compensation = getattr(target, step["compensation"])
+                    await compensation(*step["compensation_args"], **step["compensation_kwargs"])
+                    step["status"] = "compensated"
+                    await record("step_compensated", "compensating", step)
+                except Exception as e:
+                    failed = True
+                    logger.error(f"Recovery compensation '{step['name']}' failed for saga {transaction_id}: {e}")
+                    await record("step_compensation_failed", "compensating", step)
+            if failed:
+                await db.rollback()
+            else:
+                await db.commit()
+
+        snapshot["error"] = "Recovered after worker crash" + (" (some compensations failed)" if failed else "")
+        status = "failed" if failed else "compensated"
+        await record("recovery_finished", status)
+        return status
+
+
+def saga_log_from_settings(redis_client: aioredis.Redis) -> SagaLog:
+    return SagaLog(
+        redis_client,
+        retention_seconds=settings.SAGA_LOG_RETENTION_SECONDS,
+        stream_maxlen=settings.SAGA_LOG_STREAM_MAXLEN,
+    )
@@ -8,10 +8,19 @@ import uuid
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Callable, Union
-import json
+from typing import Any, Dict, List, Optional, Callable, Tuple, Union
 import logging
 
+from app.core.config import settings
+from app.core.redis_client import get_async_redis
+from app.core.saga_log import (
+    TERMINAL_STATUSES,
+    SagaLog,
+    SagaRecoverySweeper,
+    register_saga_resolver,
+    saga_log_from_settings,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -67,9 +76,17 @@ class SagaTransaction:
     Manages execution of steps and compensation in case of failures
     """
     
-    def __init__(self, transaction_id: Optional[str] = None, name: Optional[str] = None):
+    def __init__(
+        self,
+        transaction_id: Optional[str] = None,
+        name: Optional[str] = None,
+        kind: Optional[str] = None,
+        log: Optional[SagaLog] = None
+    ):
         self.transaction_id = transaction_id or str(uuid.uuid4())
         self.name = name or f"saga_{self.transaction_id[:8]}"
+        self.kind = kind  # Selects the compensation resolver used by crash recovery
+        self.log = log  # Durable transition log (set by SagaManager.register_saga)
         self.steps: List[SagaStep] = []
         self.status = SagaStatus.STARTED
         self.created_at = datetime.now()
@@ -103,6 +120,11 @@ class SagaTransaction:
         self.steps.append(step)
         return self
     
+    async def _record(self, event: str, step: Optional[SagaStep] = None):
+        """Append a transition to the durable log, if any"""
+        if self.log is not None:
+            await self.log.record(self, event, step)
+    
     async def execute(self) -> bool:
         """
         Execute all saga steps
@@ -110,6 +132,7 @@ class SagaTransaction:
         """
         self.status = SagaStatus.EXECUTING
         self.started_at = datetime.now()
+        await self._record("saga_started")
         
         logger.info(f"Starting saga transaction '{self.name}' ({self.transaction_id})")
         
@@ -123,24 +146,30 @@ class SagaTransaction:
                     logger.error(f"Step '{step.name}' failed, initiating compensation")
                     await self._compensate_completed_steps()
                     self.status = SagaStatus.COMPENSATED
+                    self.completed_at = datetime.now()
+                    await self._record("saga_compensated")
                     return False
             
             # All steps completed successfully
             self.status = SagaStatus.COMPLETED
             self.completed_at = datetime.now()
+            await self._record("saga_completed")
             logger.info(f"Saga transaction '{self.name}' completed successfully")
             return True
             
         except Exception as e:
             logger.error(f"Saga transaction '{self.name}' failed with exception: {e}")
             self.error = str(e)
-            self.status = SagaStatus.FAILED
             await self._compensate_completed_steps()
+            self.status = SagaStatus.FAILED
+            self.completed_at = datetime.now()
+            await self._record("saga_failed")
             return False
     
     async def _execute_step(self, step: SagaStep) -> bool:
         """Execute a single saga step with retry logic"""
         step.status = SagaStepStatus.EXECUTING
+        await self._record("step_executing", step)
         
         for attempt in range(step.max_retries + 1):
             try:
@@ -152,14 +181,19 @@ class SagaTransaction:
                 else:
                     result = step.action(*step.action_args, **step.action_kwargs)
                 
-                # Store result
+                # Store result (compensation data may come as attribute or dict key)
+                if isinstance(result, dict):
+                    compensation_data = result.get('compensation_data')
+                else:
+                    compensation_data = getattr(result, 'compensation_data', None)
                 step.result = SagaStepResult(
                     success=True,
                     data=result,
-                    compensation_data=getattr(result, 'compensation_data', None) if hasattr(result, 'compensation_data') else None
+                    compensation_data=compensation_data
                 )
                 step.status = SagaStepStatus.COMPLETED
                 step.executed_at = datetime.now()
+                await self._record("step_completed", step)
                 
                 logger.debug(f"Step '{step.name}' completed successfully on attempt {attempt + 1}")
                 return True
@@ -174,6 +208,7 @@ class SagaTransaction:
                         error=str(e)
                     )
                     step.status = SagaStepStatus.FAILED
+                    await self._record("step_failed", step)
                     return False
                 
                 # Wait before retry (exponential backoff)
@@ -184,6 +219,7 @@ class SagaTransaction:
     async def _compensate_completed_steps(self):
         """Compensate all completed steps in reverse order"""
         self.status = SagaStatus.COMPENSATING
+        await self._record("saga_compensating")
         logger.info(f"Compensating saga transaction '{self.name}'")
         
         # Compensate in reverse order
@@ -213,10 +249,12 @@ class SagaTransaction:
             
             step.status = SagaStepStatus.COMPENSATED
             step.compensated_at = datetime.now()
+            await self._record("step_compensated", step)
             logger.info(f"Step '{step.name}' compensated successfully")
             
         except Exception as e:
             logger.error(f"Compensation failed for step '{step.name}': {e}")
+            await self._record("step_compensation_failed", step)
             # Continue with other compensations even if one fails
     
     def get_status(self) -> Dict[str, Any]:
@@ -267,7 +305,7 @@ class InscriptionSagaOrchestrator:
         """
         Create a saga for multi-group inscription with proper rollback
         """
-        saga = SagaTransaction(name=f"inscription_{inscription_data['registro_academico']}")
+        saga = SagaTransaction(name=f"inscription_{inscription_data['registro_academico']}", kind="inscription")
         
         # Step 1: Validate student and period
         saga.add_step(
@@ -325,6 +363,8 @@ class InscriptionSagaOrchestrator:
             max_retries=1  # Don't retry too much for non-critical operations
         )
         
+        # Register before execution so every transition reaches the durable log
+        await get_saga_manager().register_saga(saga)
         return saga
     
     async def create_single_group_addition_saga(
@@ -335,7 +375,9 @@ class InscriptionSagaOrchestrator:
         """
         Create a saga for adding a single group to existing inscription
         """
-        saga = SagaTransaction(name=f"add_group_{grupo}_to_{inscription_data['registro_academico']}")
+        saga = SagaTransaction(
+            name=f"add_group_{grupo}_to_{inscription_data['registro_academico']}", kind="inscription"
+        )
         
         # Step 1: Validate group availability
         saga.add_step(
@@ -377,6 +419,7 @@ class InscriptionSagaOrchestrator:
             action_kwargs={"grupo": grupo}
         )
         
+        await get_saga_manager().register_saga(saga)
         return saga
     
     # Saga step implementations
@@ -396,7 +439,7 @@ class InscriptionSagaOrchestrator:
                 # Lock grupo in Redis with TTL
                 if self.redis_client:
                     lock_key = f"grupo_lock:{grupo}"
-                    lock_acquired = self.redis_client.set(lock_key, "locked", ex=300, nx=True)
+                    lock_acquired = await self.redis_client.set(lock_key, "locked", ex=300, nx=True)
                     if not lock_acquired:
                         raise Exception(f"Could not acquire lock for grupo {grupo}")
                     reserved_grupos.append(grupo)
@@ -412,7 +455,7 @@ class InscriptionSagaOrchestrator:
         for grupo in grupos:
             if self.redis_client:
                 lock_key = f"grupo_lock:{grupo}"
-                self.redis_client.delete(lock_key)
+                await self.redis_client.delete(lock_key)
     
     async def _reserve_single_group(self, grupo: str) -> Dict[str, Any]:
         """Reserve a single group"""
@@ -488,47 +531,66 @@ class InscriptionSagaOrchestrator:
         return {"notification_sent": True}
 
 
+# Crash recovery rebuilds the orchestrator with a fresh session and calls the
+# compensation methods recorded in the saga log by name
+register_saga_resolver("inscription", lambda db: InscriptionSagaOrchestrator(db, get_async_redis()))
+
+
 # Utility functions for saga management
 class SagaManager:
-    """Global saga manager for tracking and managing saga transactions"""
+    """
+    Global saga manager for tracking and managing saga transactions.
+    Statuses come from the durable saga log (all processes); active_sagas only
+    holds the sagas running in this process.
+    """
     
     def __init__(self, redis_client=None):
         self.redis_client = redis_client
+        self.log: Optional[SagaLog] = saga_log_from_settings(redis_client) if redis_client else None
         self.active_sagas: Dict[str, SagaTransaction] = {}
     
-    def register_saga(self, saga: SagaTransaction):
-        """Register a saga for tracking"""
+    async def register_saga(self, saga: SagaTransaction):
+        """Register a saga for tracking and attach it to the durable log"""
         self.active_sagas[saga.transaction_id] = saga
-        
-        # Store in Redis for persistence
-        if self.redis_client:
-            saga_data = saga.get_status()
-            self.redis_client.setex(
-                f"saga:{saga.transaction_id}",
-                3600,  # 1 hour TTL
-                json.dumps(saga_data, default=str)
-            )
+        if self.log is not None:
+            saga.log = self.log
+            await self.log.record(saga, "saga_registered")
     
     def get_saga(self, transaction_id: str) -> Optional[SagaTransaction]:
-        """Get saga by transaction ID"""
+        """Get a saga running in this process by transaction ID"""
         return self.active_sagas.get(transaction_id)
     
-    def get_all_sagas_status(self) -> List[Dict[str, Any]]:
-        """Get status of all active sagas"""
-        return [saga.get_status() for saga in self.active_sagas.values()]
+    async def get_saga_status(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        """Status of any saga in the cluster"""
+        if self.log is not None:
+            return await self.log.get_status(transaction_id)
+        saga = self.active_sagas.get(transaction_id)
+        return saga.get_status() if saga else None
+    
+    async def get_all_sagas_status(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Statuses of all sagas in the cluster, newest first; returns (page, next_cursor)"""
+        if self.log is not None:
+            return await self.log.list(limit=limit, cursor=cursor)
+        statuses = [saga.get_status() for saga in self.active_sagas.values()]
+        return statuses[:limit], None
+    
+    async def count_sagas(self) -> Dict[str, int]:
+        """Total and unfinished sagas in the cluster"""
+        if self.log is not None:
+            return await self.log.count()
+        active = sum(1 for saga in self.active_sagas.values() if saga.status.value not in TERMINAL_STATUSES)
+        return {"total": len(self.active_sagas), "active": active}
     
     async def cleanup_completed_sagas(self):
-        """Clean up completed or failed sagas"""
-        to_remove = []
-        for transaction_id, saga in self.active_sagas.items():
-            if saga.status in [SagaStatus.COMPLETED, SagaStatus.COMPENSATED, SagaStatus.FAILED]:
-                to_remove.append(transaction_id)
-        
+        """Forget finished sagas of this process (their log entries expire on their own)"""
+        to_remove = [
+            transaction_id for transaction_id, saga in self.active_sagas.items()
+            if saga.status.value in TERMINAL_STATUSES
+        ]
         for transaction_id in to_remove:
             del self.active_sagas[transaction_id]
-            # Also clean up from Redis
-            if self.redis_client:
-                self.redis_client.delete(f"saga:{transaction_id}")
 
 
 # Global saga manager instance
@@ -536,8 +598,18 @@ _saga_manager: Optional[SagaManager] = None
 
 
 def get_saga_manager(redis_client=None) -> SagaManager:
-    """Get or create global saga manager"""
+    """Get or create global saga manager (defaults to the shared async pool)"""
     global _saga_manager
     if _saga_manager is None:
-        _saga_manager = SagaManager(redis_client)
-    return _saga_manager
\ No newline at end of file
+        _saga_manager = SagaManager(redis_client if redis_client is not None else get_async_redis())
+    return _saga_manager
+
+
+async def recover_orphaned_sagas(session_factory, limit: int = 100) -> Dict[str, int]:
+    """Compensate sagas left unfinished by crashed workers (run on worker start)"""
+    sweeper = SagaRecoverySweeper(
+        get_saga_manager().log,
+        session_factory,
+        orphan_timeout=settings.SAGA_ORPHAN_TIMEOUT
+    )
+    return await sweeper.run(limit=limit)
@@ -0,0 +1,337 @@
+"""
+Instrumentación de tareas Celery a partir de señales.
+
+Cada proceso agrega en memoria contadores e histogramas de latencia por
+(tarea, cola) y un hilo los vuelca a Redis cada TASK_METRICS_FLUSH_INTERVAL con
+un pipeline de HINCRBY. Los endpoints leen los hashes ya agregados.
+
+Claves en Redis:
+- `task_metrics:counters`        `<tarea>|<cola>|<evento>` -> n
+  (eventos: started, succeeded, failed, retried, failed:<excepción>)
+- `task_metrics:runtime`         `<tarea>|<cola>|b<i>` / `...|sum` -> histograma en ms
+- `task_metrics:wait`            igual, tiempo en cola (publicación -> inicio)
+- `task_metrics:done:<segundo>`  `<cola>` -> tareas terminadas (TTL corto, para throughput)
+- `completed_tasks` / `failed_tasks`: totales que ya leía /queue/stats
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from celery.signals import (
+    before_task_publish,
+    task_failure,
+    task_postrun,
+    task_prerun,
+    task_retry,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+COUNTERS_KEY = "task_metrics:counters"
+RUNTIME_KEY = "task_metrics:runtime"
+WAIT_KEY = "task_metrics:wait"
+DONE_KEY_PREFIX = "task_metrics:done:"
+DONE_KEY_TTL = 300
+PUBLISHED_AT_HEADER = "published_at"
+
+# Límites superiores de los buckets en milisegundos (el último es +inf)
+BUCKETS_MS: Tuple[float, ...] = (
+    5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000, float("inf")
+)
+
+
+def bucket_index(value_ms: float) -> int:
+    for i, limit in enumerate(BUCKETS_MS):
+        if value_ms <= limit:
+            return i
+    return len(BUCKETS_MS) - 1
+
+
+def percentile_from_buckets(counts: List[int], q: float) -> Optional[float]:
+    """Percentil aproximado (interpolación lineal dentro del bucket)"""
+    total = sum(counts)
+    if total == 0:
+        return None
+    objetivo = q * total
+    acumulado = 0
+    for i, n in enumerate(counts):
+        if n and acumulado + n >= objetivo:
+            inferior = BUCKETS_MS[i - 1] if i > 0 else 0.0
+            superior = BUCKETS_MS[i]
+            if superior == float("inf"):
+                return inferior
+            return round(inferior + (superior - inferior) * (objetivo - acumulado) / n, 2)
+        acumulado += n
+    return BUCKETS_MS[-2]
+
+
+class TaskMetricsRecorder:
+    """Agregación en proceso + volcado periódico a Redis"""
+
+    def __init__(self, redis_url: str, flush_interval: float = 1.0):
+        self.redis_url = redis_url
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._started: Dict[str, Tuple[float, str]] = {}
+        self._reset()
+        self._redis = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _reset(self) -> None:
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._runtime: Dict[str, int] = defaultdict(int)
+        self._wait: Dict[str, int] = defaultdict(int)
+        self._done: Dict[str, int] = defaultdict(int)
+        self._completed = 0
+        self._failed = 0
+
+    # ----- registro (llamado desde las señales) -----
+
+    @staticmethod
+    def _observe(histogram: Dict[str, int], serie: str, value_ms: float) -> None:
+        histogram[f"{serie}|b{bucket_index(value_ms)}"] += 1
+        histogram[f"{serie}|sum"] += int(value_ms)
+
+    def task_started(self, task_id: str, task_name: str, queue: str, published_at: Optional[float]) -> None:
+        now = time.time()
+        serie = f"{task_name}|{queue}"
+        with self._lock:
+            self._started[task_id] = (time.monotonic(), serie)
+            self._counters[f"{serie}|started"] += 1
+            if published_at:
+                self._observe(self._wait, serie, max(0.0, (now - published_at) * 1000))
+        self._ensure_flusher()
+
+    def task_finished(self, task_id: str, state: Optional[str]) -> None:
+        with self._lock:
+            entry = self._started.pop(task_id, None)
+            if entry is None:
+                return
+            started, serie = entry
+            self._observe(self._runtime, serie, (time.monotonic() - started) * 1000)
+            if state == "SUCCESS":
+                self._counters[f"{serie}|succeeded"] += 1
+                self._completed += 1
+            if state in ("SUCCESS", "FAILURE"):
+                self._done[serie.rsplit("|", 1)[1]] += 1
+
+    def task_failed(self, task_name: str, queue: str, exc_type: str) -> None:
+        serie = f"{task_name}|{queue}"
+        with self._lock:
+            self._counters[f"{serie}|failed"] += 1
+            self._counters[f"{serie}|failed:{exc_type}"] += 1
+            self._failed += 1
+
+    def task_retried(self, task_name: str, queue: str) -> None:
+        with self._lock:
+            self._counters[f"{task_name}|{queue}|retried"] += 1
+
+    # ----- volcado -----
+
+    def _get_redis(self):
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def flush(self) -> None:
+        """Volcar lo acumulado con un solo pipeline; si falla se reintegra"""
+        with self._lock:
+            counters, runtime, wait, done = self._counters, self._runtime, self._wait, self._done
+            completed, failed = self._completed, self._failed
+            self._reset()
+        if not (counters or runtime or wait or done or completed or failed):
+            return
+
+        try:
+            pipe = self._get_redis().pipeline(transaction=False)
+            for key, data in ((COUNTERS_KEY, counters), (RUNTIME_KEY, runtime), (WAIT_KEY, wait)):
+                for field, n in data.items():
+                    pipe.hincrby(key, field, n)
+            if done:
+                done_key = f"{DONE_KEY_PREFIX}{int(time.time())}"
+                for queue, n in done.items():
+                    pipe.hincrby(done_key, queue, n)
+                pipe.expire(done_key, DONE_KEY_TTL)
+            if completed:
+                pipe.incrby("completed_tasks", completed)
+            if failed:
+                pipe.incrby("failed_tasks", failed)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"No se pudieron volcar métricas de tareas: {e}")
+            with self._lock:
+                for target, data in ((self._counters, counters), (self._runtime, runtime),
+                                     (self._wait, wait), (self._done, done)):
+                    for field, n in data.items():
+                        target[field] += n
+                self._completed += completed
+                self._failed += failed
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _ensure_flusher(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="task-metrics-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval * 2)
+            self._thread = None
+        self.flush()
+
+
+task_metrics = TaskMetricsRecorder(
+    redis_url=settings.REDIS_URL,
+    flush_interval=settings.TASK_METRICS_FLUSH_INTERVAL,
+)
+
+
+def get_task_metrics() -> TaskMetricsRecorder:
+    """Obtener el registrador de métricas del proceso actual"""
+    return task_metrics
+
+
+# ----- lectura / resumen -----
+
+def _decode(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _histograms(raw: Mapping) -> Dict[str, Dict[str, Any]]:
+    series: Dict[str, Dict[str, Any]] = {}
+    for field, value in raw.items():
+        serie, _, part = _decode(field).rpartition("|")
+        entry = series.setdefault(serie, {"buckets": [0] * len(BUCKETS_MS), "sum": 0})
+        if part == "sum":
+            entry["sum"] += int(value)
+        elif part.startswith("b"):
+            entry["buckets"][int(part[1:])] += int(value)
+    return series
+
+
+def _latency_summary(buckets: List[int], total_ms: int) -> Dict[str, Any]:
+    count = sum(buckets)
+    return {
+        "count": count,
+        "avg_ms": round(total_ms / count, 2) if count else None,
+        "p50_ms": percentile_from_buckets(buckets, 0.50),
+        "p95_ms": percentile_from_buckets(buckets, 0.95),
+        "p99_ms": percentile_from_buckets(buckets, 0.99),
+    }
+
+
+def _merge(entries: Iterable[Dict[str, Any]]) -> Tuple[List[int], int]:
+    buckets, total = [0] * len(BUCKETS_MS), 0
+    for entry in entries:
+        buckets = [a + b for a, b in zip(buckets, entry["buckets"])]
+        total += entry["sum"]
+    return buckets, total
+
+
+def summarize(
+    counters: Mapping,
+    runtime: Mapping,
+    wait: Mapping,
+    done_windows: List[Mapping],
+    window_seconds: int,
+) -> Dict[str, Any]:
+    """Resumen por tarea y global a partir de los hashes de Redis"""
+    runtime_series = _histograms(runtime)
+    wait_series = _histograms(wait)
+
+    tasks: Dict[str, Dict[str, Any]] = {}
+    for field, value in counters.items():
+        task_name, queue, event = _decode(field).split("|", 2)
+        entry = tasks.setdefault(f"{task_name}|{queue}", {"task": task_name, "queue": queue, "counters": {}})
+        entry["counters"][event] = int(value)
+    for serie, entry in tasks.items():
+        if serie in runtime_series:
+            entry["runtime"] = _latency_summary(runtime_series[serie]["buckets"], runtime_series[serie]["sum"])
+        if serie in wait_series:
+            entry["queue_wait"] = _latency_summary(wait_series[serie]["buckets"], wait_series[serie]["sum"])
+
+    done_by_queue: Dict[str, int] = defaultdict(int)
+    for window in done_windows:
+        for queue, n in (window or {}).items():
+            done_by_queue[_decode(queue)] += int(n)
+    done_total = sum(done_by_queue.values())
+
+    return {
+        "window_seconds": window_seconds,
+        "throughput_per_second": round(done_total / window_seconds, 3) if window_seconds else None,
+        "throughput_by_queue": {
+            q: round(n / window_seconds, 3) for q, n in done_by_queue.items()
+        } if window_seconds else {},
+        "runtime": _latency_summary(*_merge(runtime_series.values())),
+        "queue_wait": _latency_summary(*_merge(wait_series.values())),
+        "tasks": list(tasks.values()),
+    }
+
+
+# ----- señales -----
+
+def _queue_of(task) -> str:
+    delivery_info = getattr(task.request, "delivery_info", None) or {}
+    return delivery_info.get("routing_key") or "unknown"
+
+
+def _published_at(task) -> Optional[float]:
+    value = getattr(task.request, PUBLISHED_AT_HEADER, None)
+    if value is None:
+        value = (getattr(task.request, "headers", None) or {}).get(PUBLISHED_AT_HEADER)
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+@before_task_publish.connect
+def _stamp_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(PUBLISHED_AT_HEADER, time.time())
+
+
+@task_prerun.connect
+def _on_task_prerun(task_id=None, task=None, **kwargs):
+    if task is not None:
+        task_metrics.task_started(task_id, task.name, _queue_of(task), _published_at(task))
+
+
+@task_postrun.connect
+def _on_task_postrun(task_id=None, task=None, state=None, **kwargs):
+    task_metrics.task_finished(task_id, state)
+
+
+@task_failure.connect
+def _on_task_failure(sender=None, exception=None, **kwargs):
+    if sender is not None:
+        task_metrics.task_failed(sender.name, _queue_of(sender), type(exception).__name__)
+
+
+@task_retry.connect
+def _on_task_retry(sender=None, **kwargs):
+    if sender is not None:
+        task_metrics.task_retried(sender.name, _queue_of(sender))
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _flush_on_shutdown(**kwargs):
+    task_metrics.stop()
@@ -0,0 +1,166 @@
+"""
+Runtime asíncrono persistente para los workers de Celery.
+
+Cada proceso worker mantiene un único event loop corriendo en un hilo dedicado
+y un único engine async (con su pool de conexiones). Las tareas síncronas de
+Celery envían sus corrutinas a ese loop en lugar de crear un loop, un
+ThreadPoolExecutor y un engine nuevos por tarea.
+
+El runtime pertenece al proceso que lo creó: un hijo creado con fork (pool
+prefork) hereda el loop pero no su hilo, así que después del fork se descarta
+y el hijo crea el suyo.
+"""
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Callable, Optional
+
+from celery.signals import worker_process_init, worker_process_shutdown, worker_init, worker_shutdown
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.core.database import build_engine_kwargs
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class WorkerAsyncRuntime:
+    """Event loop + engine compartidos por todas las tareas de un proceso worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._engine: Optional[AsyncEngine] = None
+        self._session_factory: Optional[async_sessionmaker] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._pid == os.getpid() and self._loop is not None and self._loop.is_running()
+
+    def _reset_after_fork(self) -> None:
+        """
+        Olvidar el runtime heredado del padre sin cerrarlo: el hilo del loop no
+        existe en el hijo y las conexiones del engine son del padre.
+        """
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._engine = None
+        self._session_factory = None
+        self._pid = None
+
+    @property
+    def engine(self) -> AsyncEngine:
+        self.start()
+        return self._engine
+
+    @property
+    def session_factory(self) -> async_sessionmaker:
+        self.start()
+        return self._session_factory
+
+    def start(self) -> None:
+        """Iniciar el loop y el engine (idempotente)"""
+        if self.is_running:
+            return
+        with self._lock:
+            if self.is_running:
+                return
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=_run_loop, name="worker-async-runtime", daemon=True)
+            thread.start()
+            ready.wait()
+
+            self._loop = loop
+            self._thread = thread
+            self._pid = os.getpid()
+            self._engine = create_async_engine(
+                settings.DATABASE_URL.replace("postgresql://", "postgresql+psycopg://"),
+                **build_engine_kwargs()
+            )
+            self._session_factory = async_sessionmaker(
+                bind=self._engine,
+                class_=AsyncSession,
+                expire_on_commit=False
+            )
+            logger.info("Runtime async del worker iniciado")
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Ejecutar una corrutina en el loop del worker y esperar su resultado"""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return future.result(timeout)
+
+    def call(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Atajo para run(func(*args, **kwargs))"""
+        return self.run(func(*args, **kwargs))
+
+    def stop(self) -> None:
+        """Liberar el engine y detener el loop"""
+        with self._lock:
+            if not self.is_running:
+                return
+            loop = self._loop
+            try:
+                if self._engine is not None:
+                    asyncio.run_coroutine_threadsafe(self._engine.dispose(), loop).result(timeout=10)
+            except Exception as e:
+                logger.warning(f"Error liberando engine del worker: {e}")
+            try:
+                from app.core.redis_client import close_async_redis
+                asyncio.run_coroutine_threadsafe(close_async_redis(), loop).result(timeout=10)
+            except Exception as e:
+                logger.warning(f"Error cerrando el pool de Redis del worker: {e}")
+            loop.call_soon_threadsafe(loop.stop)
+            if self._thread is not None:
+                self._thread.join(timeout=10)
+            loop.close()
+            self._loop = None
+            self._thread = None
+            self._engine = None
+            self._session_factory = None
+            self._pid = None
+            logger.info("Runtime async del worker detenido")
+
+
+worker_runtime = WorkerAsyncRuntime()
+os.register_at_fork(after_in_child=worker_runtime._reset_after_fork)
+
+
+def get_worker_runtime() -> WorkerAsyncRuntime:
+    """Obtener el runtime async del proceso actual"""
+    return worker_runtime
+
+
+# Con pool prefork el runtime se crea en cada proceso hijo (el heredado del
+# padre se descarta al hacer fork); con pool de threads (configuración por
+# defecto) se crea en el proceso principal del worker.
+@worker_process_init.connect
+def _init_runtime_in_child(**kwargs):
+    worker_runtime.start()
+
+
+@worker_init.connect
+def _init_runtime_in_main(**kwargs):
+    worker_runtime.start()
+
+
+@worker_process_shutdown.connect
+def _shutdown_runtime_in_child(**kwargs):
+    worker_runtime.stop()
+
+
+@worker_shutdown.connect
+def _shutdown_runtime_in_main(**kwargs):
+    worker_runtime.stop()
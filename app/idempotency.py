@@ -9,6 +9,8 @@ import time
 from typing import Any, Dict, Optional
 from dataclasses import dataclass
 
+from app.core import codec
+
 try:
     import redis.asyncio as redis
     REDIS_AVAILABLE = True
@@ -26,16 +28,25 @@ class IdempotencyResult:
 class IdempotencyManager:
     """Manages idempotency using Redis as cache"""
     
-    def __init__(self, redis_url: str = "redis://localhost:6379", ttl: int = 3600):
+    def __init__(self, redis_url: Optional[str] = None, ttl: int = 3600):
         self.ttl = ttl
-        self._redis_client: Optional[redis.Redis] = None
+        self.redis_url = redis_url
+        self._client: Optional[redis.Redis] = None
         self._cache: Dict[str, Any] = {}  # Fallback in-memory cache
-        
-        if REDIS_AVAILABLE:
+
+    @property
+    def _redis_client(self) -> Optional[redis.Redis]:
+        """Async client; without an explicit URL it uses the process-wide shared pool"""
+        if self._client is None and REDIS_AVAILABLE:
             try:
-                self._redis_client = redis.from_url(redis_url) if redis_url else None
+                if self.redis_url:
+                    self._client = redis.from_url(self.redis_url)
+                else:
+                    from app.core.redis_client import get_async_redis
+                    self._client = get_async_redis()
             except Exception:
-                self._redis_client = None
+                self._client = None
+        return self._client
 
     async def get_cached_result(self, key: str) -> Optional[Any]:
         """Get cached result by key"""
@@ -43,7 +54,7 @@ class IdempotencyManager:
             try:
                 cached_data = await self._redis_client.get(f"idempotency:{key}")
                 if cached_data:
-                    return json.loads(cached_data)
+                    return codec.loads(cached_data)
             except Exception:
                 pass
         
@@ -52,7 +63,7 @@ class IdempotencyManager:
 
     async def cache_result(self, key: str, result: Any) -> None:
         """Cache result with TTL"""
-        serialized_result = json.dumps(result, default=str)
+        serialized_result = codec.dumps(result)
         
         if self._redis_client:
             try:
@@ -74,14 +85,13 @@ class IdempotencyManager:
             for k in keys_to_remove:
                 del self._cache[k]
 
-    def invalidate_cache_entry(self, key: str) -> bool:
+    async def invalidate_cache_entry(self, key: str) -> bool:
         """Invalidate specific cache entry"""
         found = False
         
         if self._redis_client:
             try:
-                # This is sync version, in real implementation use async
-                result = self._redis_client.delete(f"idempotency:{key}")
+                result = await self._redis_client.delete(f"idempotency:{key}")
                 found = result > 0
             except Exception:
                 pass
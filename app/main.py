@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
@@ -7,9 +7,16 @@ from contextlib import asynccontextmanager
 import logging
 
 from app.core.config import settings
-from app.core.database import engine, Base
+from app.core.database import engine, Base, pool_stats
+from app.core.id_generator import ensure_id_sequence
 from app.core.logging import configure_uvicorn_logging, get_logger
-from app.middleware.logging_middleware import LoggingMiddleware, SecurityLoggingMiddleware, DatabaseLoggingMiddleware
+from app.core.metrics import register_collectors, render_latest
+from app.core.redis_client import init_async_redis, close_async_redis
+from app.services.catalog_cache import get_catalog_cache
+from app.services.queue_stats import get_queue_stats_collector
+from app.services.task_status import get_task_status_service
+from app.middleware.logging_middleware import RequestLoggingMiddleware
+from app.middleware.metrics_middleware import PrometheusMiddleware
 from app.routers import inscripciones, periodos, queue, historial
 from app.exceptions import InscripcionBaseException
 from app.exception_handlers import (
@@ -34,15 +41,23 @@ async def lifespan(app: FastAPI):
         async with engine.begin() as conn:
             await conn.run_sync(lambda sync_conn: sync_conn.exec_driver_sql("SELECT 1"))
             logger.info("✅ Base de datos configurada correctamente")
+        await ensure_id_sequence()
     except Exception as e:
         logger.error(f"❌ Error configurando base de datos: {e}")
     
+    if await init_async_redis():
+        logger.info("✅ Pool de Redis (asyncio) listo")
+    get_queue_stats_collector().ensure_started()
     logger.info("✅ Microservicio iniciado correctamente")
     
     yield
     
     # Shutdown
     logger.info("🔄 Cerrando microservicio de registro académico...")
+    await get_catalog_cache().stop_listener()
+    await get_task_status_service().close()
+    await get_queue_stats_collector().close()
+    await close_async_redis()
     await engine.dispose()
     logger.info("✅ Microservicio cerrado correctamente")
 
@@ -58,18 +73,15 @@ app = FastAPI(
 
 # ===== REGISTRAR MIDDLEWARES =====
 
-# Middleware de logging de requests (debe ir al final para capturar todo)
+# Logging de requests, seguridad y operaciones de BD (un solo middleware ASGI)
 app.add_middleware(
-    LoggingMiddleware,
-    skip_paths=["/health", "/metrics", "/docs", "/redoc", "/openapi.json", "/favicon.ico"]
+    RequestLoggingMiddleware,
+    skip_paths=["/health", "/metrics", "/docs", "/redoc", "/openapi.json", "/favicon.ico"],
+    sample_rate=settings.REQUEST_LOG_SAMPLE_RATE,
+    slow_request_ms=settings.REQUEST_LOG_SLOW_MS,
+    enabled=settings.REQUEST_LOG_ENABLED,
 )
 
-# Middleware de seguridad
-app.add_middleware(SecurityLoggingMiddleware)
-
-# Middleware para logging de operaciones de BD
-app.add_middleware(DatabaseLoggingMiddleware)
-
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -79,6 +91,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas Prometheus (último en registrarse = más externo: mide también los demás middlewares)
+if settings.ENABLE_METRICS:
+    register_collectors(engine, pool_stats)
+    app.add_middleware(PrometheusMiddleware, skip_paths=["/metrics"])
+
 # ===== REGISTRAR MANEJADORES DE EXCEPCIONES =====
 
 # Excepciones personalizadas del sistema
@@ -164,27 +181,13 @@ async def health_check():
             }
         )
 
-@app.get("/metrics")
+@app.get("/metrics", include_in_schema=False)
 async def metrics():
-    """Endpoint para métricas básicas del sistema"""
-    metrics_logger = get_logger("app.metrics")
-    
-    try:
-        # Aquí puedes agregar métricas específicas de tu aplicación
-        metrics_data = {
-            "uptime": "N/A",  # Implementar cálculo de uptime
-            "requests_total": "N/A",  # Implementar contador de requests
-            "errors_total": "N/A",  # Implementar contador de errores
-            "database_connections": "N/A",  # Implementar métricas de BD
-            "mode": "asynchronous"
-        }
-        
-        metrics_logger.debug("Métricas consultadas")
-        return metrics_data
-        
-    except Exception as e:
-        metrics_logger.error(f"Error al obtener métricas: {e}")
-        raise HTTPException(status_code=500, detail="Error interno del servidor")
+    """Métricas en formato de exposición de Prometheus"""
+    if not settings.ENABLE_METRICS:
+        raise HTTPException(status_code=404, detail="Métricas deshabilitadas")
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
 
 if __name__ == "__main__":
     import uvicorn
@@ -8,8 +8,13 @@ import logging
 
 from app.core.config import settings
 from app.core.database import engine, Base
+from app.core.id_generator import ensure_id_sequence
 from app.core.logging import configure_uvicorn_logging, get_logger
-from app.middleware.logging_middleware import LoggingMiddleware, SecurityLoggingMiddleware, DatabaseLoggingMiddleware
+from app.core.redis_client import init_async_redis, close_async_redis
+from app.services.catalog_cache import get_catalog_cache
+from app.services.queue_stats import get_queue_stats_collector
+from app.services.task_status import get_task_status_service
+from app.middleware.logging_middleware import RequestLoggingMiddleware
 from app.routers import inscripciones, periodos, queue, historial
 from app.exceptions import InscripcionBaseException
 from app.exception_handlers import (
@@ -34,15 +39,23 @@ async def lifespan(app: FastAPI):
         async with engine.begin() as conn:
             await conn.run_sync(lambda sync_conn: sync_conn.exec_driver_sql("SELECT 1"))
             logger.info("✅ Base de datos configurada correctamente")
+        await ensure_id_sequence()
     except Exception as e:
         logger.error(f"❌ Error configurando base de datos: {e}")
     
+    if await init_async_redis():
+        logger.info("✅ Pool de Redis (asyncio) listo")
+    get_queue_stats_collector().ensure_started()
     logger.info("✅ Microservicio iniciado correctamente")
     
     yield
     
     # Shutdown
     logger.info("🔄 Cerrando microservicio de registro académico...")
+    await get_catalog_cache().stop_listener()
+    await get_task_status_service().close()
+    await get_queue_stats_collector().close()
+    await close_async_redis()
     await engine.dispose()
     logger.info("✅ Microservicio cerrado correctamente")
 
@@ -58,18 +71,15 @@ app = FastAPI(
 
 # ===== REGISTRAR MIDDLEWARES =====
 
-# Middleware de logging de requests (debe ir al final para capturar todo)
+# Logging de requests, seguridad y operaciones de BD (un solo middleware ASGI)
 app.add_middleware(
-    LoggingMiddleware,
-    skip_paths=["/health", "/metrics", "/docs", "/redoc", "/openapi.json", "/favicon.ico"]
+    RequestLoggingMiddleware,
+    skip_paths=["/health", "/metrics", "/docs", "/redoc", "/openapi.json", "/favicon.ico"],
+    sample_rate=settings.REQUEST_LOG_SAMPLE_RATE,
+    slow_request_ms=settings.REQUEST_LOG_SLOW_MS,
+    enabled=settings.REQUEST_LOG_ENABLED,
 )
 
-# Middleware de seguridad
-app.add_middleware(SecurityLoggingMiddleware)
-
-# Middleware para logging de operaciones de BD
-app.add_middleware(DatabaseLoggingMiddleware)
-
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
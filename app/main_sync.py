@@ -3,13 +3,17 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from sqlalchemy.exc import SQLAlchemyError
-from contextlib import contextmanager
+from contextlib import asynccontextmanager
 import logging
 
 from app.core.config import settings
 from app.core.database_sync import engine, Base
 from app.core.logging import configure_uvicorn_logging, get_logger
-from app.middleware.logging_middleware import LoggingMiddleware, SecurityLoggingMiddleware, DatabaseLoggingMiddleware
+from app.core.redis_client import init_async_redis, close_async_redis
+from app.services.catalog_cache import get_catalog_cache
+from app.services.queue_stats import get_queue_stats_collector
+from app.services.task_status import get_task_status_service
+from app.middleware.logging_middleware import RequestLoggingMiddleware
 from app.routers import inscripciones, periodos, queue, historial
 from app.exceptions import InscripcionBaseException
 from app.exception_handlers import (
@@ -24,8 +28,8 @@ from app.exception_handlers import (
 configure_uvicorn_logging()
 logger = get_logger(__name__)
 
-@contextmanager
-def lifespan_context():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     """Contexto de ciclo de vida de la aplicación (versión sincrónica)"""
     logger.info("🚀 Iniciando microservicio de registro académico (versión sincrónica)...")
     
@@ -37,10 +41,17 @@ def lifespan_context():
     except Exception as e:
         logger.error(f"❌ Error configurando base de datos: {e}")
     
+    if await init_async_redis():
+        logger.info("✅ Pool de Redis (asyncio) listo")
+    get_queue_stats_collector().ensure_started()
     logger.info("✅ Microservicio iniciado correctamente")
     yield
     
     logger.info("🔄 Cerrando microservicio de registro académico...")
+    await get_catalog_cache().stop_listener()
+    await get_task_status_service().close()
+    await get_queue_stats_collector().close()
+    await close_async_redis()
     engine.dispose()
     logger.info("✅ Microservicio cerrado correctamente")
 
@@ -50,23 +61,21 @@ app = FastAPI(
     version=settings.VERSION,
     description="Microservicio sincrónico para la gestión de inscripciones académicas con logging avanzado",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # ===== REGISTRAR MIDDLEWARES =====
 
-# Middleware de logging de requests (debe ir al final para capturar todo)
+# Logging de requests, seguridad y operaciones de BD (un solo middleware ASGI)
 app.add_middleware(
-    LoggingMiddleware,
-    skip_paths=["/health", "/metrics", "/docs", "/redoc", "/openapi.json", "/favicon.ico"]
+    RequestLoggingMiddleware,
+    skip_paths=["/health", "/metrics", "/docs", "/redoc", "/openapi.json", "/favicon.ico"],
+    sample_rate=settings.REQUEST_LOG_SAMPLE_RATE,
+    slow_request_ms=settings.REQUEST_LOG_SLOW_MS,
+    enabled=settings.REQUEST_LOG_ENABLED,
 )
 
-# Middleware de seguridad
-app.add_middleware(SecurityLoggingMiddleware)
-
-# Middleware para logging de operaciones de BD
-app.add_middleware(DatabaseLoggingMiddleware)
-
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -184,11 +193,6 @@ def metrics():
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 # Inicialización startup/shutdown events
-@app.on_event("startup")
-def startup_event():
-    with lifespan_context():
-        pass
-
 if __name__ == "__main__":
     import uvicorn
     
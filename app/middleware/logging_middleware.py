@@ -1,314 +1,198 @@
 """
 Middleware para logging de requests HTTP.
+
+Un único middleware ASGI puro reemplaza a LoggingMiddleware,
+SecurityLoggingMiddleware y DatabaseLoggingMiddleware (BaseHTTPMiddleware):
+sin saltos de tarea ni re-empaquetado del response, y un solo registro por
+request con los campos que antes se repartían en tres.
+
+- Requests exitosos (< 400 y no lentos) se muestrean con `sample_rate`.
+- Errores, requests lentos y eventos de seguridad siempre se registran.
+- Con el logger por debajo de INFO (o `enabled=False`) el request pasa directo,
+  sin generar request_id ni headers.
 """
+import logging
+import random
+import re
 import time
 import uuid
-from typing import Callable
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from typing import Iterable, Optional
+from urllib.parse import unquote_plus
 
 from app.core.logging import get_logger
 
 logger = get_logger(__name__)
+security_logger = get_logger("app.security")
+
+DEFAULT_SKIP_PATHS = ("/health", "/metrics", "/docs", "/redoc", "/openapi.json", "/favicon.ico")
+DB_PATH_MARKERS = ("/api/", "/inscripciones/", "/periodos/", "/historial/")
+
+# Patrones sospechosos comunes (se buscan en path y query en minúsculas)
+SUSPICIOUS_PATTERNS = (
+    "script", "javascript", "vbscript", "onload", "onerror",
+    "union", "select", "insert", "update", "delete", "drop",
+    "../", "..\\", "/etc/", "cmd.exe", "powershell",
+    "<script", "</script", "eval(", "alert("
+)
+# Los más largos primero para reportar "<script" y no solo "script"
+_SUSPICIOUS_RE = re.compile("|".join(re.escape(p) for p in sorted(SUSPICIOUS_PATTERNS, key=len, reverse=True)))
 
+_SECURITY_STATUS = {
+    401: "Authentication failure",
+    403: "Authorization failure",
+    429: "Rate limit exceeded",
+}
 
-class LoggingMiddleware(BaseHTTPMiddleware):
+_DB_OPERATIONS = {
+    "GET": "READ",
+    "POST": "CREATE",
+    "PUT": "UPDATE",
+    "PATCH": "UPDATE",
+    "DELETE": "DELETE",
+}
+
+
+class RequestLoggingMiddleware:
     """
-    Middleware para loggear información detallada de requests y responses.
+    Logging de requests, eventos de seguridad y operaciones de BD en un paso.
     """
-    
-    def __init__(self, app, skip_paths: list = None):
-        super().__init__(app)
-        self.skip_paths = skip_paths or ["/health", "/metrics", "/docs", "/redoc", "/openapi.json"]
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Generar ID único para el request
-        request_id = str(uuid.uuid4())[:8]
-        request.state.request_id = request_id
-        
-        # Verificar si debemos saltear el logging
-        if request.url.path in self.skip_paths:
-            return await call_next(request)
-        
-        # Información del request
-        start_time = time.time()
-        client_ip = self._get_client_ip(request)
-        user_agent = request.headers.get("user-agent", "unknown")
-        
-        # Log inicial del request
-        logger.info(
-            f"Request iniciado: {request.method} {request.url.path}",
-            extra={
-                "request_id": request_id,
-                "method": request.method,
-                "path": request.url.path,
-                "query_params": str(request.query_params),
-                "client_ip": client_ip,
-                "user_agent": user_agent,
-                "content_type": request.headers.get("content-type"),
-                "content_length": request.headers.get("content-length")
-            }
-        )
-        
+
+    def __init__(
+        self,
+        app,
+        skip_paths: Optional[Iterable[str]] = None,
+        sample_rate: float = 1.0,
+        slow_request_ms: float = 1000.0,
+        enabled: bool = True,
+    ):
+        self.app = app
+        self.skip_paths = frozenset(skip_paths if skip_paths is not None else DEFAULT_SKIP_PATHS)
+        self.sample_rate = sample_rate
+        self.slow_request_seconds = slow_request_ms / 1000
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not self.enabled
+            or not logger.isEnabledFor(logging.INFO)
+            or scope["path"] in self.skip_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = uuid.uuid4().hex[:8]
+        scope.setdefault("state", {})["request_id"] = request_id
+        start_time = time.perf_counter()
+        status_code = None
+        response_size = None
+
+        async def send_with_headers(message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                process_time = time.perf_counter() - start_time
+                headers = list(message.get("headers", ()))
+                for name, value in headers:
+                    if name.lower() == b"content-length":
+                        response_size = value.decode("latin-1")
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                headers.append((b"x-process-time", str(round(process_time, 4)).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
         try:
-            # Procesar request
-            response = await call_next(request)
-            
-            # Calcular tiempo de procesamiento
-            process_time = time.time() - start_time
-            
-            # Log del response exitoso
-            logger.info(
-                f"Request completado: {request.method} {request.url.path} - {response.status_code}",
-                extra={
-                    "request_id": request_id,
-                    "method": request.method,
-                    "path": request.url.path,
-                    "status_code": response.status_code,
-                    "process_time": round(process_time, 4),
-                    "response_size": response.headers.get("content-length"),
-                    "client_ip": client_ip
-                }
-            )
-            
-            # Agregar headers de respuesta
-            response.headers["X-Request-ID"] = request_id
-            response.headers["X-Process-Time"] = str(round(process_time, 4))
-            
-            return response
-            
+            await self.app(scope, receive, send_with_headers)
         except Exception as exc:
-            # Calcular tiempo hasta el error
-            process_time = time.time() - start_time
-            
-            # Log del error
-            logger.error(
-                f"Request falló: {request.method} {request.url.path} - {type(exc).__name__}",
-                extra={
-                    "request_id": request_id,
-                    "method": request.method,
-                    "path": request.url.path,
-                    "exception_type": type(exc).__name__,
-                    "exception_message": str(exc),
-                    "process_time": round(process_time, 4),
-                    "client_ip": client_ip
-                }
-            )
-            
-            # Re-lanzar la excepción para que la manejen los handlers
-            raise exc
-    
-    def _get_client_ip(self, request: Request) -> str:
-        """
-        Obtiene la IP real del cliente considerando proxies y load balancers.
-        """
-        # Verificar headers de proxies comunes
-        forwarded_for = request.headers.get("x-forwarded-for")
+            self._log_exception(scope, request_id, time.perf_counter() - start_time, exc)
+            raise
+        self._log_completed(scope, request_id, time.perf_counter() - start_time, status_code, response_size)
+
+    # ----- registros -----
+
+    def _request_fields(self, scope, request_id: str) -> dict:
+        """Campos del request; solo se arman cuando el registro se va a emitir"""
+        client_ip = user_agent = content_type = content_length = forwarded_for = real_ip = None
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                forwarded_for = value.decode("latin-1")
+            elif name == b"x-real-ip":
+                real_ip = value.decode("latin-1")
+            elif name == b"user-agent":
+                user_agent = value.decode("latin-1")
+            elif name == b"content-type":
+                content_type = value.decode("latin-1")
+            elif name == b"content-length":
+                content_length = value.decode("latin-1")
+
+        # IP real del cliente considerando proxies y load balancers
         if forwarded_for:
-            # Tomar la primera IP de la lista (IP original del cliente)
-            return forwarded_for.split(",")[0].strip()
-        
-        real_ip = request.headers.get("x-real-ip")
-        if real_ip:
-            return real_ip.strip()
-        
-        # Fallback a la IP directa
-        return request.client.host if request.client else "unknown"
+            client_ip = forwarded_for.split(",")[0].strip()
+        elif real_ip:
+            client_ip = real_ip.strip()
+        elif scope.get("client"):
+            client_ip = scope["client"][0]
 
+        path = scope["path"]
+        fields = {
+            "request_id": request_id,
+            "method": scope["method"],
+            "path": path,
+            "query_params": scope.get("query_string", b"").decode("latin-1"),
+            "client_ip": client_ip or "unknown",
+            "user_agent": user_agent or "unknown",
+            "content_type": content_type,
+            "content_length": content_length,
+        }
+        if any(marker in path for marker in DB_PATH_MARKERS):
+            fields["likely_db_operation"] = _DB_OPERATIONS.get(scope["method"], "UNKNOWN")
+        return fields
 
-class SecurityLoggingMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware para logging de eventos de seguridad.
-    """
-    
-    def __init__(self, app):
-        super().__init__(app)
-        self.security_logger = get_logger("app.security")
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Detectar patrones sospechosos
-        self._check_suspicious_patterns(request)
-        
-        try:
-            response = await call_next(request)
-            
-            # Log eventos de seguridad basados en el status code
-            if response.status_code == 401:
-                self._log_authentication_failure(request)
-            elif response.status_code == 403:
-                self._log_authorization_failure(request)
-            elif response.status_code == 429:
-                self._log_rate_limit_exceeded(request)
-            
-            return response
-            
-        except Exception as exc:
-            # Log errores de seguridad
-            self.security_logger.warning(
-                f"Security exception during request processing",
-                extra={
-                    "request_id": getattr(request.state, 'request_id', None),
-                    "path": request.url.path,
-                    "method": request.method,
-                    "client_ip": self._get_client_ip(request),
-                    "exception_type": type(exc).__name__,
-                    "exception_message": str(exc)
-                }
-            )
-            raise exc
-    
-    def _check_suspicious_patterns(self, request: Request):
-        """
-        Verifica patrones sospechosos en el request.
-        """
-        path = request.url.path.lower()
-        query = str(request.query_params).lower()
-        
-        # Patrones sospechosos comunes
-        suspicious_patterns = [
-            "script", "javascript", "vbscript", "onload", "onerror",
-            "union", "select", "insert", "update", "delete", "drop",
-            "../", "..\\", "/etc/", "cmd.exe", "powershell",
-            "<script", "</script", "eval(", "alert("
-        ]
-        
-        for pattern in suspicious_patterns:
-            if pattern in path or pattern in query:
-                self.security_logger.warning(
-                    f"Suspicious pattern detected: {pattern}",
-                    extra={
-                        "request_id": getattr(request.state, 'request_id', None),
-                        "path": request.url.path,
-                        "method": request.method,
-                        "client_ip": self._get_client_ip(request),
-                        "pattern": pattern,
-                        "query_params": str(request.query_params)
-                    }
-                )
-    
-    def _log_authentication_failure(self, request: Request):
-        """Log fallos de autenticación."""
-        self.security_logger.warning(
-            "Authentication failure",
-            extra={
-                "request_id": getattr(request.state, 'request_id', None),
-                "path": request.url.path,
-                "method": request.method,
-                "client_ip": self._get_client_ip(request),
-                "user_agent": request.headers.get("user-agent")
-            }
-        )
-    
-    def _log_authorization_failure(self, request: Request):
-        """Log fallos de autorización."""
-        self.security_logger.warning(
-            "Authorization failure",
-            extra={
-                "request_id": getattr(request.state, 'request_id', None),
-                "path": request.url.path,
-                "method": request.method,
-                "client_ip": self._get_client_ip(request),
-                "user_agent": request.headers.get("user-agent")
-            }
-        )
-    
-    def _log_rate_limit_exceeded(self, request: Request):
-        """Log cuando se excede el rate limit."""
-        self.security_logger.warning(
-            "Rate limit exceeded",
-            extra={
-                "request_id": getattr(request.state, 'request_id', None),
-                "path": request.url.path,
-                "method": request.method,
-                "client_ip": self._get_client_ip(request),
-                "user_agent": request.headers.get("user-agent")
-            }
+    def _suspicious_patterns(self, scope) -> list:
+        query = unquote_plus(scope.get("query_string", b"").decode("latin-1"))
+        target = f"{scope['path']} {query}".lower()
+        return sorted(set(_SUSPICIOUS_RE.findall(target)))
+
+    def _log_completed(self, scope, request_id, process_time, status_code, response_size):
+        patterns = self._suspicious_patterns(scope)
+        security_event = _SECURITY_STATUS.get(status_code)
+        is_error = status_code is None or status_code >= 400
+        is_slow = process_time >= self.slow_request_seconds
+
+        if not (is_error or is_slow or patterns or security_event):
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                return
+
+        fields = self._request_fields(scope, request_id)
+        fields.update(
+            status_code=status_code,
+            process_time=round(process_time, 4),
+            response_size=response_size,
+            slow_request=is_slow,
         )
-    
-    def _get_client_ip(self, request: Request) -> str:
-        """
-        Obtiene la IP real del cliente considerando proxies y load balancers.
-        """
-        # Verificar headers de proxies comunes
-        forwarded_for = request.headers.get("x-forwarded-for")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
-        
-        real_ip = request.headers.get("x-real-ip")
-        if real_ip:
-            return real_ip.strip()
-        
-        return request.client.host if request.client else "unknown"
+        if patterns:
+            fields["suspicious_patterns"] = patterns
+        if security_event:
+            fields["security_event"] = security_event
 
+        level = logging.WARNING if (is_slow or (status_code or 500) >= 500) else logging.INFO
+        logger.log(level, "Request completado: %s %s - %s", scope["method"], scope["path"], status_code, extra=fields)
 
-class DatabaseLoggingMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware para logging específico de operaciones de base de datos.
-    """
-    
-    def __init__(self, app):
-        super().__init__(app)
-        self.db_logger = get_logger("app.database.requests")
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Solo loggear endpoints que probablemente interactúen con BD
-        db_endpoints = ["/api/", "/inscripciones/", "/periodos/", "/historial/"]
-        
-        if not any(endpoint in request.url.path for endpoint in db_endpoints):
-            return await call_next(request)
-        
-        start_time = time.time()
-        
-        try:
-            response = await call_next(request)
-            
-            process_time = time.time() - start_time
-            
-            # Log operaciones de BD exitosas
-            self.db_logger.info(
-                f"Database operation completed: {request.method} {request.url.path}",
-                extra={
-                    "request_id": getattr(request.state, 'request_id', None),
-                    "method": request.method,
-                    "path": request.url.path,
-                    "status_code": response.status_code,
-                    "process_time": round(process_time, 4),
-                    "likely_db_operation": self._determine_db_operation(request.method, request.url.path)
-                }
-            )
-            
-            return response
-            
-        except Exception as exc:
-            process_time = time.time() - start_time
-            
-            # Log errores de BD
-            self.db_logger.error(
-                f"Database operation failed: {request.method} {request.url.path}",
-                extra={
-                    "request_id": getattr(request.state, 'request_id', None),
-                    "method": request.method,
-                    "path": request.url.path,
-                    "exception_type": type(exc).__name__,
-                    "exception_message": str(exc),
-                    "process_time": round(process_time, 4),
-                    "likely_db_operation": self._determine_db_operation(request.method, request.url.path)
-                }
-            )
-            
-            raise exc
-    
-    def _determine_db_operation(self, method: str, path: str) -> str:
-        """
-        Determina el tipo de operación de BD basado en el método HTTP y la ruta.
-        """
-        if method == "GET":
-            return "READ"
-        elif method == "POST":
-            return "CREATE"
-        elif method == "PUT" or method == "PATCH":
-            return "UPDATE"
-        elif method == "DELETE":
-            return "DELETE"
-        else:
-            return "UNKNOWN"
\ No newline at end of file
+        if patterns:
+            security_logger.warning("Suspicious pattern detected: %s", ", ".join(patterns), extra=fields)
+        if security_event:
+            security_logger.warning(security_event, extra=fields)
+
+    def _log_exception(self, scope, request_id, process_time, exc):
+        fields = self._request_fields(scope, request_id)
+        fields.update(
+            exception_type=type(exc).__name__,
+            exception_message=str(exc),
+            process_time=round(process_time, 4),
+        )
+        patterns = self._suspicious_patterns(scope)
+        if patterns:
+            fields["suspicious_patterns"] = patterns
+        logger.error(
+            "Request falló: %s %s - %s", scope["method"], scope["path"], type(exc).__name__, extra=fields
+        )
@@ -0,0 +1,55 @@
+"""
+Middleware ASGI de métricas HTTP (Prometheus).
+
+Middleware ASGI puro: no envuelve el body ni crea tareas, solo intercepta el
+`http.response.start` para leer el status. La ruta se etiqueta con la plantilla
+(`/api/v1/inscripciones/{codigo}`) para mantener acotada la cardinalidad.
+"""
+import time
+from typing import Dict, Iterable, Tuple
+
+from app.core.metrics import HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class PrometheusMiddleware:
+    def __init__(self, app, skip_paths: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = frozenset(skip_paths)
+        # Hijos de las métricas por etiquetas: evita el lock de .labels() en cada request
+        self._latency: Dict[Tuple[str, str], object] = {}
+        self._in_flight: Dict[str, object] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        in_flight = self._in_flight.get(method)
+        if in_flight is None:
+            in_flight = self._in_flight[method] = HTTP_IN_FLIGHT.labels(method)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or UNMATCHED_ROUTE
+            key = (method, route_path)
+            latency = self._latency.get(key)
+            if latency is None:
+                latency = self._latency[key] = HTTP_LATENCY.labels(method, route_path)
+            latency.observe(elapsed)
+            HTTP_REQUESTS.labels(method, route_path, str(status_code)).inc()
@@ -1,15 +1,20 @@
-from fastapi import APIRouter, Depends, status, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
+from typing import List, Literal, Optional
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.logging import get_logger
 from app.services.historial_service import HistorialAcademicoService
+from app.services.historial_import import stage_payload
+from app.services.historial_reports import get_historial_report_store
 from app.schemas import (
     HistorialAcademicoCreate, HistorialAcademicoUpdate, HistorialAcademicoResponse,
     HistorialAcademicoCompleto, ResumenAcademico, HistorialPorPeriodo
 )
 from app.exceptions import HistorialNoEncontradoException
+from app.tasks import import_historial_task, rebuild_historial_reports_task
 
 # Logger específico para este router
 logger = get_logger(__name__)
@@ -61,6 +66,66 @@ async def create_historial(
     
     return result
 
+@router.post("/importar",
+            status_code=status.HTTP_202_ACCEPTED,
+            summary="Importar historial académico en lote (Asíncrono)",
+            description="Recibe un archivo CSV (con encabezado) o NDJSON en el cuerpo del request y lo importa en un worker. Retorna el task_id para monitorear el progreso.")
+async def importar_historial(
+    request: Request,
+    formato: Literal["csv", "ndjson"] = Query("csv", description="Formato del archivo"),
+    on_duplicate: Literal["error", "update"] = Query(
+        "error", description="Registros ya existentes: reportarlos como error o actualizar nota/estado/observación"
+    )
+):
+    """
+    Importa notas de fin de período de forma masiva.
+    
+    Columnas / campos: **registro_academico**, **sigla_materia**, **codigo_periodo**,
+    **nota_final** (opcional), **estado**, **observacion** (opcional).
+    
+    El resultado de la tarea incluye los totales y los errores por fila.
+    """
+    payload = await request.body()
+    if not payload.strip():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El archivo está vacío")
+    if len(payload) > settings.HISTORIAL_IMPORT_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"El archivo excede {settings.HISTORIAL_IMPORT_MAX_BYTES} bytes"
+        )
+    try:
+        contenido = payload.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El archivo debe estar en UTF-8")
+    
+    try:
+        archivo_ref = await stage_payload(contenido)
+    except Exception as e:
+        logger.error(f"No se pudo guardar el archivo de importación en Redis: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No se pudo recibir el archivo, intente nuevamente"
+        )
+    
+    task = import_historial_task.delay(archivo_ref, formato, on_duplicate)
+    
+    logger.info(
+        f"Importación de historial encolada",
+        extra={
+            "request_id": getattr(request.state, 'request_id', None),
+            "task_id": task.id,
+            "formato": formato,
+            "bytes": len(payload)
+        }
+    )
+    
+    return {
+        "message": "Importación de historial encolada para procesamiento",
+        "task_id": task.id,
+        "status": "PENDING",
+        "monitor_url": f"/api/v1/queue/tasks/{task.id}/status"
+    }
+
 @router.get("/{id_historial}",
            response_model=HistorialAcademicoCompleto,
            summary="Obtener registro por ID",
@@ -348,22 +413,48 @@ async def delete_historial(
 
 # Endpoints adicionales de estadísticas y reportes
 
+async def _reporte_pendiente(tipo: str, clave: str, request: Request) -> JSONResponse:
+    """
+    Reporte inexistente: si ya hubo una reconstrucción completa no hay registros
+    (404); si no, encolar la reconstrucción (una vez) y responder 202.
+    """
+    store = get_historial_report_store()
+    if await store.last_rebuild() is not None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sin registros de historial para {clave}"
+        )
+    if await store.claim_rebuild():
+        rebuild_historial_reports_task.delay()
+    logger.info(
+        f"Reporte de {tipo} aún no disponible",
+        extra={
+            "request_id": getattr(request.state, 'request_id', None),
+            tipo: clave
+        }
+    )
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"status": "PENDIENTE", tipo: clave, "message": "El reporte se está calculando, reintentar en unos segundos"}
+    )
+
 @router.get("/reportes/estudiantes-por-materia/{sigla_materia}",
            summary="Reporte de estudiantes por materia",
-           description="Obtiene estadísticas de estudiantes que han cursado una materia")
+           description="Obtiene estadísticas precalculadas de estudiantes que han cursado una materia")
 async def get_reporte_materia(
     sigla_materia: str,
     request: Request,
-    codigo_periodo: Optional[str] = Query(None, description="Filtrar por período"),
-    db: AsyncSession = Depends(get_db)
+    codigo_periodo: Optional[str] = Query(None, description="Filtrar por período")
 ):
     """
     Obtiene un reporte de estudiantes que han cursado una materia específica.
     
-    Incluye estadísticas de aprobación, reprobación y retiros.
+    Incluye tasas de aprobación, reprobación y retiros, promedios y distribución
+    de notas, en total y por período. Los reportes se calculan en lote en los
+    workers y se refrescan cuando cambia el historial.
     """
     logger.info(
-        f"Generando reporte de materia",
+        f"Consultando reporte de materia",
         extra={
             "request_id": getattr(request.state, 'request_id', None),
             "sigla_materia": sigla_materia,
@@ -371,47 +462,49 @@ async def get_reporte_materia(
         }
     )
     
-    service = HistorialAcademicoService(db)
-    # Esta funcionalidad se puede implementar como extensión
-    logger.info(
-        f"Reporte de materia - funcionalidad en desarrollo",
-        extra={
-            "request_id": getattr(request.state, 'request_id', None),
-            "sigla_materia": sigla_materia
+    reporte = await get_historial_report_store().get_materia(sigla_materia)
+    if reporte is None:
+        return await _reporte_pendiente("sigla_materia", sigla_materia, request)
+    
+    if codigo_periodo:
+        periodo = next((p for p in reporte["periodos"] if p["codigo_periodo"] == codigo_periodo), None)
+        if periodo is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Sin registros de {sigla_materia} en el período {codigo_periodo}"
+            )
+        return {
+            "sigla_materia": sigla_materia,
+            "materia_nombre": reporte["materia_nombre"],
+            "generado_en": reporte["generado_en"],
+            **periodo
         }
-    )
     
-    return {"message": "Funcionalidad en desarrollo", "materia": sigla_materia}
+    return reporte
 
 @router.get("/reportes/rendimiento-periodo/{codigo_periodo}",
            summary="Reporte de rendimiento por período",
-           description="Obtiene estadísticas generales de rendimiento académico por período")
+           description="Obtiene estadísticas precalculadas de rendimiento académico por período")
 async def get_reporte_periodo(
     codigo_periodo: str,
-    request: Request,
-    db: AsyncSession = Depends(get_db)
+    request: Request
 ):
     """
     Obtiene estadísticas generales de rendimiento académico para un período.
     
-    Incluye promedios generales, tasas de aprobación, etc.
+    Incluye promedios generales, tasas de aprobación y distribución de notas
+    del período y de cada materia dictada en él.
     """
     logger.info(
-        f"Generando reporte de período",
+        f"Consultando reporte de período",
         extra={
             "request_id": getattr(request.state, 'request_id', None),
             "codigo_periodo": codigo_periodo
         }
     )
     
-    service = HistorialAcademicoService(db)
-    # Esta funcionalidad se puede implementar como extensión
-    logger.info(
-        f"Reporte de período - funcionalidad en desarrollo",
-        extra={
-            "request_id": getattr(request.state, 'request_id', None),
-            "codigo_periodo": codigo_periodo
-        }
-    )
+    reporte = await get_historial_report_store().get_periodo(codigo_periodo)
+    if reporte is None:
+        return await _reporte_pendiente("codigo_periodo", codigo_periodo, request)
     
-    return {"message": "Funcionalidad en desarrollo", "periodo": codigo_periodo}
+    return reporte
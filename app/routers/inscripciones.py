@@ -1,7 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
-from app.core.database import get_db
+from typing import List, Literal, Optional
+import csv
+import io
+import json
+from app.core.database import AsyncSessionLocal, get_db
 from app.services import InscripcionService, PeriodoAcademicoService
 from app.schemas import (
     InscripcionCreate, InscripcionUpdate, InscripcionResponse, InscripcionSimpleResponse,
@@ -97,14 +101,64 @@ async def get_inscripciones_estudiante(
 
 @router.get("/periodo/{codigo_periodo}",
            summary="Obtener inscripciones de un período",
-           description="Obtiene todas las inscripciones de un período académico específico")
+           description="Obtiene una página de inscripciones de un período académico. Usar `next_cursor` como `cursor` para la siguiente página.")
 async def get_inscripciones_periodo(
     codigo_periodo: str,
+    limit: int = Query(100, ge=1, le=1000, description="Inscripciones por página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto por la página anterior"),
     db: AsyncSession = Depends(get_db)
 ):
     service = InscripcionService(db)
-    inscripciones = await service.get_inscripciones_by_periodo(codigo_periodo)
-    return {"inscripciones": inscripciones}
+    inscripciones, next_cursor = await service.get_inscripciones_by_periodo(codigo_periodo, limit, cursor)
+    return {"inscripciones": inscripciones, "next_cursor": next_cursor}
+
+EXPORT_FIELDS = ("codigo_inscripcion", "registro_academico", "codigo_periodo", "fecha_inscripcion")
+EXPORT_CHUNK_ROWS = 500
+
+async def _export_inscripciones(codigo_periodo: str, formato: str):
+    """Genera el export en bloques de bytes; la sesión vive lo que dura el stream"""
+    buffer = io.StringIO()
+    writer = None
+    if formato == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+
+    rows = 0
+    async with AsyncSessionLocal() as session:
+        service = InscripcionService(session)
+        async for inscripcion in service.stream_inscripciones_by_periodo(codigo_periodo):
+            values = [getattr(inscripcion, field) for field in EXPORT_FIELDS]
+            values[3] = values[3].isoformat() if values[3] else None
+            if writer is not None:
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, values)), ensure_ascii=False))
+                buffer.write("\n")
+            rows += 1
+            if rows % EXPORT_CHUNK_ROWS == 0:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+    logger.info(f"Export de inscripciones del período {codigo_periodo} ({formato}): {rows} filas")
+
+@router.get("/periodo/{codigo_periodo}/export",
+           summary="Exportar inscripciones de un período",
+           description="Exporta todas las inscripciones de un período como NDJSON o CSV en streaming (chunked), con memoria constante")
+async def export_inscripciones_periodo(
+    codigo_periodo: str,
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="Formato del export")
+):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_inscripciones(codigo_periodo, format),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="inscripciones_{codigo_periodo}.{format}"'
+        }
+    )
 
 @router.put("/{codigo_inscripcion}",
            response_model=InscripcionResponse,
@@ -1,14 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, status, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-import redis
 import json
 import uuid
 import logging
 from datetime import datetime
 from celery import current_app
-from celery.result import AsyncResult
 
 from app.core.database import get_db
 from app.core.config import settings
@@ -19,12 +17,15 @@ from app.idempotency import IdempotencyManager, idempotency_manager, inscription
 from app.saga_pattern import SagaTransaction, InscriptionSagaOrchestrator, saga_manager
 # DISABLED: from app.enhanced_logging import StructuredLogger, CorrelationManager, structured_logger
 from app.schemas import InscripcionCreate
+from app.services.queue_stats import get_queue_stats_collector
+from app.services.task_status import get_task_status_service
 from app.tasks import (
     create_inscription_task,
     create_enhanced_inscription_task,
     bulk_create_inscriptions_task,
     health_check_task,
     create_single_group_inscription_task,
+    group_inscription_chord_task,
 )
 
 router = APIRouter(prefix="/queue", tags=["Queue Management"])
@@ -49,9 +50,6 @@ CorrelationManager = SimpleCorrelationManager()
 # idempotency_manager = IdempotencyManager()
 # saga_manager = InscriptionSagaOrchestrator()
 
-# Conexión a Redis para información adicional
-redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
-
 
 # Esquemas para el sistema de colas
 class TaskResponse(BaseModel):
@@ -84,6 +82,11 @@ class QueueStatsResponse(BaseModel):
     completed_tasks: int
     failed_tasks: int
     workers_online: int
+    queue_lengths: Optional[Dict[str, int]] = None
+    task_metrics: Optional[Dict[str, Any]] = None  # throughput, p50/p95/p99 de ejecución y espera en cola
+    collected_at: Optional[str] = None
+    age_seconds: Optional[float] = None
+    stale: bool = False
 
 
 class WorkerControlRequest(BaseModel):
@@ -134,18 +137,18 @@ async def create_inscription_async(
     description="Encola una tarea por cada grupo usando saga pattern, circuit breakers e idempotencia",
 )
 def create_inscription_async_by_groups(
-    inscription_data: InscripcionCreate
+    inscription_data: InscripcionCreate,
+    mode: str = Query(
+        "per-task",
+        pattern="^(per-task|chord)$",
+        description="per-task: una tarea por grupo; chord: validación única y un solo task_id con el resultado agregado"
+    )
 ):
     """Crear inscripción con una tarea por grupo usando funcionalidades mejoradas"""
     try:
         # Generate simple correlation ID for request tracking
         correlation_id = f"corr_{uuid.uuid4().hex[:8]}"
         
-        # Generar código de inscripción principal
-        main_codigo_inscripcion = (
-            f"I{datetime.now().strftime('%y%m%d')}{str(uuid.uuid4())[:3].upper()}"
-        )
-
         # Datos base para todas las tareas
         base_data = {
             "registro_academico": inscription_data.registro_academico,
@@ -154,6 +157,25 @@ def create_inscription_async_by_groups(
             "idempotency_key": f"inscription:{uuid.uuid4().hex}"
         }
 
+        if mode == "chord":
+            # Un solo task_id: la validación corre una vez y el callback del chord
+            # deja el resultado agregado (con el detalle por grupo) en este ID
+            task = group_inscription_chord_task.delay({**base_data, "grupos": inscription_data.grupos})
+            logger.info(
+                "Inscription by groups queued as chord",
+                extra={
+                    "correlation_id": correlation_id,
+                    "main_task_id": task.id,
+                    "grupos_count": len(inscription_data.grupos)
+                }
+            )
+            return MultipleTasksResponse(
+                main_task_id=task.id,
+                group_tasks=[],
+                status="QUEUED",
+                message=f"Inscripción encolada como chord de {len(inscription_data.grupos)} grupos; consultar main_task_id",
+            )
+
         # Crear una tarea separada por cada grupo (tareas reales de Celery)
         group_tasks = []
         main_task_id = None
@@ -260,44 +282,9 @@ async def create_bulk_inscriptions_async(
 async def get_task_status(task_id: str):
     """Obtener el estado de una tarea específica"""
     try:
-        task_result = AsyncResult(task_id, app=celery_app)
-
-        response = TaskStatusResponse(
-            task_id=task_id, status=task_result.status, meta=None
-        )
-
-        # Manejo seguro del estado de la tarea
-        try:
-            if task_result.successful():
-                response.result = task_result.result
-            elif task_result.failed():
-                # Manejo defensivo de la información de error
-                error_info = task_result.info
-                if isinstance(error_info, dict):
-                    response.meta = error_info
-                elif error_info is not None:
-                    response.meta = {
-                        "error_type": type(error_info).__name__,
-                        "error_message": str(error_info),
-                    }
-                else:
-                    response.meta = {
-                        "error_type": "UnknownError",
-                        "error_message": "Task failed with no error information",
-                    }
-            elif isinstance(task_result.info, dict):
-                response.meta = task_result.info
-            else:
-                # Para estados PENDING, STARTED, etc.
-                response.meta = {"message": f"Task is in {task_result.status} state"}
-        except Exception as info_error:
-            # Si hay error accediendo a la info de la tarea
-            response.meta = {
-                "error_type": "TaskInfoError",
-                "error_message": f"Error accessing task info: {str(info_error)}",
-            }
-
-        return response
+        task_status = await get_task_status_service().get_status(task_id)
+        task_status.pop("metadata", None)
+        return TaskStatusResponse(**task_status)
 
     except Exception as e:
         raise HTTPException(
@@ -310,59 +297,16 @@ async def get_task_status(task_id: str):
     "/tasks/status/multiple",
     response_model=List[TaskStatusResponse],
     summary="Consultar estado de múltiples tareas",
-    description="Obtiene el estado de múltiples tareas de una vez",
+    description="Obtiene el estado de múltiples tareas de una vez (un solo MGET a Redis)",
 )
 async def get_multiple_tasks_status(task_ids: List[str]):
     """Obtener el estado de múltiples tareas"""
     try:
+        statuses = await get_task_status_service().get_statuses(task_ids, with_metadata=False)
         results = []
-        for task_id in task_ids:
-            try:
-                task_result = AsyncResult(task_id, app=celery_app)
-
-                response = TaskStatusResponse(
-                    task_id=task_id, status=task_result.status, meta=None
-                )
-
-                # Manejo seguro de la información de la tarea
-                try:
-                    if task_result.failed():
-                        exc = task_result.info
-                        response.meta = {
-                            "error_type": type(exc).__name__ if exc else None,
-                            "error_message": str(exc),
-                        }
-                    elif isinstance(task_result.info, dict):
-                        response.meta = task_result.info
-                    else:
-                        response.meta = {
-                            "message": f"Task is in {task_result.status} state"
-                        }
-                except Exception:
-                    response.meta = {
-                        "error_type": "TaskInfoError",
-                        "error_message": "Error accessing task info",
-                    }
-
-                # Si la tarea fue exitosa, incluir resultado
-                if task_result.successful():
-                    response.result = task_result.result
-
-                results.append(response)
-
-            except Exception as task_error:
-                # Si hay error con una tarea específica, incluir el error
-                results.append(
-                    TaskStatusResponse(
-                        task_id=task_id,
-                        status="ERROR",
-                        meta={
-                            "error_type": type(task_error).__name__,
-                            "error_message": f"Error accessing task: {str(task_error)}",
-                        },
-                    )
-                )
-
+        for task_status in statuses:
+            task_status.pop("metadata", None)
+            results.append(TaskStatusResponse(**task_status))
         return results
 
     except Exception as e:
@@ -407,66 +351,25 @@ async def get_queue_stats():
             extra={"correlation_id": correlation_id}
         )
         
-        # Obtener estadísticas de Celery con circuit breaker protection
-        stats_circuit_breaker = circuit_breaker_registry.get_circuit_breaker("celery_stats")
-        
-        async def _get_celery_stats():
-            inspect = celery_app.control.inspect()
-
-            # Tareas activas
-            active_tasks = inspect.active()
-            active_count = sum(len(tasks) for tasks in (active_tasks or {}).values())
-
-            # Tareas pendientes (scheduled + reserved)
-            scheduled_tasks = inspect.scheduled()
-            reserved_tasks = inspect.reserved()
-
-            scheduled_count = sum(len(tasks) for tasks in (scheduled_tasks or {}).values())
-            reserved_count = sum(len(tasks) for tasks in (reserved_tasks or {}).values())
-            pending_count = scheduled_count + reserved_count
-
-            # Workers online
-            stats = inspect.stats()
-            workers_online = len(stats or {})
-
-            return {
-                "active_count": active_count,
-                "pending_count": pending_count,
-                "workers_online": workers_online
-            }
-        
-        # Get Celery stats with circuit breaker protection
-        try:
-            celery_stats = await stats_circuit_breaker.call(_get_celery_stats)
-        except Exception as e:
+        # Snapshot del colector en segundo plano (sin broadcasts por request)
+        snapshot = get_queue_stats_collector().snapshot()
+        if snapshot["error"]:
             logger.warning(
-                "Celery stats failed, using fallback values",
-                extra={"correlation_id": correlation_id, "error": str(e)}
+                "Queue stats snapshot has errors",
+                extra={"correlation_id": correlation_id, "error": snapshot["error"]}
             )
-            celery_stats = {
-                "active_count": 0,
-                "pending_count": 0,
-                "workers_online": 0
-            }
-
-        # Estadísticas adicionales desde Redis con fallback
-        try:
-            completed_tasks = int(redis_client.get("completed_tasks") or 0)
-            failed_tasks = int(redis_client.get("failed_tasks") or 0)
-        except Exception as e:
-            logger.warning(
-                "Redis stats failed, using fallback values",
-                extra={"correlation_id": correlation_id, "error": str(e)}
-            )
-            completed_tasks = 0
-            failed_tasks = 0
 
         response = QueueStatsResponse(
-            active_tasks=celery_stats["active_count"],
-            pending_tasks=celery_stats["pending_count"],
-            completed_tasks=completed_tasks,
-            failed_tasks=failed_tasks,
-            workers_online=celery_stats["workers_online"],
+            active_tasks=snapshot["active_tasks"],
+            pending_tasks=snapshot["pending_tasks"],
+            completed_tasks=snapshot["completed_tasks"],
+            failed_tasks=snapshot["failed_tasks"],
+            workers_online=snapshot["workers_online"],
+            queue_lengths=snapshot["queue_lengths"],
+            task_metrics=snapshot["task_metrics"],
+            collected_at=snapshot["collected_at"],
+            age_seconds=snapshot["age_seconds"],
+            stale=snapshot["stale"],
         )
         
         logger.debug(
@@ -503,28 +406,14 @@ async def get_queue_stats():
 async def get_workers():
     """Obtener información de workers"""
     try:
-        inspect = celery_app.control.inspect()
-
-        # Información de workers
-        stats = inspect.stats() or {}
-        active = inspect.active() or {}
-
-        workers_info = []
-        for worker_name, worker_stats in stats.items():
-            workers_info.append(
-                {
-                    "name": worker_name,
-                    "status": "online",
-                    "active_tasks": len(active.get(worker_name, [])),
-                    "processed_tasks": worker_stats.get("total", {}).get(
-                        "tasks.inscription_worker.create_inscription_task", 0
-                    ),
-                    "load_avg": worker_stats.get("rusage", {}).get("utime", 0),
-                    "pool": worker_stats.get("pool", {}),
-                }
-            )
+        snapshot = get_queue_stats_collector().snapshot()
+        workers_info = list(snapshot["workers"].values())
 
-        return {"workers": workers_info}
+        return {
+            "workers": workers_info,
+            "collected_at": snapshot["collected_at"],
+            "stale": snapshot["stale"],
+        }
 
     except Exception as e:
         raise HTTPException(
@@ -634,25 +523,24 @@ async def health_check_workers():
 async def get_queues_info():
     """Obtener información de las colas"""
     try:
-        inspect = celery_app.control.inspect()
-
-        # Información de colas activas
-        active_queues = inspect.active_queues() or {}
-
-        queues_info = {}
-        for worker_name, queues in active_queues.items():
-            for queue in queues:
-                queue_name = queue.get("name", "unknown")
-                if queue_name not in queues_info:
-                    queues_info[queue_name] = {
-                        "name": queue_name,
-                        "workers": [],
-                        "routing_key": queue.get("routing_key"),
-                        "exchange": queue.get("exchange", {}).get("name"),
-                    }
-                queues_info[queue_name]["workers"].append(worker_name)
-
-        return {"queues": list(queues_info.values())}
+        snapshot = get_queue_stats_collector().snapshot()
+        queues_info = {q["name"]: q for q in snapshot["queues"]}
+        # Colas con mensajes en el broker pero sin workers consumiéndolas
+        for queue_name, length in snapshot["queue_lengths"].items():
+            if queue_name not in queues_info:
+                queues_info[queue_name] = {
+                    "name": queue_name,
+                    "workers": [],
+                    "routing_key": None,
+                    "exchange": None,
+                    "length": length,
+                }
+
+        return {
+            "queues": list(queues_info.values()),
+            "collected_at": snapshot["collected_at"],
+            "stale": snapshot["stale"],
+        }
 
     except Exception as e:
         raise HTTPException(
@@ -830,7 +718,7 @@ async def invalidate_idempotency_cache(key: str):
             extra={"correlation_id": correlation_id, "cache_key": key}
         )
         
-        success = idempotency_manager.invalidate_cache_entry(key)
+        success = await idempotency_manager.invalidate_cache_entry(key)
         
         if success:
             logger.info(
@@ -1,38 +1,38 @@
 """
 Enhanced queue endpoints with circuit breaker monitoring, saga status, and comprehensive metrics
 """
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, status, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-import redis
-import json
 import uuid
 from datetime import datetime
 from celery import current_app
-from celery.result import AsyncResult
 
 from app.core.database_sync import get_db
 from app.core.config import settings
+from app.core.id_generator import new_inscripcion_code
 from app.core.celery_app import celery_app
 from app.core.circuit_breaker import CircuitBreakerRegistry
+from app.core import codec
+from app.core.redis_client import get_async_redis
 from app.core.idempotency import get_idempotency_manager, get_inscription_idempotency
 from app.core.saga_pattern import get_saga_manager
 from app.core.enhanced_logging import get_logger, audit_logger, ContextManager
 from app.schemas import InscripcionCreate
+from app.services.queue_stats import get_queue_stats_collector
+from app.services.task_status import get_task_status_service
 from app.tasks_enhanced import (
     create_inscription_task,
     bulk_create_inscriptions_task,
     health_check_task,
     create_single_group_inscription_task,
 )
+from app.tasks import group_inscription_chord_task
 
 router = APIRouter(prefix="/queue", tags=["Enhanced Queue Management"])
 logger = get_logger("queue_endpoints")
 
-# Redis connection for additional features
-redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
-
 # Enhanced response models
 class TaskResponse(BaseModel):
     task_id: str
@@ -75,6 +75,10 @@ class QueueStatsResponse(BaseModel):
     completed_tasks: int
     failed_tasks: int
     workers_online: int
+    queue_lengths: Optional[Dict[str, int]] = None
+    task_metrics: Optional[Dict[str, Any]] = None  # throughput, p50/p95/p99 de ejecución y espera en cola
+    collected_at: Optional[str] = None
+    stale: bool = False
     circuit_breakers: Optional[Dict[str, Any]] = None
     saga_transactions: Optional[Dict[str, Any]] = None
     idempotency_cache: Optional[Dict[str, Any]] = None
@@ -97,9 +101,18 @@ class SagaStatusResponse(BaseModel):
     error: Optional[str] = None
 
 
+class SagaListResponse(BaseModel):
+    items: List[SagaStatusResponse]
+    next_cursor: Optional[str] = None
+
+
 class IdempotencyStatsResponse(BaseModel):
     total_cached_operations: int
     cache_hit_rate: Optional[float] = None
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    operations: Dict[str, Dict[str, int]] = {}
     sample_keys: List[str]
 
 
@@ -113,6 +126,11 @@ class IdempotencyStatsResponse(BaseModel):
 )
 async def create_inscription_async_by_groups_enhanced(
     inscription_data: InscripcionCreate, 
+    mode: str = Query(
+        "per-task",
+        pattern="^(per-task|chord)$",
+        description="per-task: una tarea por grupo; chord: validación única y un solo task_id con el resultado agregado"
+    ),
     db: Session = Depends(get_db)
 ):
     """Enhanced group-by-group inscription with full fault tolerance"""
@@ -130,10 +148,30 @@ async def create_inscription_async_by_groups_enhanced(
             correlation_id=correlation_id
         )
         
+        if mode == "chord":
+            task = group_inscription_chord_task.delay({
+                "registro_academico": inscription_data.registro_academico,
+                "codigo_periodo": inscription_data.codigo_periodo,
+                "grupos": inscription_data.grupos,
+                "correlation_id": correlation_id
+            })
+            logger.info(
+                "Inscription by groups queued as chord",
+                main_task_id=task.id,
+                grupos_count=len(inscription_data.grupos),
+                correlation_id=correlation_id
+            )
+            return MultipleTasksResponse(
+                main_task_id=task.id,
+                group_tasks=[],
+                status="QUEUED",
+                message=f"Inscripción encolada como chord de {len(inscription_data.grupos)} grupos; consultar main_task_id",
+                correlation_id=correlation_id,
+                total_groups=len(inscription_data.grupos)
+            )
+        
         # Generate main inscription ID
-        main_codigo_inscripcion = (
-            f"I{datetime.now().strftime('%y%m%d')}{str(uuid.uuid4())[:3].upper()}"
-        )
+        main_codigo_inscripcion = await new_inscripcion_code()
         
         # Base data for all tasks
         base_data = {
@@ -157,10 +195,10 @@ async def create_inscription_async_by_groups_enhanced(
                     "created_at": datetime.now().isoformat(),
                     "inscription_type": "single_group"
                 }
-                redis_client.setex(
+                await get_async_redis().setex(
                     f"task_metadata:{task.id}",
                     3600,  # 1 hour TTL
-                    json.dumps(task_metadata)
+                    codec.dumps(task_metadata)
                 )
                 
             except Exception as e:
@@ -239,80 +277,19 @@ async def get_multiple_tasks_status_enhanced(task_ids: List[str]):
             correlation_id=correlation_id
         )
         
+        statuses = await get_task_status_service().get_statuses(task_ids)
+
         results = []
-        for task_id in task_ids:
-            try:
-                task_result = AsyncResult(task_id, app=celery_app)
-                
-                # Get task metadata from Redis
-                metadata_key = f"task_metadata:{task_id}"
-                metadata_json = redis_client.get(metadata_key)
-                metadata = {}
-                if metadata_json:
-                    try:
-                        metadata = json.loads(metadata_json)
-                    except json.JSONDecodeError:
-                        logger.warning(f"Invalid metadata JSON for task {task_id}")
-                
-                response = TaskStatusResponse(
-                    task_id=task_id,
-                    status=task_result.status,
-                    correlation_id=metadata.get("correlation_id"),
-                    created_at=metadata.get("created_at")
-                )
-                
-                # Enhanced result handling
-                try:
-                    if task_result.successful():
-                        result_data = task_result.result
-                        response.result = result_data
-                        response.saga_id = result_data.get("saga_id") if isinstance(result_data, dict) else None
-                        response.completed_at = datetime.now().isoformat()
-                        
-                    elif task_result.failed():
-                        exc = task_result.info
-                        response.meta = {
-                            "error_type": type(exc).__name__ if exc else None,
-                            "error_message": str(exc),
-                            "retry_count": getattr(task_result, 'retries', 0)
-                        }
-                        
-                    elif task_result.state in ['PENDING', 'STARTED', 'PROGRESS']:
-                        if isinstance(task_result.info, dict):
-                            response.meta = task_result.info
-                            response.current = task_result.info.get("current")
-                            response.total = task_result.info.get("total")
-                        else:
-                            response.meta = {
-                                "message": f"Task is in {task_result.status} state"
-                            }
-                            
-                except Exception as info_error:
-                    response.meta = {
-                        "error_type": "TaskInfoError",
-                        "error_message": f"Error accessing task info: {str(info_error)}"
-                    }
-                
-                results.append(response)
-                
-            except Exception as task_error:
-                logger.error(
-                    f"Error processing task {task_id}",
-                    error=str(task_error),
-                    correlation_id=correlation_id
-                )
-                
-                results.append(
-                    TaskStatusResponse(
-                        task_id=task_id,
-                        status="ERROR",
-                        meta={
-                            "error_type": type(task_error).__name__,
-                            "error_message": f"Error accessing task: {str(task_error)}"
-                        },
-                        correlation_id=correlation_id
-                    )
-                )
+        for task_status in statuses:
+            metadata = task_status.pop("metadata")
+            response = TaskStatusResponse(
+                **task_status,
+                correlation_id=metadata.get("correlation_id"),
+                created_at=metadata.get("created_at")
+            )
+            if isinstance(response.result, dict):
+                response.saga_id = response.result.get("saga_id")
+            results.append(response)
         
         logger.info(
             "Multiple task status check completed",
@@ -352,50 +329,36 @@ async def get_enhanced_queue_stats():
     try:
         logger.info("Gathering enhanced system statistics", correlation_id=correlation_id)
         
-        # Basic Celery stats
-        inspect = celery_app.control.inspect()
-        
-        active_tasks = inspect.active()
-        active_count = sum(len(tasks) for tasks in (active_tasks or {}).values())
-        
-        scheduled_tasks = inspect.scheduled()
-        reserved_tasks = inspect.reserved()
-        
-        scheduled_count = sum(len(tasks) for tasks in (scheduled_tasks or {}).values())
-        reserved_count = sum(len(tasks) for tasks in (reserved_tasks or {}).values())
-        pending_count = scheduled_count + reserved_count
-        
-        stats = inspect.stats()
-        workers_online = len(stats or {})
-        
-        # Redis-based counters
-        try:
-            completed_tasks = int(redis_client.get("completed_tasks") or 0)
-            failed_tasks = int(redis_client.get("failed_tasks") or 0)
-        except:
-            completed_tasks = 0
-            failed_tasks = 0
+        # Snapshot del colector en segundo plano (sin broadcasts por request)
+        snapshot = get_queue_stats_collector().snapshot()
+        active_count = snapshot["active_tasks"]
+        workers_online = snapshot["workers_online"]
         
         # Circuit breaker stats
         circuit_breaker_stats = CircuitBreakerRegistry.get_all_stats()
         
         # Saga transaction stats
-        saga_manager = get_saga_manager(redis_client)
+        saga_manager = get_saga_manager(get_async_redis())
+        saga_counts = await saga_manager.count_sagas()
         saga_stats = {
-            "active_sagas": len(saga_manager.active_sagas),
-            "total_sagas": len(saga_manager.get_all_sagas_status())
+            "active_sagas": saga_counts["active"],
+            "total_sagas": saga_counts["total"]
         }
         
         # Idempotency cache stats
-        idempotency_manager = get_idempotency_manager(redis_client)
-        idempotency_stats = idempotency_manager.get_stats()
+        idempotency_manager = get_idempotency_manager()
+        idempotency_stats = await idempotency_manager.get_stats()
         
         response = QueueStatsResponse(
             active_tasks=active_count,
-            pending_tasks=pending_count,
-            completed_tasks=completed_tasks,
-            failed_tasks=failed_tasks,
+            pending_tasks=snapshot["pending_tasks"],
+            completed_tasks=snapshot["completed_tasks"],
+            failed_tasks=snapshot["failed_tasks"],
             workers_online=workers_online,
+            queue_lengths=snapshot["queue_lengths"],
+            task_metrics=snapshot["task_metrics"],
+            collected_at=snapshot["collected_at"],
+            stale=snapshot["stale"],
             circuit_breakers=circuit_breaker_stats,
             saga_transactions=saga_stats,
             idempotency_cache=idempotency_stats
@@ -464,16 +427,19 @@ async def get_circuit_breaker_status():
 
 @router.get(
     "/sagas",
-    response_model=List[SagaStatusResponse],
+    response_model=SagaListResponse,
     summary="Estado de transacciones Saga",
-    description="Monitoreo de todas las transacciones Saga activas"
+    description="Transacciones Saga de todo el cluster (más recientes primero), paginadas con next_cursor"
 )
-async def get_saga_transactions():
-    """Get status of all saga transactions"""
+async def get_saga_transactions(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior")
+):
+    """Get status of saga transactions from the durable saga log"""
     
     try:
-        saga_manager = get_saga_manager(redis_client)
-        saga_statuses = saga_manager.get_all_sagas_status()
+        saga_manager = get_saga_manager(get_async_redis())
+        saga_statuses, next_cursor = await saga_manager.get_all_sagas_status(limit=limit, cursor=cursor)
         
         responses = []
         for saga_status in saga_statuses:
@@ -490,7 +456,7 @@ async def get_saga_transactions():
                 )
             )
         
-        return responses
+        return SagaListResponse(items=responses, next_cursor=next_cursor)
         
     except Exception as e:
         logger.error("Failed to get saga transactions", error=str(e))
@@ -510,16 +476,16 @@ async def get_idempotency_stats():
     """Get idempotency cache statistics"""
     
     try:
-        idempotency_manager = get_idempotency_manager(redis_client)
-        stats = idempotency_manager.get_stats()
-        
-        # Calculate cache hit rate if possible
-        cache_hit_rate = None
-        # This would require additional metrics collection in production
+        idempotency_manager = get_idempotency_manager()
+        stats = await idempotency_manager.get_stats()
         
         return IdempotencyStatsResponse(
             total_cached_operations=stats.get("total_cached_operations", 0),
-            cache_hit_rate=cache_hit_rate,
+            cache_hit_rate=stats.get("hit_rate"),
+            hits=stats.get("hits", 0),
+            misses=stats.get("misses", 0),
+            expired=stats.get("expired", 0),
+            operations=stats.get("operations", {}),
             sample_keys=stats.get("sample_keys", [])
         )
         
@@ -570,8 +536,8 @@ async def invalidate_idempotency_cache(operation_key: str):
     """Invalidate specific idempotency cache entry"""
     
     try:
-        idempotency_manager = get_idempotency_manager(redis_client)
-        success = idempotency_manager.invalidate(operation_key)
+        idempotency_manager = get_idempotency_manager()
+        success = await idempotency_manager.invalidate(operation_key)
         
         if success:
             logger.info(f"Idempotency cache invalidated for key: {operation_key}")
@@ -607,10 +573,10 @@ async def enhanced_health_check():
             "created_at": datetime.now().isoformat(),
             "task_type": "enhanced_health_check"
         }
-        redis_client.setex(
+        await get_async_redis().setex(
             f"task_metadata:{task.id}",
             300,  # 5 minutes TTL
-            json.dumps(task_metadata)
+            codec.dumps(task_metadata)
         )
         
         return TaskResponse(
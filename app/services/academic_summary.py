@@ -0,0 +1,263 @@
+"""
+Resumen académico materializado por estudiante en Redis.
+
+Cada estudiante tiene un hash `resumen_academico:<registro_academico>` con los
+agregados de su historial: total de materias, materias por estado, cantidad y
+suma (en centésimas) de notas aprobadas y créditos aprobados. Los servicios de
+historial aplican el delta de cada registro después del commit, así que leer un
+resumen es un HGETALL y no una agregación sobre todo el historial.
+
+Si el hash no existe se calcula desde Postgres y se carga. Para no cargar un
+valor viejo cuando un commit concurrente aplicó su delta entre la consulta y la
+carga, cada delta incrementa `resumen_academico:gen:<registro>` y la carga solo
+se hace si esa generación no cambió.
+
+Uso como comando de reconstrucción (con el tráfico de historial detenido):
+    python -m app.services.academic_summary rebuild [--registro REGISTRO]
+"""
+import argparse
+import asyncio
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import redis.asyncio as aioredis
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.logging import get_logger
+from app.core.redis_client import close_async_redis, get_async_redis
+from app.models import HistorialAcademico, Materia
+from app.schemas import ResumenAcademico
+
+logger = get_logger(__name__)
+
+SUMMARY_PREFIX = "resumen_academico:"
+GENERATION_PREFIX = "resumen_academico:gen:"
+
+ESTADO_FIELDS = {"APROBADA": "aprobadas", "REPROBADA": "reprobadas", "RETIRADA": "retiradas"}
+FIELDS = ("total", "aprobadas", "reprobadas", "retiradas", "notas_aprobadas", "suma_notas", "creditos_aprobados")
+
+# KEYS[1] = hash del resumen, KEYS[2] = generación; ARGV = pares (campo, delta).
+# Los deltas solo se aplican a resúmenes ya cargados.
+_APPLY_LUA = """
+redis.call('INCR', KEYS[2])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 1, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+# KEYS[1] = hash del resumen, KEYS[2] = generación; ARGV[1] = generación leída
+# antes de consultar la base, ARGV[2..] = pares (campo, valor).
+_PRIME_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+
+def _summary_key(registro_academico: str) -> str:
+    return f"{SUMMARY_PREFIX}{registro_academico}"
+
+
+def _generation_key(registro_academico: str) -> str:
+    return f"{GENERATION_PREFIX}{registro_academico}"
+
+
+def historial_contribution(estado: Optional[str], nota_final, creditos: Optional[int]) -> Dict[str, int]:
+    """Aporte de un registro de historial a los campos del resumen"""
+    aporte = dict.fromkeys(FIELDS, 0)
+    if estado is None:
+        return aporte
+    aporte["total"] = 1
+    campo_estado = ESTADO_FIELDS.get(estado)
+    if campo_estado:
+        aporte[campo_estado] = 1
+    if estado == "APROBADA":
+        aporte["creditos_aprobados"] = creditos or 0
+        if nota_final is not None:
+            aporte["notas_aprobadas"] = 1
+            aporte["suma_notas"] = int(Decimal(nota_final) * 100)
+    return aporte
+
+
+def _aggregate_query():
+    """Agregados del historial por estudiante (misma definición que los deltas)"""
+    aprobada = HistorialAcademico.estado == "APROBADA"
+    return (
+        select(
+            HistorialAcademico.registro_academico,
+            func.count(HistorialAcademico.id_historial).label("total"),
+            func.count(case((aprobada, 1))).label("aprobadas"),
+            func.count(case((HistorialAcademico.estado == "REPROBADA", 1))).label("reprobadas"),
+            func.count(case((HistorialAcademico.estado == "RETIRADA", 1))).label("retiradas"),
+            func.count(case((aprobada, HistorialAcademico.nota_final))).label("notas_aprobadas"),
+            func.coalesce(func.sum(case((aprobada, HistorialAcademico.nota_final * 100))), 0).label("suma_notas"),
+            func.coalesce(func.sum(case((aprobada, Materia.creditos))), 0).label("creditos_aprobados"),
+        )
+        .select_from(HistorialAcademico)
+        .outerjoin(Materia, Materia.sigla == HistorialAcademico.sigla_materia)
+        .group_by(HistorialAcademico.registro_academico)
+    )
+
+
+def _row_fields(row) -> Dict[str, int]:
+    return {field: int(getattr(row, field) or 0) for field in FIELDS}
+
+
+class AcademicSummaryStore:
+    """Resúmenes académicos materializados en Redis"""
+
+    def __init__(self, redis_client: aioredis.Redis):
+        self.redis_client = redis_client
+        self._apply = redis_client.register_script(_APPLY_LUA)
+        self._prime = redis_client.register_script(_PRIME_LUA)
+
+    async def apply(self, registro_academico: str, antes: Dict[str, int], despues: Dict[str, int]) -> None:
+        """
+        Aplicar el cambio de un registro de historial (llamar después del commit).
+        Si Redis falla se borra el resumen para que la próxima lectura lo recalcule.
+        """
+        args: List[object] = []
+        for field in FIELDS:
+            delta = despues.get(field, 0) - antes.get(field, 0)
+            if delta:
+                args.extend([field, delta])
+        keys = [_summary_key(registro_academico), _generation_key(registro_academico)]
+        try:
+            await self._apply(keys=keys, args=args)
+        except Exception as e:
+            logger.warning(f"No se pudo actualizar el resumen académico de {registro_academico}: {e}")
+            try:
+                await self.redis_client.delete(keys[0])
+            except Exception:
+                logger.error(f"Resumen académico de {registro_academico} posiblemente desactualizado; ejecutar rebuild")
+
+    async def invalidate_many(self, registros: List[str]) -> None:
+        """Descartar resúmenes (p. ej. tras una importación masiva); se recalculan al leerlos"""
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for registro in registros:
+                    pipe.incr(_generation_key(registro))
+                    pipe.delete(_summary_key(registro))
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"No se pudieron invalidar {len(registros)} resúmenes académicos; ejecutar rebuild: {e}")
+
+    async def get(self, db: AsyncSession, registro_academico: str) -> ResumenAcademico:
+        """Resumen del estudiante; si no está materializado se calcula y se carga"""
+        keys = [_summary_key(registro_academico), _generation_key(registro_academico)]
+        try:
+            raw = await self.redis_client.hgetall(keys[0])
+            generation = None if raw else await self.redis_client.get(keys[1])
+        except Exception as e:
+            logger.warning(f"Resumen académico de {registro_academico} no disponible en Redis: {e}")
+            return self._to_schema(registro_academico, await self._compute(db, registro_academico))
+
+        if raw:
+            fields = {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()}
+            return self._to_schema(registro_academico, fields)
+
+        fields = await self._compute(db, registro_academico)
+        args: List[object] = [int(generation or 0)]
+        for field in FIELDS:
+            args.extend([field, fields[field]])
+        try:
+            await self._prime(keys=keys, args=args)
+        except Exception as e:
+            logger.warning(f"No se pudo materializar el resumen académico de {registro_academico}: {e}")
+        return self._to_schema(registro_academico, fields)
+
+    async def _compute(self, db: AsyncSession, registro_academico: str) -> Dict[str, int]:
+        result = await db.execute(
+            _aggregate_query().where(HistorialAcademico.registro_academico == registro_academico)
+        )
+        row = result.one_or_none()
+        return _row_fields(row) if row is not None else dict.fromkeys(FIELDS, 0)
+
+    @staticmethod
+    def _to_schema(registro_academico: str, fields: Dict[str, int]) -> ResumenAcademico:
+        notas = fields.get("notas_aprobadas", 0)
+        promedio = None
+        if notas:
+            promedio = (Decimal(fields.get("suma_notas", 0)) / 100 / notas).quantize(Decimal("0.01"))
+        return ResumenAcademico(
+            registro_academico=registro_academico,
+            total_materias=fields.get("total", 0),
+            materias_aprobadas=fields.get("aprobadas", 0),
+            materias_reprobadas=fields.get("reprobadas", 0),
+            materias_retiradas=fields.get("retiradas", 0),
+            promedio_general=promedio,
+            creditos_aprobados=fields.get("creditos_aprobados", 0)
+        )
+
+    async def rebuild(self, db: AsyncSession, registro_academico: Optional[str] = None, batch_size: int = 1000) -> int:
+        """
+        Recalcular los resúmenes desde Postgres con una sola agregación. Sin
+        `registro_academico` reemplaza todos los resúmenes existentes.
+        """
+        query = _aggregate_query()
+        if registro_academico is not None:
+            query = query.where(HistorialAcademico.registro_academico == registro_academico)
+
+        if registro_academico is None:
+            # Resúmenes de estudiantes que ya no tienen historial
+            async for key in self.redis_client.scan_iter(match=f"{SUMMARY_PREFIX}*", count=batch_size):
+                if not (key.decode() if isinstance(key, bytes) else key).startswith(GENERATION_PREFIX):
+                    await self.redis_client.delete(key)
+        else:
+            await self.redis_client.delete(_summary_key(registro_academico))
+
+        total = 0
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for row in rows:
+                    key = _summary_key(row.registro_academico)
+                    pipe.delete(key)
+                    pipe.hset(key, mapping=_row_fields(row))
+                    pipe.incr(_generation_key(row.registro_academico))
+                await pipe.execute()
+            total += len(rows)
+        logger.info(f"Resúmenes académicos reconstruidos para {total} estudiantes")
+        return total
+
+
+_summary_store: Optional[AcademicSummaryStore] = None
+
+
+def get_academic_summary_store() -> AcademicSummaryStore:
+    """Obtener el almacén de resúmenes académicos del proceso actual"""
+    global _summary_store
+    if _summary_store is None:
+        _summary_store = AcademicSummaryStore(get_async_redis())
+    return _summary_store
+
+
+async def _main(argv: Optional[List[str]] = None) -> None:
+    from app.core.database import AsyncSessionLocal
+
+    parser = argparse.ArgumentParser(description="Resúmenes académicos materializados")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--registro", help="Reconstruir solo el resumen de este estudiante")
+    args = parser.parse_args(argv)
+
+    store = get_academic_summary_store()
+    async with AsyncSessionLocal() as db:
+        total = await store.rebuild(db, registro_academico=args.registro)
+        print(f"Resúmenes reconstruidos: {total}")
+    await close_async_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,9 +1,9 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_
+from sqlalchemy import select, func, and_, or_, tuple_
 from sqlalchemy.orm import selectinload
-from typing import List, Optional, Dict, Any
-from datetime import date, datetime
-import uuid
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
+import base64
+from datetime import date
 
 from app.models import (
     Inscripcion, DetalleInscripcion, PeriodoAcademico, 
@@ -27,13 +27,33 @@ from app.exceptions import (
     ConflictoHorarioException,
     InscripcionDuplicadaException,
     GrupoDuplicadoException,
-    InscripcionNoEncontradaException
+    InscripcionNoEncontradaException,
+    ValidationException
 )
+from app.core.id_generator import new_detalle_codes, new_inscripcion_code
 from app.core.logging import get_logger
+from app.services.catalog_cache import get_catalog_cache
+from app.services.schedule_index import get_schedule_index
+from app.services.seat_ledger import commit_releasing_seats, hold_grupo_seats
 
 # Logger específico para este servicio
 logger = get_logger(__name__)
 
+
+def encode_periodo_cursor(fecha_inscripcion: date, codigo_inscripcion: str) -> str:
+    """Cursor opaco con la última clave (fecha, código) de una página"""
+    raw = f"{fecha_inscripcion.isoformat()}|{codigo_inscripcion}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_periodo_cursor(cursor: str) -> Tuple[date, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        fecha, codigo = raw.split("|", 1)
+        return date.fromisoformat(fecha), codigo
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationException("cursor", cursor, "Cursor de paginación inválido")
+
 class InscripcionService:
     
     def __init__(self, db: AsyncSession):
@@ -43,7 +63,7 @@ class InscripcionService:
         """Crear una nueva inscripción con sus detalles"""
         
         # Generar código único para la inscripción (max 10 caracteres)
-        codigo_inscripcion = f"I{datetime.now().strftime('%y%m%d')}{str(uuid.uuid4())[:3].upper()}"
+        codigo_inscripcion = await new_inscripcion_code(self.db)
         
         logger.info(f"Crear inscripción para {inscripcion_data.registro_academico} periodo {inscripcion_data.codigo_periodo}")
         # Verificar que el estudiante existe y no esté bloqueado
@@ -84,51 +104,51 @@ class InscripcionService:
                 existing.codigo_inscripcion
             )
 
-        # Validar grupos y disponibilidad
-        await self._validate_grupos_disponibilidad(inscripcion_data.grupos)
+        # Validar conflictos y reservar cupos de todos los grupos (ledger en Redis
+        # o una sola sentencia UPDATE, según configuración)
         await self._validate_horarios_conflicto(inscripcion_data.grupos)
+        async with hold_grupo_seats(
+            self.db,
+            inscripcion_data.grupos,
+            owner=(inscripcion_data.registro_academico, inscripcion_data.codigo_periodo)
+        ):
+            logger.info(f"Cupos reservados para grupos {inscripcion_data.grupos}")
 
-        # Crear la inscripción
-        nueva_inscripcion = Inscripcion(
-            codigo_inscripcion=codigo_inscripcion,
-            registro_academico=inscripcion_data.registro_academico,
-            codigo_periodo=inscripcion_data.codigo_periodo,
-            fecha_inscripcion=date.today()
-        )
-
-        self.db.add(nueva_inscripcion)
-        await self.db.flush()
-
-        # Crear los detalles de inscripción
-        detalles_creados = []
-        for codigo_grupo in inscripcion_data.grupos:
-            codigo_detalle = f"D{datetime.now().strftime('%y%m%d')}{str(uuid.uuid4())[:3].upper()}"
-
-            detalle = DetalleInscripcion(
-                codigo_detalle=codigo_detalle,
+            # Crear la inscripción
+            nueva_inscripcion = Inscripcion(
                 codigo_inscripcion=codigo_inscripcion,
-                codigo_grupo=codigo_grupo
+                registro_academico=inscripcion_data.registro_academico,
+                codigo_periodo=inscripcion_data.codigo_periodo,
+                fecha_inscripcion=date.today()
             )
 
-            self.db.add(detalle)
-            detalles_creados.append(detalle)
+            self.db.add(nueva_inscripcion)
+            await self.db.flush()
+
+            # Crear los detalles de inscripción
+            detalles_creados = []
+            codigos_detalle = await new_detalle_codes(len(inscripcion_data.grupos), self.db)
+            for codigo_grupo, codigo_detalle in zip(inscripcion_data.grupos, codigos_detalle):
+                detalle = DetalleInscripcion(
+                    codigo_detalle=codigo_detalle,
+                    codigo_inscripcion=codigo_inscripcion,
+                    codigo_grupo=codigo_grupo
+                )
 
-            # Actualizar contador de inscritos en el grupo
-            await self._increment_grupo_inscritos(codigo_grupo)
-            logger.info(f"Incrementado inscritos para grupo {codigo_grupo}")
+                self.db.add(detalle)
+                detalles_creados.append(detalle)
 
-        await self.db.commit()
+            await self.db.commit()
 
-        # Recargar la inscripción con relaciones
+        # Recargar la inscripción con las relaciones que expone InscripcionResponse
+        # (los datos de grupo se sirven desde la caché de catálogo)
         result = await self.db.execute(
             select(Inscripcion)
+            .execution_options(populate_existing=True)
             .options(
                 selectinload(Inscripcion.estudiante),
                 selectinload(Inscripcion.periodo_academico),
-                selectinload(Inscripcion.detalles).selectinload(DetalleInscripcion.grupo).selectinload(Grupo.materia),
-                selectinload(Inscripcion.detalles).selectinload(DetalleInscripcion.grupo).selectinload(Grupo.docente),
-                selectinload(Inscripcion.detalles).selectinload(DetalleInscripcion.grupo).selectinload(Grupo.aula),
-                selectinload(Inscripcion.detalles).selectinload(DetalleInscripcion.grupo).selectinload(Grupo.horario)
+                selectinload(Inscripcion.detalles)
             )
             .where(Inscripcion.codigo_inscripcion == codigo_inscripcion)
         )
@@ -143,10 +163,7 @@ class InscripcionService:
             .options(
                 selectinload(Inscripcion.estudiante),
                 selectinload(Inscripcion.periodo_academico),
-                selectinload(Inscripcion.detalles).selectinload(DetalleInscripcion.grupo).selectinload(Grupo.materia),
-                selectinload(Inscripcion.detalles).selectinload(DetalleInscripcion.grupo).selectinload(Grupo.docente),
-                selectinload(Inscripcion.detalles).selectinload(DetalleInscripcion.grupo).selectinload(Grupo.aula),
-                selectinload(Inscripcion.detalles).selectinload(DetalleInscripcion.grupo).selectinload(Grupo.horario)
+                selectinload(Inscripcion.detalles)
             )
             .where(Inscripcion.codigo_inscripcion == codigo_inscripcion)
         )
@@ -154,102 +171,117 @@ class InscripcionService:
     
     async def get_inscripciones_by_estudiante(self, registro_academico: str) -> List[Dict[str, Any]]:
         """Obtener todas las inscripciones de un estudiante"""
-        from sqlalchemy.orm import selectinload
+        # Una sola consulta para inscripciones, detalles y contadores de cupo;
+        # materia/docente/aula/horario salen de la caché de catálogo
         result = await self.db.execute(
-            select(Inscripcion)
-            .options(
-                selectinload(Inscripcion.detalles)
-                .selectinload(DetalleInscripcion.grupo)
-                .selectinload(Grupo.materia),
-                selectinload(Inscripcion.detalles)
-                .selectinload(DetalleInscripcion.grupo)
-                .selectinload(Grupo.docente),
-                selectinload(Inscripcion.detalles)
-                .selectinload(DetalleInscripcion.grupo)
-                .selectinload(Grupo.aula),
-                selectinload(Inscripcion.detalles)
-                .selectinload(DetalleInscripcion.grupo)
-                .selectinload(Grupo.horario)
+            select(
+                Inscripcion.codigo_inscripcion,
+                Inscripcion.registro_academico,
+                Inscripcion.codigo_periodo,
+                Inscripcion.fecha_inscripcion,
+                DetalleInscripcion.codigo_detalle,
+                Grupo.codigo_grupo,
+                Grupo.cupo,
+                Grupo.inscritos_actuales
             )
+            .outerjoin(DetalleInscripcion, DetalleInscripcion.codigo_inscripcion == Inscripcion.codigo_inscripcion)
+            .outerjoin(Grupo, DetalleInscripcion.codigo_grupo == Grupo.codigo_grupo)
             .where(Inscripcion.registro_academico == registro_academico)
-            .order_by(Inscripcion.fecha_inscripcion.desc())
+            .order_by(Inscripcion.fecha_inscripcion.desc(), Inscripcion.codigo_inscripcion)
         )
-        inscripciones = result.scalars().all()
+        rows = result.all()
 
-        inscripciones_dto = []
-        for inscripcion in inscripciones:
-            detalles = []
-            for detalle in inscripcion.detalles:
-                grupo = detalle.grupo
-                materia = grupo.materia
-                docente = grupo.docente
-                aula = grupo.aula
-                horario = grupo.horario
-                detalles.append({
-                    "codigo_detalle": detalle.codigo_detalle,
-                    "grupo": {
-                        "codigo_grupo": grupo.codigo_grupo,
-                        "sigla_materia": grupo.sigla_materia,
-                        "materia": {
-                            "sigla": materia.sigla,
-                            "nombre": materia.nombre,
-                            "creditos": materia.creditos,
-                            "es_electiva": materia.es_electiva
-                        } if materia else None,
-                        "descripcion": grupo.descripcion,
-                        "docente": {
-                            "codigo_docente": docente.codigo_docente,
-                            "nombre": docente.nombre,
-                            "apellido": docente.apellido
-                        } if docente else None,
-                        "aula": {
-                            "codigo_aula": aula.codigo_aula,
-                            "modulo": aula.modulo,
-                            "aula": aula.aula,
-                            "ubicacion": aula.ubicacion
-                        } if aula else None,
-                        "horario": {
-                            "codigo_horario": horario.codigo_horario,
-                            "dias_semana": horario.dias_semana,
-                            "hora_inicio": str(horario.hora_inicio),
-                            "hora_fin": str(horario.hora_fin)
-                        } if horario else None,
-                        "cupo": grupo.cupo,
-                        "inscritos_actuales": grupo.inscritos_actuales
-                    }
-                })
-            inscripcion_dict = {
-                "codigo_inscripcion": inscripcion.codigo_inscripcion,
-                "registro_academico": inscripcion.registro_academico,
-                "codigo_periodo": inscripcion.codigo_periodo,
-                "fecha_inscripcion": inscripcion.fecha_inscripcion,
-                "detalles": detalles
-            }
-            inscripciones_dto.append(inscripcion_dict)
+        catalogo = await get_catalog_cache().get_grupos(
+            self.db, {row.codigo_grupo for row in rows if row.codigo_grupo}
+        )
+
+        inscripciones_dto: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            inscripcion_dict = inscripciones_dto.get(row.codigo_inscripcion)
+            if inscripcion_dict is None:
+                inscripcion_dict = {
+                    "codigo_inscripcion": row.codigo_inscripcion,
+                    "registro_academico": row.registro_academico,
+                    "codigo_periodo": row.codigo_periodo,
+                    "fecha_inscripcion": row.fecha_inscripcion,
+                    "detalles": []
+                }
+                inscripciones_dto[row.codigo_inscripcion] = inscripcion_dict
 
-        return inscripciones_dto
+            if row.codigo_detalle is None or row.codigo_grupo is None:
+                continue
+            grupo = dict(catalogo.get(row.codigo_grupo) or {"codigo_grupo": row.codigo_grupo})
+            grupo["cupo"] = row.cupo
+            grupo["inscritos_actuales"] = row.inscritos_actuales
+            inscripcion_dict["detalles"].append({
+                "codigo_detalle": row.codigo_detalle,
+                "grupo": grupo
+            })
+
+        return list(inscripciones_dto.values())
     
-    async def get_inscripciones_by_periodo(self, codigo_periodo: str) -> List[Dict[str, Any]]:
-        """Obtener todas las inscripciones de un período"""
-        result = await self.db.execute(
-            select(Inscripcion)
+    async def get_inscripciones_by_periodo(
+        self,
+        codigo_periodo: str,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Página de inscripciones de un período ordenadas por
+        (fecha_inscripcion, codigo_inscripcion) descendente, con paginación por
+        cursor (keyset): cada página es un range scan, sin OFFSET.
+        """
+        query = (
+            select(
+                Inscripcion.codigo_inscripcion,
+                Inscripcion.registro_academico,
+                Inscripcion.codigo_periodo,
+                Inscripcion.fecha_inscripcion
+            )
             .where(Inscripcion.codigo_periodo == codigo_periodo)
-            .order_by(Inscripcion.fecha_inscripcion.desc())
+            .order_by(Inscripcion.fecha_inscripcion.desc(), Inscripcion.codigo_inscripcion.desc())
+            .limit(limit + 1)
         )
-        inscripciones = result.scalars().all()
-        
-        # Convertir a diccionarios simples
-        inscripciones_dto = []
-        for inscripcion in inscripciones:
-            inscripcion_dict = {
-                "codigo_inscripcion": inscripcion.codigo_inscripcion,
-                "registro_academico": inscripcion.registro_academico,
-                "codigo_periodo": inscripcion.codigo_periodo,
-                "fecha_inscripcion": inscripcion.fecha_inscripcion
+        if cursor:
+            fecha, codigo = decode_periodo_cursor(cursor)
+            query = query.where(
+                tuple_(Inscripcion.fecha_inscripcion, Inscripcion.codigo_inscripcion) < tuple_(fecha, codigo)
+            )
+
+        rows = (await self.db.execute(query)).all()
+        inscripciones_dto = [
+            {
+                "codigo_inscripcion": row.codigo_inscripcion,
+                "registro_academico": row.registro_academico,
+                "codigo_periodo": row.codigo_periodo,
+                "fecha_inscripcion": row.fecha_inscripcion
             }
-            inscripciones_dto.append(inscripcion_dict)
-        
-        return inscripciones_dto
+            for row in rows[:limit]
+        ]
+
+        next_cursor = None
+        if len(rows) > limit:
+            ultima = rows[limit - 1]
+            next_cursor = encode_periodo_cursor(ultima.fecha_inscripcion, ultima.codigo_inscripcion)
+        return inscripciones_dto, next_cursor
+
+    async def stream_inscripciones_by_periodo(
+        self,
+        codigo_periodo: str,
+        batch_size: int = 1000
+    ) -> AsyncIterator[Inscripcion]:
+        """
+        Todas las inscripciones de un período con un cursor del servidor:
+        se traen de a `batch_size` filas, la memoria no crece con el período.
+        """
+        result = await self.db.stream_scalars(
+            select(Inscripcion)
+            .where(Inscripcion.codigo_periodo == codigo_periodo)
+            .order_by(Inscripcion.fecha_inscripcion.desc(), Inscripcion.codigo_inscripcion.desc())
+            .execution_options(yield_per=batch_size)
+        )
+        async for inscripcion in result:
+            yield inscripcion
     
     async def update_inscripcion(self, codigo_inscripcion: str, inscripcion_data: InscripcionUpdate) -> Optional[Inscripcion]:
         """Actualizar una inscripción"""
@@ -284,17 +316,15 @@ class InscripcionService:
         if not inscripcion:
             return False
         
-        # Decrementar contadores de grupos
-        for detalle in inscripcion.detalles:
-            await self._decrement_grupo_inscritos(detalle.codigo_grupo)
+        codigos_grupos = [detalle.codigo_grupo for detalle in inscripcion.detalles]
         
         # Eliminar detalles
         for detalle in inscripcion.detalles:
             await self.db.delete(detalle)
         
-        # Eliminar inscripción
+        # Eliminar inscripción y decrementar contadores de grupos
         await self.db.delete(inscripcion)
-        await self.db.commit()
+        await commit_releasing_seats(self.db, codigos_grupos)
         
         return True
     
@@ -323,26 +353,28 @@ class InscripcionService:
                 inscripcion.codigo_periodo
             )
 
-        # Validar disponibilidad del grupo
-        await self._validate_grupos_disponibilidad([codigo_grupo])
-
         # Validar conflictos de horario
         grupos_actuales = [d.codigo_grupo for d in inscripcion.detalles]
         grupos_actuales.append(codigo_grupo)
         await self._validate_horarios_conflicto(grupos_actuales)
 
-        # Crear el detalle
-        codigo_detalle = f"D{datetime.now().strftime('%y%m%d')}{str(uuid.uuid4())[:3].upper()}"
-        nuevo_detalle = DetalleInscripcion(
-            codigo_detalle=codigo_detalle,
-            codigo_inscripcion=codigo_inscripcion,
-            codigo_grupo=codigo_grupo
-        )
+        # Reservar el cupo del grupo (falla si no existe o está lleno)
+        async with hold_grupo_seats(
+            self.db,
+            [codigo_grupo],
+            owner=(inscripcion.registro_academico, inscripcion.codigo_periodo)
+        ):
+            # Crear el detalle
+            codigo_detalle = (await new_detalle_codes(1, self.db))[0]
+            nuevo_detalle = DetalleInscripcion(
+                codigo_detalle=codigo_detalle,
+                codigo_inscripcion=codigo_inscripcion,
+                codigo_grupo=codigo_grupo
+            )
 
-        self.db.add(nuevo_detalle)
-        await self._increment_grupo_inscritos(codigo_grupo)
-        logger.info(f"Incrementado inscritos para grupo {codigo_grupo} (add)")
-        await self.db.commit()
+            self.db.add(nuevo_detalle)
+            logger.info(f"Cupo reservado para grupo {codigo_grupo} (add)")
+            await self.db.commit()
         logger.info(f"Detalle {codigo_detalle} agregado a inscripcion {codigo_inscripcion}")
         return nuevo_detalle
     
@@ -364,9 +396,8 @@ class InscripcionService:
             return False
 
         await self.db.delete(detalle)
-        await self._decrement_grupo_inscritos(codigo_grupo)
+        await commit_releasing_seats(self.db, [codigo_grupo])
         logger.info(f"Decrementado inscritos para grupo {codigo_grupo} (remove)")
-        await self.db.commit()
         logger.info(f"Grupo {codigo_grupo} removido de inscripcion {codigo_inscripcion}")
         return True
     
@@ -421,74 +452,20 @@ class InscripcionService:
         )
         return result.scalar_one_or_none()
     
-    async def _validate_grupos_disponibilidad(self, codigos_grupos: List[str]):
-        """Validar que los grupos tengan cupo disponible"""
-        for codigo_grupo in codigos_grupos:
-            result = await self.db.execute(
-                select(Grupo).where(Grupo.codigo_grupo == codigo_grupo)
-            )
-            grupo = result.scalar_one_or_none()
-            
-            if not grupo:
-                raise GrupoNoEncontradoException(codigo_grupo)
-            
-            if grupo.inscritos_actuales >= grupo.cupo:
-                raise GrupoSinCupoException(
-                    codigo_grupo,
-                    grupo.cupo,
-                    grupo.inscritos_actuales
-                )
-    
     async def _validate_horarios_conflicto(self, codigos_grupos: List[str]):
-        """Validar que no haya conflictos de horarios entre grupos"""
-        result = await self.db.execute(
-            select(Grupo, Horario)
-            .join(Horario)
-            .where(Grupo.codigo_grupo.in_(codigos_grupos))
-        )
-        
-        grupos_horarios = [(grupo, horario) for grupo, horario in result]
-        
-        # Verificar conflictos
-        for i, (grupo1, horario1) in enumerate(grupos_horarios):
-            for j, (grupo2, horario2) in enumerate(grupos_horarios):
-                if i >= j:
-                    continue
-                
-                # Verificar si hay días en común
-                dias_comunes = set(horario1.dias_semana) & set(horario2.dias_semana)
-                if not dias_comunes:
-                    continue
-                
-                # Verificar solapamiento de horarios
-                if self._horarios_se_solapan(horario1.hora_inicio, horario1.hora_fin, 
-                                           horario2.hora_inicio, horario2.hora_fin):
-                    raise ConflictoHorarioException(
-                        grupo1.codigo_grupo,
-                        grupo2.codigo_grupo,
-                        list(dias_comunes),
-                        f"{horario1.hora_inicio}-{horario1.hora_fin} vs {horario2.hora_inicio}-{horario2.hora_fin}"
-                    )
-    
-    def _horarios_se_solapan(self, inicio1, fin1, inicio2, fin2) -> bool:
-        """Verificar si dos horarios se solapan"""
-        return not (fin1 <= inicio2 or fin2 <= inicio1)
-    
-    async def _increment_grupo_inscritos(self, codigo_grupo: str):
-        """Incrementar el contador de inscritos de un grupo"""
-        result = await self.db.execute(
-            select(Grupo).where(Grupo.codigo_grupo == codigo_grupo)
-        )
-        grupo = result.scalar_one()
-        grupo.inscritos_actuales += 1
-    
-    async def _decrement_grupo_inscritos(self, codigo_grupo: str):
-        """Decrementar el contador de inscritos de un grupo"""
-        result = await self.db.execute(
-            select(Grupo).where(Grupo.codigo_grupo == codigo_grupo)
-        )
-        grupo = result.scalar_one()
-        grupo.inscritos_actuales = max(0, grupo.inscritos_actuales - 1)
+        """Validar que no haya conflictos de horarios entre grupos (índice en memoria)"""
+        schedule_index = get_schedule_index()
+        await schedule_index.ensure_loaded(self.db, codigos_grupos)
+
+        conflicto = schedule_index.find_conflict(codigos_grupos)
+        if conflicto:
+            horario1, horario2 = conflicto
+            raise ConflictoHorarioException(
+                horario1.codigo_grupo,
+                horario2.codigo_grupo,
+                horario1.dias_comunes(horario2),
+                f"{horario1.hora_inicio}-{horario1.hora_fin} vs {horario2.hora_inicio}-{horario2.hora_fin}"
+            )
 
 class PeriodoAcademicoService:
     
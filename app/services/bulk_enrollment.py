@@ -0,0 +1,447 @@
+"""
+Motor de inscripción en lote.
+
+En lugar de procesar cada estudiante con su propia sesión y transacción, el
+lote se resuelve así:
+
+1. Precarga con pocas consultas IN: estudiantes, inscripciones existentes y sus
+   detalles (con el estado del período); períodos y grupos salen de la caché de
+   catálogo y los horarios del índice de conflictos.
+2. Por bloques de `chunk_size` ítems, en una transacción: bloquea los grupos del
+   bloque, valida cada ítem en memoria (mismas reglas y excepciones que
+   `_create_inscription_async`), asigna cupos en memoria (todo o nada por ítem),
+   aplica los deltas de cupo con un UPDATE y hace INSERT multi-fila de
+   inscripciones y detalles.
+3. Si un bloque falla al escribir, se revierte, se recarga el estado de sus
+   estudiantes y sus ítems se reprocesan uno a uno con la ruta individual.
+
+El resultado conserva un elemento por ítem, en el orden de entrada.
+"""
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.id_generator import get_id_generator
+from app.core.logging import get_logger
+from app.exceptions import (
+    ConflictoHorarioException,
+    EstudianteBloqueadoException,
+    EstudianteNoEncontradoException,
+    GrupoDuplicadoException,
+    PeriodoInactivoException,
+    PeriodoNoEncontradoException,
+)
+from app.models import DetalleInscripcion, Estudiante, Inscripcion, PeriodoAcademico
+from app.services.catalog_cache import get_catalog_cache
+from app.services.schedule_index import get_schedule_index
+from app.services.seat_ledger import SeatLedger
+from app.services.seat_reservation import SeatReservation, add_grupo_seats, lock_grupo_capacities
+
+logger = get_logger(__name__)
+
+# Límite de parámetros por consulta IN durante la precarga
+_PREFETCH_CHUNK = 1000
+
+
+@dataclass
+class _InscripcionExistente:
+    codigo_inscripcion: str
+    codigo_periodo: str
+    fecha_inscripcion: date
+    periodo_activo: bool
+    detalles: List[Dict[str, str]] = field(default_factory=list)
+
+    @property
+    def grupos(self) -> List[str]:
+        return [d["codigo_grupo"] for d in self.detalles]
+
+
+@dataclass
+class _Plan:
+    """Inscripción validada pendiente de reservar cupos y escribir"""
+    index: int
+    registro_academico: str
+    codigo_periodo: str
+    codigo_inscripcion: str
+    grupos: List[str]
+    existente: Optional[_InscripcionExistente]
+
+
+def _chunks(values: List[Any], size: int) -> Iterable[List[Any]]:
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class BulkEnrollmentEngine:
+    """Procesa un lote de solicitudes de inscripción con escrituras por bloque"""
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        chunk_size: int = 500,
+        seat_ledger: Optional[SeatLedger] = None,
+        fallback: Optional[Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = None
+    ):
+        self.session_factory = session_factory
+        self.chunk_size = max(1, chunk_size)
+        self.seat_ledger = seat_ledger
+        self.fallback = fallback
+        self._estudiantes: Dict[str, str] = {}
+        self._periodos: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._grupos: Dict[str, Dict[str, Any]] = {}
+        self._inscripciones: Dict[str, Dict[str, _InscripcionExistente]] = {}
+        self._codigos: Dict[str, Deque[str]] = {"I": deque(), "D": deque()}
+
+    async def run(
+        self,
+        items: List[Dict[str, Any]],
+        on_progress: Optional[Callable[[int, int, int], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """Procesar el lote; on_progress(procesados, exitosos, fallidos) tras cada bloque"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        async with self.session_factory() as db:
+            await self._prefetch(db, items)
+
+        procesados = exitosos = fallidos = 0
+        for chunk in _chunks(list(enumerate(items)), self.chunk_size):
+            await self._process_chunk(chunk, results)
+            for index, _ in chunk:
+                if results[index]["status"] == "success":
+                    exitosos += 1
+                else:
+                    fallidos += 1
+            procesados += len(chunk)
+            if on_progress is not None:
+                await asyncio.to_thread(on_progress, procesados, exitosos, fallidos)
+
+        return results
+
+    # ----- precarga -----
+
+    async def _prefetch(self, db: AsyncSession, items: List[Dict[str, Any]]) -> None:
+        registros = sorted({i.get("registro_academico") for i in items if i.get("registro_academico")})
+        periodos = sorted({i.get("codigo_periodo") for i in items if i.get("codigo_periodo")})
+        grupos = sorted({g for i in items for g in i.get("grupos", [])})
+
+        for lote in _chunks(registros, _PREFETCH_CHUNK):
+            result = await db.execute(
+                select(Estudiante.registro_academico, Estudiante.estado_academico)
+                .where(Estudiante.registro_academico.in_(lote))
+            )
+            self._estudiantes.update({r: estado for r, estado in result})
+
+        catalog = get_catalog_cache()
+        for codigo_periodo in periodos:
+            self._periodos[codigo_periodo] = await catalog.get_periodo(db, codigo_periodo)
+
+        await self._load_inscripciones(db, registros)
+
+        self._grupos = await catalog.get_grupos(db, grupos)
+        existentes = {g for por_periodo in self._inscripciones.values()
+                      for insc in por_periodo.values() for g in insc.grupos}
+        await get_schedule_index().ensure_loaded(db, set(grupos) | existentes)
+
+        if self.seat_ledger is not None and self._grupos:
+            await self.seat_ledger.prime(db, self._grupos.keys())
+
+        logger.info(
+            f"Lote precargado: {len(items)} solicitudes, {len(self._estudiantes)} estudiantes, "
+            f"{len(self._grupos)} grupos"
+        )
+
+    async def _load_inscripciones(self, db: AsyncSession, registros: Iterable[str]) -> None:
+        """Cargar (o recargar) inscripciones y detalles de los estudiantes dados"""
+        registros = sorted(set(registros))
+        for registro in registros:
+            self._inscripciones[registro] = {}
+
+        for lote in _chunks(registros, _PREFETCH_CHUNK):
+            result = await db.execute(
+                select(
+                    Inscripcion.codigo_inscripcion,
+                    Inscripcion.registro_academico,
+                    Inscripcion.codigo_periodo,
+                    Inscripcion.fecha_inscripcion,
+                    PeriodoAcademico.estado,
+                    DetalleInscripcion.codigo_detalle,
+                    DetalleInscripcion.codigo_grupo
+                )
+                .join(PeriodoAcademico, Inscripcion.codigo_periodo == PeriodoAcademico.codigo_periodo)
+                .outerjoin(DetalleInscripcion, DetalleInscripcion.codigo_inscripcion == Inscripcion.codigo_inscripcion)
+                .where(Inscripcion.registro_academico.in_(lote))
+            )
+            for row in result:
+                por_periodo = self._inscripciones[row.registro_academico]
+                insc = por_periodo.get(row.codigo_periodo)
+                if insc is None:
+                    insc = _InscripcionExistente(
+                        codigo_inscripcion=row.codigo_inscripcion,
+                        codigo_periodo=row.codigo_periodo,
+                        fecha_inscripcion=row.fecha_inscripcion,
+                        periodo_activo=row.estado == "ACTIVO"
+                    )
+                    por_periodo[row.codigo_periodo] = insc
+                if row.codigo_detalle is not None:
+                    insc.detalles.append({"codigo_detalle": row.codigo_detalle, "codigo_grupo": row.codigo_grupo})
+
+    # ----- validación en memoria -----
+
+    def _grupos_activos(self, registro_academico: str) -> List[str]:
+        return [
+            g for insc in self._inscripciones.get(registro_academico, {}).values()
+            if insc.periodo_activo for g in insc.grupos
+        ]
+
+    def _plan(self, index: int, data: Dict[str, Any]) -> Tuple[Optional[_Plan], Optional[Dict[str, Any]]]:
+        """Validar un ítem. Devuelve (plan, None) o (None, resultado_sin_cambios)"""
+        registro = data["registro_academico"]
+        codigo_periodo = data["codigo_periodo"]
+
+        estado_estudiante = self._estudiantes.get(registro)
+        if estado_estudiante is None:
+            raise EstudianteNoEncontradoException(registro)
+        if estado_estudiante == "BLOQUEADO":
+            raise EstudianteBloqueadoException(registro)
+
+        periodo = self._periodos.get(codigo_periodo)
+        if not periodo:
+            raise PeriodoNoEncontradoException(codigo_periodo)
+        if periodo["estado"] != "ACTIVO":
+            raise PeriodoInactivoException(codigo_periodo, periodo["estado"])
+
+        grupos = data.get("grupos", [])
+        existente = self._inscripciones.get(registro, {}).get(codigo_periodo)
+        schedule_index = get_schedule_index()
+
+        if existente is not None:
+            ya_inscritos = set(existente.grupos)
+            grupos_nuevos = [g for g in grupos if g not in ya_inscritos]
+            if not grupos_nuevos:
+                return None, {
+                    "codigo_inscripcion": existente.codigo_inscripcion,
+                    "registro_academico": registro,
+                    "codigo_periodo": codigo_periodo,
+                    "fecha_inscripcion": existente.fecha_inscripcion.isoformat(),
+                    "detalles": list(existente.detalles),
+                    "mensaje": "Todos los grupos ya estaban inscritos"
+                }
+        else:
+            grupos_nuevos = list(grupos)
+
+        conflicto = schedule_index.find_conflict(grupos_nuevos)
+        if conflicto:
+            _, horario2 = conflicto
+            raise ConflictoHorarioException(
+                horario2.codigo_grupo,
+                f"{horario2.dias_semana} {horario2.hora_inicio}-{horario2.hora_fin}"
+            )
+
+        grupos_activos = self._grupos_activos(registro)
+        conflicto = schedule_index.find_conflict(grupos_nuevos, grupos_activos, check_among_new=False)
+        if conflicto:
+            horario_existente, horario_nuevo = conflicto
+            raise ConflictoHorarioException(
+                horario_nuevo.codigo_grupo,
+                f"Conflicto con grupo existente {horario_existente.codigo_grupo}: "
+                f"{horario_existente.dias_semana} {horario_existente.hora_inicio}-{horario_existente.hora_fin}"
+            )
+
+        if existente is not None:
+            materias_existentes = {
+                self._grupos[g]["sigla_materia"] for g in existente.grupos if g in self._grupos
+            }
+            for codigo_grupo in grupos_nuevos:
+                grupo = self._grupos.get(codigo_grupo)
+                if grupo and grupo["sigla_materia"] in materias_existentes:
+                    raise GrupoDuplicadoException(
+                        codigo_grupo,
+                        f"Materia {grupo['sigla_materia']} ya está inscrita en este período",
+                        codigo_grupo
+                    )
+            codigo_inscripcion = existente.codigo_inscripcion
+        else:
+            materias_vistas: Dict[str, str] = {}
+            for codigo_grupo in grupos_nuevos:
+                grupo = self._grupos.get(codigo_grupo)
+                if not grupo:
+                    continue
+                sigla_materia = grupo["sigla_materia"]
+                if sigla_materia in materias_vistas:
+                    raise GrupoDuplicadoException(
+                        codigo_grupo,
+                        f"Materia {sigla_materia} ya está incluida en grupo {materias_vistas[sigla_materia]}",
+                        codigo_grupo
+                    )
+                materias_vistas[sigla_materia] = codigo_grupo
+            codigo_inscripcion = self._nuevo_codigo("I")
+
+        return _Plan(index, registro, codigo_periodo, codigo_inscripcion, grupos_nuevos, existente), None
+
+    def _nuevo_codigo(self, prefijo: str) -> str:
+        """Tomar un código de los reservados para el bloque actual"""
+        return self._codigos[prefijo].popleft()
+
+    async def _reservar_codigos(self, chunk: List[Tuple[int, Dict[str, Any]]]) -> None:
+        """Reservar de una vez los códigos que el bloque puede necesitar (los sobrantes se descartan)"""
+        generator = get_id_generator()
+        total_detalles = sum(len(data.get("grupos", [])) for _, data in chunk)
+        self._codigos["I"] = deque(await generator.next_codes("I", len(chunk)))
+        self._codigos["D"] = deque(await generator.next_codes("D", total_detalles))
+
+    # ----- escritura por bloque -----
+
+    async def _reserve(self, plan: _Plan, capacidades: Dict[str, List[int]]) -> None:
+        """Reservar los cupos de un ítem (todo o nada) contra el estado del bloque"""
+        if self.seat_ledger is not None:
+            reservation = await self.seat_ledger.try_reserve(plan.grupos)
+            if reservation.full and not reservation.missing:
+                await self.seat_ledger.fill_capacity(reservation)
+            reservation.raise_for_status()
+            return
+
+        reservation = SeatReservation()
+        for codigo_grupo in sorted(set(plan.grupos)):
+            capacidad = capacidades.get(codigo_grupo)
+            if capacidad is None:
+                reservation.missing.append(codigo_grupo)
+            elif capacidad[1] >= capacidad[0]:
+                reservation.full[codigo_grupo] = (capacidad[0], capacidad[1])
+        reservation.raise_for_status()
+        for codigo_grupo in set(plan.grupos):
+            capacidades[codigo_grupo][1] += 1
+
+    async def _process_chunk(self, chunk: List[Tuple[int, Dict[str, Any]]], results: List[Optional[Dict[str, Any]]]) -> None:
+        grupos_bloque = sorted({g for _, data in chunk for g in data.get("grupos", [])})
+        await self._reservar_codigos(chunk)
+        aceptados: List[_Plan] = []
+        pendientes: Dict[int, Dict[str, Any]] = {}
+
+        async with self.session_factory() as db:
+            try:
+                capacidades: Dict[str, List[int]] = {}
+                iniciales: Dict[str, int] = {}
+                if self.seat_ledger is None:
+                    bloqueados = await lock_grupo_capacities(db, grupos_bloque)
+                    capacidades = {c: [cupo, inscritos] for c, (cupo, inscritos) in bloqueados.items()}
+                    iniciales = {c: inscritos for c, (_, inscritos) in bloqueados.items()}
+
+                inscripciones_rows: List[Dict[str, Any]] = []
+                detalles_rows: List[Dict[str, Any]] = []
+                hoy = date.today()
+
+                for index, data in chunk:
+                    try:
+                        plan, sin_cambios = self._plan(index, data)
+                        if plan is None:
+                            results[index] = self._success(data, sin_cambios)
+                            continue
+                        await self._reserve(plan, capacidades)
+                    except Exception as e:
+                        results[index] = self._error(data, e)
+                        continue
+
+                    aceptados.append(plan)
+                    detalles = [
+                        {"codigo_detalle": self._nuevo_codigo("D"), "codigo_grupo": g}
+                        for g in plan.grupos
+                    ]
+                    detalles_rows.extend(
+                        {**d, "codigo_inscripcion": plan.codigo_inscripcion} for d in detalles
+                    )
+
+                    if plan.existente is None:
+                        inscripciones_rows.append({
+                            "codigo_inscripcion": plan.codigo_inscripcion,
+                            "registro_academico": plan.registro_academico,
+                            "codigo_periodo": plan.codigo_periodo,
+                            "fecha_inscripcion": hoy
+                        })
+                        insc = _InscripcionExistente(
+                            plan.codigo_inscripcion, plan.codigo_periodo, hoy, True, list(detalles)
+                        )
+                        self._inscripciones.setdefault(plan.registro_academico, {})[plan.codigo_periodo] = insc
+                        pendientes[index] = {
+                            "codigo_inscripcion": plan.codigo_inscripcion,
+                            "registro_academico": plan.registro_academico,
+                            "codigo_periodo": plan.codigo_periodo,
+                            "fecha_inscripcion": hoy.isoformat(),
+                            "detalles": detalles
+                        }
+                    else:
+                        plan.existente.detalles.extend(detalles)
+                        pendientes[index] = {
+                            "codigo_inscripcion": plan.codigo_inscripcion,
+                            "registro_academico": plan.registro_academico,
+                            "codigo_periodo": plan.codigo_periodo,
+                            "fecha_inscripcion": plan.existente.fecha_inscripcion.isoformat(),
+                            "detalles": detalles,
+                            "mensaje": f"Se agregaron {len(detalles)} nuevos grupos a inscripción existente"
+                        }
+
+                if self.seat_ledger is None:
+                    await add_grupo_seats(db, {c: capacidades[c][1] - iniciales[c] for c in capacidades})
+                if inscripciones_rows:
+                    await db.execute(insert(Inscripcion), inscripciones_rows)
+                if detalles_rows:
+                    await db.execute(insert(DetalleInscripcion), detalles_rows)
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logger.warning(f"Bloque de {len(chunk)} inscripciones falló al escribir, reprocesando uno a uno: {e}")
+                await self._recover_chunk(chunk, aceptados, results)
+                return
+
+        if self.seat_ledger is not None:
+            await self.seat_ledger.record_enrolled(
+                (p.registro_academico, p.codigo_periodo, p.existente.grupos if p.existente else p.grupos)
+                for p in aceptados
+            )
+
+        for index, data in chunk:
+            if index in pendientes:
+                results[index] = self._success(data, pendientes[index])
+
+    async def _recover_chunk(
+        self,
+        chunk: List[Tuple[int, Dict[str, Any]]],
+        aceptados: List[_Plan],
+        results: List[Optional[Dict[str, Any]]]
+    ) -> None:
+        """Deshacer el estado en memoria del bloque y reprocesar sus ítems con la ruta individual"""
+        if self.seat_ledger is not None:
+            for plan in aceptados:
+                await self.seat_ledger.release(plan.grupos)
+
+        for index, data in chunk:
+            if self.fallback is None:
+                results[index] = self._error(data, RuntimeError("Error escribiendo el bloque"))
+                continue
+            try:
+                results[index] = self._success(data, await self.fallback(data))
+            except Exception as e:
+                results[index] = self._error(data, e)
+
+        # Las inscripciones de estos estudiantes quedaron como las dejó la ruta individual
+        async with self.session_factory() as db:
+            await self._load_inscripciones(db, {data["registro_academico"] for _, data in chunk})
+
+    @staticmethod
+    def _success(data: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "status": "success",
+            "data": result,
+            "registro_academico": data.get("registro_academico")
+        }
+
+    @staticmethod
+    def _error(data: Dict[str, Any], exc: Exception) -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "error": str(exc),
+            "registro_academico": data.get("registro_academico")
+        }
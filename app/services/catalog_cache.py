@@ -0,0 +1,316 @@
+"""
+Caché local de catálogo (grupo, materia, docente, aula, horario, período).
+
+Lectura perezosa (read-through) con TTL. Las filas de catálogo cambian muy poco,
+así que cada proceso (API o worker) las mantiene en memoria y arma los datos de
+grupo/materia/docente/aula/horario sin eager-loads. Los contadores volátiles
+(`cupo`, `inscritos_actuales`) no se guardan aquí.
+
+Invalidación:
+- Local, cuando una sesión del proceso hace flush de filas de catálogo.
+- Entre procesos: al confirmar esa sesión se publica el alcance en el canal
+  Redis `catalog:invalidate` ("*", "grupos" o "periodo:<codigo_periodo>").
+  Los cambios hechos fuera del ORM (SQL manual, otras aplicaciones) se propagan
+  con `python -m app.services.catalog_cache invalidate [alcance]`; si no, se
+  ven al vencer el TTL.
+
+Los códigos de grupo desconocidos recargan el catálogo a lo sumo una vez cada
+`CATALOG_MISS_RELOAD_INTERVAL` segundos, para que códigos inexistentes no
+fuercen una recarga por solicitud.
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import redis.asyncio as aioredis
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.redis_client import close_async_redis, get_async_redis
+from app.models import Aula, Docente, Grupo, Horario, Materia, PeriodoAcademico
+from app.services.schedule_index import get_schedule_index
+
+logger = get_logger(__name__)
+
+CATALOG_INVALIDATION_CHANNEL = "catalog:invalidate"
+
+# Columnas de grupo que cambian con cada inscripción y no invalidan el catálogo
+_VOLATILE_GRUPO_ATTRS = {"inscritos_actuales"}
+
+
+class CatalogCache:
+    """Caché de catálogo de un proceso"""
+
+    def __init__(self, ttl_seconds: float = 120.0, miss_reload_interval: float = 10.0):
+        self.ttl_seconds = ttl_seconds
+        self.miss_reload_interval = miss_reload_interval
+        self._grupos: Dict[str, Dict[str, Any]] = {}
+        self._grupos_loaded_at = 0.0
+        self._grupos_stale = True
+        self._periodos: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._publishing: Set[asyncio.Task] = set()
+
+    # ----- grupos -----
+
+    @property
+    def grupos_fresh(self) -> bool:
+        return not self._grupos_stale and (time.monotonic() - self._grupos_loaded_at) < self.ttl_seconds
+
+    async def load_grupos(self, db: AsyncSession) -> int:
+        """Cargar grupos con materia, docente, aula y horario ya resueltos"""
+        materias = {m.sigla: m for m in (await db.execute(select(Materia))).scalars()}
+        docentes = {d.codigo_docente: d for d in (await db.execute(select(Docente))).scalars()}
+        aulas = {a.codigo_aula: a for a in (await db.execute(select(Aula))).scalars()}
+        horarios = {h.codigo_horario: h for h in (await db.execute(select(Horario))).scalars()}
+        grupos = (await db.execute(select(Grupo))).scalars().all()
+
+        catalogo = {}
+        for grupo in grupos:
+            materia = materias.get(grupo.sigla_materia)
+            docente = docentes.get(grupo.codigo_docente)
+            aula = aulas.get(grupo.codigo_aula)
+            horario = horarios.get(grupo.codigo_horario)
+            catalogo[grupo.codigo_grupo] = {
+                "codigo_grupo": grupo.codigo_grupo,
+                "sigla_materia": grupo.sigla_materia,
+                "materia": {
+                    "sigla": materia.sigla,
+                    "nombre": materia.nombre,
+                    "creditos": materia.creditos,
+                    "es_electiva": materia.es_electiva
+                } if materia else None,
+                "descripcion": grupo.descripcion,
+                "docente": {
+                    "codigo_docente": docente.codigo_docente,
+                    "nombre": docente.nombre,
+                    "apellido": docente.apellido
+                } if docente else None,
+                "aula": {
+                    "codigo_aula": aula.codigo_aula,
+                    "modulo": aula.modulo,
+                    "aula": aula.aula,
+                    "ubicacion": aula.ubicacion
+                } if aula else None,
+                "horario": {
+                    "codigo_horario": horario.codigo_horario,
+                    "dias_semana": horario.dias_semana,
+                    "hora_inicio": str(horario.hora_inicio),
+                    "hora_fin": str(horario.hora_fin)
+                } if horario else None,
+            }
+
+        self._grupos = catalogo
+        self._grupos_loaded_at = time.monotonic()
+        self._grupos_stale = False
+        logger.info(f"Catálogo de grupos cargado: {len(catalogo)} grupos")
+        return len(catalogo)
+
+    def _needs_reload(self, codigos_grupos: List[str]) -> bool:
+        if not self.grupos_fresh:
+            return True
+        # Un código desconocido puede ser un grupo nuevo o uno inexistente:
+        # recargar, pero no más de una vez por intervalo
+        if any(c not in self._grupos for c in codigos_grupos):
+            return (time.monotonic() - self._grupos_loaded_at) >= self.miss_reload_interval
+        return False
+
+    async def get_grupos(self, db: AsyncSession, codigos_grupos: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Datos de catálogo de los grupos pedidos (los inexistentes se omiten)"""
+        self._ensure_listener()
+        codigos_grupos = list(codigos_grupos)
+        if self._needs_reload(codigos_grupos):
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._needs_reload(codigos_grupos):
+                    await self.load_grupos(db)
+        return {c: self._grupos[c] for c in codigos_grupos if c in self._grupos}
+
+    async def get_grupo(self, db: AsyncSession, codigo_grupo: str) -> Optional[Dict[str, Any]]:
+        return (await self.get_grupos(db, [codigo_grupo])).get(codigo_grupo)
+
+    # ----- periodos -----
+
+    async def get_periodo(self, db: AsyncSession, codigo_periodo: str) -> Optional[Dict[str, Any]]:
+        """Período académico por código (no se cachean períodos inexistentes)"""
+        self._ensure_listener()
+        entry = self._periodos.get(codigo_periodo)
+        if entry is not None and (time.monotonic() - entry[0]) < self.ttl_seconds:
+            return entry[1]
+
+        result = await db.execute(
+            select(PeriodoAcademico).where(PeriodoAcademico.codigo_periodo == codigo_periodo)
+        )
+        periodo = result.scalar_one_or_none()
+        if periodo is None:
+            self._periodos.pop(codigo_periodo, None)
+            return None
+
+        data = {
+            "codigo_periodo": periodo.codigo_periodo,
+            "semestre": periodo.semestre,
+            "fecha_inicio": periodo.fecha_inicio,
+            "fecha_fin": periodo.fecha_fin,
+            "estado": periodo.estado,
+        }
+        self._periodos[codigo_periodo] = (time.monotonic(), data)
+        return data
+
+    # ----- invalidación -----
+
+    def invalidate(self, scope: str = "*") -> None:
+        """Invalidar "*", "grupos", "periodos" o "periodo:<codigo>" en este proceso"""
+        if scope in ("*", "grupos"):
+            self._grupos_stale = True
+            get_schedule_index().invalidate()
+        if scope in ("*", "periodos"):
+            self._periodos.clear()
+        elif scope.startswith("periodo:"):
+            self._periodos.pop(scope.split(":", 1)[1], None)
+
+    def publish_after_commit(self, scopes: Iterable[str]) -> None:
+        """Publicar alcances confirmados sin bloquear el commit (requiere un loop activo)"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.debug("Sin event loop: la invalidación del catálogo queda local")
+            return
+        for scope in scopes:
+            task = loop.create_task(self._publish(scope))
+            self._publishing.add(task)
+            task.add_done_callback(self._publishing.discard)
+
+    async def _publish(self, scope: str) -> None:
+        try:
+            await self._get_redis().publish(CATALOG_INVALIDATION_CHANNEL, scope)
+        except Exception as e:
+            logger.warning(f"No se pudo publicar la invalidación de catálogo '{scope}': {e}")
+
+    def _get_redis(self) -> aioredis.Redis:
+        # La suscripción ocupa una conexión del pool compartido mientras dure
+        return get_async_redis()
+
+    def _ensure_listener(self) -> None:
+        """Suscribirse al canal de invalidación desde el loop actual (una vez)"""
+        if self._listener is not None and not self._listener.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._listener = loop.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        reconectando = False
+        while True:
+            pubsub = self._get_redis().pubsub()
+            try:
+                await pubsub.subscribe(CATALOG_INVALIDATION_CHANNEL)
+                if reconectando:
+                    # Pudimos perder mensajes mientras estábamos desconectados
+                    self.invalidate("*")
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    scope = message["data"]
+                    if isinstance(scope, bytes):
+                        scope = scope.decode()
+                    self.invalidate(scope)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Suscripción de invalidación de catálogo interrumpida: {e}")
+                reconectando = True
+                await asyncio.sleep(5)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    async def stop_listener(self) -> None:
+        """Cancelar la suscripción de invalidación (antes de cerrar el pool de Redis)"""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+
+
+catalog_cache = CatalogCache(
+    ttl_seconds=settings.CATALOG_CACHE_TTL,
+    miss_reload_interval=settings.CATALOG_MISS_RELOAD_INTERVAL
+)
+
+
+def get_catalog_cache() -> CatalogCache:
+    """Obtener la caché de catálogo del proceso actual"""
+    return catalog_cache
+
+
+async def publish_catalog_invalidation(scope: str = "*") -> None:
+    """Invalidar la caché de catálogo en todos los procesos"""
+    catalog_cache.invalidate(scope)
+    await catalog_cache._get_redis().publish(CATALOG_INVALIDATION_CHANNEL, scope)
+
+
+_PENDING_SCOPES_KEY = "catalog_invalidations"
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_catalog_on_flush(session, flush_context):
+    """Invalidar la caché local cuando una sesión de este proceso modifica el catálogo"""
+    scopes = set()
+    for obj in (*session.new, *session.deleted, *session.dirty):
+        if isinstance(obj, PeriodoAcademico):
+            scopes.add(f"periodo:{obj.codigo_periodo}")
+        elif isinstance(obj, (Materia, Docente, Aula, Horario)):
+            scopes.add("grupos")
+        elif isinstance(obj, Grupo):
+            if obj in session.dirty:
+                cambios = {
+                    attr.key for attr in inspect(obj).attrs if attr.history.has_changes()
+                }
+                if not (cambios - _VOLATILE_GRUPO_ATTRS):
+                    continue
+            scopes.add("grupos")
+    for scope in scopes:
+        catalog_cache.invalidate(scope)
+    if scopes:
+        session.info.setdefault(_PENDING_SCOPES_KEY, set()).update(scopes)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_catalog_on_commit(session):
+    """Propagar a los demás procesos lo invalidado en la transacción confirmada"""
+    scopes = session.info.pop(_PENDING_SCOPES_KEY, None)
+    if scopes:
+        catalog_cache.publish_after_commit(sorted(scopes))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalog_on_rollback(session):
+    session.info.pop(_PENDING_SCOPES_KEY, None)
+
+
+async def _main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Invalidación de la caché de catálogo")
+    parser.add_argument("command", choices=["invalidate"])
+    parser.add_argument("scope", nargs="?", default="*", help='"*", "grupos", "periodos" o "periodo:<codigo>"')
+    args = parser.parse_args(argv)
+
+    await publish_catalog_invalidation(args.scope)
+    print(f"Invalidación '{args.scope}' publicada en {CATALOG_INVALIDATION_CHANNEL}")
+    await close_async_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
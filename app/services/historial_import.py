@@ -0,0 +1,330 @@
+"""
+Importación masiva de historial académico (notas de fin de período).
+
+El archivo (CSV con encabezado o NDJSON) se procesa en un worker:
+
+1. Parseo y validación por fila en memoria: campos obligatorios, estado, rango
+   de nota y longitudes. Las filas inválidas se reportan y no llegan a la base.
+2. Carga de las filas válidas con `COPY` a una tabla temporal
+   (`ON COMMIT DROP`) dentro de la transacción de la importación.
+3. Validación referencial en conjunto: un único SELECT con LEFT JOIN contra
+   estudiante, materia, período e historial existente marca las filas sin
+   estudiante/materia/período, duplicadas dentro del archivo o ya registradas.
+4. INSERT ... SELECT de las filas restantes (y, con `on_duplicate="update"`,
+   un UPDATE ... FROM de las ya registradas), todo en un commit.
+
+El archivo no viaja en el mensaje de Celery: la API lo deja comprimido en
+Redis (`historial_import:archivo:<id>`, con TTL) y la tarea recibe solo la
+referencia; el worker lo borra al terminar la importación.
+
+Cada error se informa con el número de fila del archivo (1 = primera fila de
+datos) y sus motivos. Después del commit se invalidan el kardex cacheado y el
+resumen materializado de los estudiantes afectados y se marcan sus reportes
+para refresco.
+"""
+import asyncio
+import csv
+import io
+import json
+import uuid
+import zlib
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.redis_client import get_async_redis
+from app.services.academic_summary import get_academic_summary_store
+from app.services.historial_reports import get_historial_report_store
+from app.services.transcript_cache import get_transcript_cache
+
+logger = get_logger(__name__)
+
+FORMATS = ("csv", "ndjson")
+ON_DUPLICATE = ("error", "update")
+ESTADOS_VALIDOS = ("APROBADA", "REPROBADA", "RETIRADA")
+
+COLUMNS = ("registro_academico", "sigla_materia", "codigo_periodo", "nota_final", "estado", "observacion")
+_MAX_LENGTH = {"registro_academico": 10, "sigla_materia": 8, "codigo_periodo": 8, "estado": 15, "observacion": 200}
+_REQUIRED = ("registro_academico", "sigla_materia", "codigo_periodo", "estado")
+
+_CREATE_TEMP_SQL = text("""
+    CREATE TEMP TABLE historial_import (
+        fila integer PRIMARY KEY,
+        registro_academico varchar(10) NOT NULL,
+        sigla_materia varchar(8) NOT NULL,
+        codigo_periodo varchar(8) NOT NULL,
+        nota_final numeric(5,2),
+        estado varchar(15) NOT NULL,
+        observacion varchar(200)
+    ) ON COMMIT DROP
+""")
+
+_COPY_SQL = (
+    "COPY historial_import (fila, registro_academico, sigla_materia, codigo_periodo, "
+    "nota_final, estado, observacion) FROM STDIN"
+)
+
+# Solo las filas importadas con algún problema referencial
+_VALIDATE_SQL = text("""
+    SELECT * FROM (
+    SELECT t.fila,
+           e.registro_academico IS NULL AS sin_estudiante,
+           m.sigla IS NULL AS sin_materia,
+           p.codigo_periodo IS NULL AS sin_periodo,
+           t.fila <> min(t.fila) OVER (
+               PARTITION BY t.registro_academico, t.sigla_materia, t.codigo_periodo
+           ) AS duplicada_en_archivo,
+           EXISTS (
+               SELECT 1 FROM historial_academico h
+               WHERE h.registro_academico = t.registro_academico
+                 AND h.sigla_materia = t.sigla_materia
+                 AND h.codigo_periodo = t.codigo_periodo
+           ) AS ya_registrada
+    FROM historial_import t
+    LEFT JOIN estudiante e ON e.registro_academico = t.registro_academico
+    LEFT JOIN materia m ON m.sigla = t.sigla_materia
+    LEFT JOIN periodo_academico p ON p.codigo_periodo = t.codigo_periodo
+    ) v
+    WHERE sin_estudiante OR sin_materia OR sin_periodo OR duplicada_en_archivo
+       OR (ya_registrada AND :rechazar_existentes)
+""")
+
+_DISCARD_SQL = text("DELETE FROM historial_import WHERE fila = ANY(:filas)")
+
+_UPDATE_SQL = text("""
+    UPDATE historial_academico h
+    SET nota_final = t.nota_final, estado = t.estado, observacion = t.observacion
+    FROM historial_import t
+    WHERE h.registro_academico = t.registro_academico
+      AND h.sigla_materia = t.sigla_materia
+      AND h.codigo_periodo = t.codigo_periodo
+    RETURNING t.fila
+""")
+
+_INSERT_SQL = text("""
+    INSERT INTO historial_academico
+        (registro_academico, sigla_materia, codigo_periodo, nota_final, estado, observacion, fecha_registro)
+    SELECT t.registro_academico, t.sigla_materia, t.codigo_periodo, t.nota_final, t.estado, t.observacion,
+           current_date
+    FROM historial_import t
+    WHERE NOT EXISTS (
+        SELECT 1 FROM historial_academico h
+        WHERE h.registro_academico = t.registro_academico
+          AND h.sigla_materia = t.sigla_materia
+          AND h.codigo_periodo = t.codigo_periodo
+    )
+""")
+
+_AFFECTED_SQL = text("SELECT DISTINCT registro_academico, codigo_periodo, sigla_materia FROM historial_import")
+
+STAGING_PREFIX = "historial_import:archivo:"
+
+
+async def stage_payload(payload: str) -> str:
+    """Guardar el archivo en Redis para el worker; devuelve la referencia"""
+    referencia = uuid.uuid4().hex
+    await get_async_redis().set(
+        STAGING_PREFIX + referencia,
+        zlib.compress(payload.encode("utf-8")),
+        ex=settings.HISTORIAL_IMPORT_STAGING_TTL
+    )
+    return referencia
+
+
+async def load_staged_payload(referencia: str) -> Optional[str]:
+    """Archivo guardado con stage_payload, o None si expiró"""
+    raw = await get_async_redis().get(STAGING_PREFIX + referencia)
+    return zlib.decompress(raw).decode("utf-8") if raw is not None else None
+
+
+async def discard_staged_payload(referencia: str) -> None:
+    try:
+        await get_async_redis().delete(STAGING_PREFIX + referencia)
+    except Exception as e:
+        logger.warning(f"No se pudo borrar el archivo de importación {referencia}: {e}")
+
+
+def _clean(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def validate_row(data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """Normalizar una fila; devuelve (fila, errores)"""
+    errores = []
+    fila = {column: _clean(data.get(column)) for column in COLUMNS}
+
+    for column in _REQUIRED:
+        if fila[column] is None:
+            errores.append(f"{column} es obligatorio")
+    for column, limite in _MAX_LENGTH.items():
+        if fila[column] is not None and len(fila[column]) > limite:
+            errores.append(f"{column} excede {limite} caracteres")
+
+    if fila["estado"] is not None:
+        fila["estado"] = fila["estado"].upper()
+        if fila["estado"] not in ESTADOS_VALIDOS:
+            errores.append(f"estado inválido: {fila['estado']}")
+
+    if fila["nota_final"] is not None:
+        try:
+            nota = Decimal(fila["nota_final"])
+        except InvalidOperation:
+            errores.append(f"nota_final no numérica: {fila['nota_final']}")
+        else:
+            if not (0 <= nota <= 100):
+                errores.append(f"nota_final fuera de rango (0-100): {nota}")
+            else:
+                fila["nota_final"] = nota.quantize(Decimal("0.01"))
+
+    return (None, errores) if errores else (fila, [])
+
+
+def parse_payload(payload: str, formato: str) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]:
+    """Parsear y validar el archivo; devuelve ([(fila, datos)], errores)"""
+    if formato not in FORMATS:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+    filas: List[Tuple[int, Dict[str, Any]]] = []
+    errores: List[Dict[str, Any]] = []
+
+    if formato == "csv":
+        registros = enumerate(csv.DictReader(io.StringIO(payload)), start=1)
+    else:
+        # En NDJSON la fila es la línea del archivo (las líneas vacías se saltan)
+        registros = enumerate(payload.splitlines(), start=1)
+
+    for numero, registro in registros:
+        if formato == "ndjson":
+            if not registro.strip():
+                continue
+            try:
+                registro = json.loads(registro)
+            except ValueError as e:
+                errores.append({"fila": numero, "errores": [f"JSON inválido: {e}"]})
+                continue
+            if not isinstance(registro, dict):
+                errores.append({"fila": numero, "errores": ["se esperaba un objeto JSON"]})
+                continue
+        fila, motivos = validate_row(registro)
+        if motivos:
+            errores.append({"fila": numero, "registro_academico": _clean(registro.get("registro_academico")),
+                            "sigla_materia": _clean(registro.get("sigla_materia")),
+                            "codigo_periodo": _clean(registro.get("codigo_periodo")), "errores": motivos})
+        else:
+            filas.append((numero, fila))
+    return filas, errores
+
+
+def _referential_errors(row, on_duplicate: str) -> List[str]:
+    motivos = []
+    if row.sin_estudiante:
+        motivos.append("estudiante no encontrado")
+    if row.sin_materia:
+        motivos.append("materia no encontrada")
+    if row.sin_periodo:
+        motivos.append("período no encontrado")
+    if row.duplicada_en_archivo:
+        motivos.append("fila duplicada en el archivo (estudiante, materia, período)")
+    if row.ya_registrada and on_duplicate == "error":
+        motivos.append("ya existe un registro de historial para esta materia y período")
+    return motivos
+
+
+class HistorialImporter:
+    """Carga masiva de historial con COPY y validación en conjunto"""
+
+    def __init__(self, session_factory: async_sessionmaker, on_duplicate: str = "error"):
+        if on_duplicate not in ON_DUPLICATE:
+            raise ValueError(f"on_duplicate debe ser uno de {ON_DUPLICATE}")
+        self.session_factory = session_factory
+        self.on_duplicate = on_duplicate
+
+    async def run(
+        self,
+        payload: str,
+        formato: str,
+        on_progress: Optional[Callable[[str, int], None]] = None
+    ) -> Dict[str, Any]:
+        """Importar el archivo; on_progress(etapa, filas) al terminar cada etapa"""
+        filas, errores = parse_payload(payload, formato)
+        total = len(filas) + len(errores)
+        await self._progress(on_progress, "validado", total)
+
+        insertados = actualizados = 0
+        afectados: List[Tuple[str, str, str]] = []
+        if filas:
+            async with self.session_factory() as db:
+                try:
+                    await db.execute(_CREATE_TEMP_SQL)
+                    await self._copy(db, filas)
+                    await self._progress(on_progress, "cargado", len(filas))
+
+                    datos = dict(filas)
+                    rechazadas = []
+                    result = await db.execute(
+                        _VALIDATE_SQL, {"rechazar_existentes": self.on_duplicate == "error"}
+                    )
+                    for row in result.all():
+                        motivos = _referential_errors(row, self.on_duplicate)
+                        if motivos:
+                            rechazadas.append(row.fila)
+                            fila = datos[row.fila]
+                            errores.append({"fila": row.fila, "registro_academico": fila["registro_academico"],
+                                            "sigla_materia": fila["sigla_materia"],
+                                            "codigo_periodo": fila["codigo_periodo"], "errores": motivos})
+                    if rechazadas:
+                        await db.execute(_DISCARD_SQL, {"filas": rechazadas})
+
+                    if self.on_duplicate == "update":
+                        actualizados = len((await db.execute(_UPDATE_SQL)).all())
+                    insertados = (await db.execute(_INSERT_SQL)).rowcount
+                    afectados = [tuple(r) for r in (await db.execute(_AFFECTED_SQL)).all()]
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+
+        await self._after_commit(afectados)
+        errores.sort(key=lambda e: e["fila"])
+        logger.info(
+            f"Importación de historial: {total} filas, {insertados} insertadas, "
+            f"{actualizados} actualizadas, {len(errores)} con errores"
+        )
+        return {
+            "total": total,
+            "insertados": insertados,
+            "actualizados": actualizados,
+            "fallidos": len(errores),
+            "errores": errores,
+        }
+
+    async def _copy(self, db: AsyncSession, filas: List[Tuple[int, Dict[str, Any]]]) -> None:
+        """COPY de las filas a la tabla temporal por la conexión de la sesión (psycopg 3)"""
+        connection = await db.connection()
+        raw = await connection.get_raw_connection()
+        async with raw.driver_connection.cursor() as cursor:
+            async with cursor.copy(_COPY_SQL) as copy:
+                for numero, fila in filas:
+                    await copy.write_row((numero, *(fila[column] for column in COLUMNS)))
+
+    async def _after_commit(self, afectados: List[Tuple[str, str, str]]) -> None:
+        if not afectados:
+            return
+        registros = sorted({registro for registro, _, _ in afectados})
+        await get_transcript_cache().invalidate_many(registros)
+        await get_academic_summary_store().invalidate_many(registros)
+        await get_historial_report_store().mark_dirty_many(
+            sorted({(periodo, sigla) for _, periodo, sigla in afectados})
+        )
+
+    @staticmethod
+    async def _progress(on_progress, etapa: str, filas: int) -> None:
+        if on_progress is not None:
+            await asyncio.to_thread(on_progress, etapa, filas)
@@ -0,0 +1,285 @@
+"""
+Reportes de rendimiento académico precalculados.
+
+Los reportes por período (`/reportes/rendimiento-periodo/{codigo_periodo}`) y
+por materia (`/reportes/estudiantes-por-materia/{sigla_materia}`) se calculan
+en lote en un worker de Celery y se guardan en Redis como JSON
+(`reportes:periodo:<codigo>`, `reportes:materia:<sigla>`); los endpoints solo
+los leen.
+
+El cálculo es una única agregación con GROUPING SETS sobre
+`historial_academico`: (período, materia), (período) y (materia). Incluye tasas
+de aprobación, promedios y distribución de notas por tramos de 10 puntos.
+
+Refresco incremental: cada cambio de historial agrega el par
+"<codigo_periodo>|<sigla_materia>" al set `reportes:pendientes`. La tarea de
+refresco toma los pares pendientes y recalcula solo los períodos y materias
+afectados, con la misma consulta filtrada.
+
+Cada reconstrucción completa deja su fecha en `reportes:generado_en`: si ya
+hubo una y un reporte no existe, el período o la materia no tiene registros.
+"""
+from datetime import datetime, timezone
+import json
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import redis.asyncio as aioredis
+from sqlalchemy import case, func, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.logging import get_logger
+from app.core.redis_client import get_async_redis
+from app.models import HistorialAcademico, Materia
+
+logger = get_logger(__name__)
+
+PERIODO_PREFIX = "reportes:periodo:"
+MATERIA_PREFIX = "reportes:materia:"
+PENDING_KEY = "reportes:pendientes"
+REBUILD_LOCK_KEY = "reportes:reconstruccion"
+GENERATED_KEY = "reportes:generado_en"
+
+# Tramos de la distribución de notas: [0, 10), [10, 20), ... [90, 100]
+DISTRIBUTION_BUCKETS = tuple(range(0, 100, 10))
+
+
+def _distribution_columns() -> List[Any]:
+    nota = HistorialAcademico.nota_final
+    columns = []
+    for lower in DISTRIBUTION_BUCKETS:
+        if lower == DISTRIBUTION_BUCKETS[-1]:
+            condition = nota >= lower
+        else:
+            condition = (nota >= lower) & (nota < lower + 10)
+        columns.append(func.count(case((condition, 1))).label(f"tramo_{lower}"))
+    return columns
+
+
+def _aggregate_query(periodos: Optional[Iterable[str]] = None, siglas: Optional[Iterable[str]] = None):
+    """Agregados por (período, materia), por período y por materia en una sola pasada"""
+    estado = HistorialAcademico.estado
+    nota = HistorialAcademico.nota_final
+    periodo = HistorialAcademico.codigo_periodo
+    sigla = HistorialAcademico.sigla_materia
+    query = (
+        select(
+            periodo,
+            sigla,
+            func.count().label("total"),
+            func.count(func.distinct(HistorialAcademico.registro_academico)).label("estudiantes"),
+            func.count(case((estado == "APROBADA", 1))).label("aprobadas"),
+            func.count(case((estado == "REPROBADA", 1))).label("reprobadas"),
+            func.count(case((estado == "RETIRADA", 1))).label("retiradas"),
+            func.count(nota).label("notas"),
+            func.sum(nota).label("suma_notas"),
+            func.count(case((estado == "APROBADA", nota))).label("notas_aprobadas"),
+            func.sum(case((estado == "APROBADA", nota))).label("suma_notas_aprobadas"),
+            *_distribution_columns(),
+        )
+        .group_by(func.grouping_sets(tuple_(periodo, sigla), tuple_(periodo), tuple_(sigla)))
+    )
+    filtros = []
+    if periodos:
+        filtros.append(periodo.in_(sorted(set(periodos))))
+    if siglas:
+        filtros.append(sigla.in_(sorted(set(siglas))))
+    if filtros:
+        query = query.where(or_(*filtros))
+    return query
+
+
+def _average(suma, cantidad) -> Optional[float]:
+    return round(float(suma) / cantidad, 2) if cantidad and suma is not None else None
+
+
+def _stats(row) -> Dict[str, Any]:
+    # Tasa de aprobación sobre las materias cerradas (sin contar retiros)
+    cursadas = row.aprobadas + row.reprobadas
+    return {
+        "total_registros": row.total,
+        "estudiantes": row.estudiantes,
+        "aprobadas": row.aprobadas,
+        "reprobadas": row.reprobadas,
+        "retiradas": row.retiradas,
+        "tasa_aprobacion": round(row.aprobadas / cursadas, 4) if cursadas else None,
+        "tasa_retiro": round(row.retiradas / row.total, 4) if row.total else None,
+        "promedio_general": _average(row.suma_notas, row.notas),
+        "promedio_aprobadas": _average(row.suma_notas_aprobadas, row.notas_aprobadas),
+        "distribucion_notas": {
+            f"{lower}-{lower + 9 if lower < DISTRIBUTION_BUCKETS[-1] else 100}": getattr(row, f"tramo_{lower}")
+            for lower in DISTRIBUTION_BUCKETS
+        },
+    }
+
+
+async def compute_reports(
+    db: AsyncSession,
+    periodos: Optional[Iterable[str]] = None,
+    siglas: Optional[Iterable[str]] = None
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    Reportes por período y por materia. Con filtros solo son completos los
+    reportes de los períodos y materias pedidos; el resto se descarta.
+    """
+    periodos = set(periodos or ())
+    siglas = set(siglas or ())
+    result = await db.execute(_aggregate_query(periodos, siglas))
+    rows = result.all()
+
+    nombres = {}
+    siglas_en_filas = {row.sigla_materia for row in rows if row.sigla_materia is not None}
+    if siglas_en_filas:
+        materias = await db.execute(
+            select(Materia.sigla, Materia.nombre).where(Materia.sigla.in_(sorted(siglas_en_filas)))
+        )
+        nombres = dict(materias.all())
+
+    generado = datetime.now(timezone.utc).isoformat()
+    completo = not periodos and not siglas
+    por_periodo: Dict[str, Dict[str, Any]] = {}
+    por_materia: Dict[str, Dict[str, Any]] = {}
+
+    def periodo_report(codigo: str) -> Dict[str, Any]:
+        return por_periodo.setdefault(codigo, {"codigo_periodo": codigo, "generado_en": generado, "materias": []})
+
+    def materia_report(sigla: str) -> Dict[str, Any]:
+        return por_materia.setdefault(sigla, {
+            "sigla_materia": sigla, "materia_nombre": nombres.get(sigla), "generado_en": generado, "periodos": []
+        })
+
+    for row in rows:
+        codigo, sigla = row.codigo_periodo, row.sigla_materia
+        incluir_periodo = codigo is not None and (completo or codigo in periodos)
+        incluir_materia = sigla is not None and (completo or sigla in siglas)
+        if codigo is not None and sigla is not None:
+            detalle = _stats(row)
+            if incluir_periodo:
+                periodo_report(codigo)["materias"].append(
+                    {"sigla_materia": sigla, "materia_nombre": nombres.get(sigla), **detalle}
+                )
+            if incluir_materia:
+                materia_report(sigla)["periodos"].append({"codigo_periodo": codigo, **detalle})
+        elif codigo is not None and incluir_periodo:
+            periodo_report(codigo).update(_stats(row))
+        elif sigla is not None and incluir_materia:
+            materia_report(sigla).update(_stats(row))
+
+    for report in por_periodo.values():
+        report["materias"].sort(key=lambda m: m["sigla_materia"])
+    for report in por_materia.values():
+        report["periodos"].sort(key=lambda p: p["codigo_periodo"])
+    return por_periodo, por_materia
+
+
+class HistorialReportStore:
+    """Reportes precalculados en Redis y pares pendientes de refresco"""
+
+    def __init__(self, redis_client: aioredis.Redis):
+        self.redis_client = redis_client
+
+    async def mark_dirty(self, codigo_periodo: str, sigla_materia: str) -> None:
+        """Registrar un cambio de historial para el próximo refresco (después del commit)"""
+        try:
+            await self.redis_client.sadd(PENDING_KEY, f"{codigo_periodo}|{sigla_materia}")
+        except Exception as e:
+            logger.warning(f"No se pudo marcar el reporte {codigo_periodo}/{sigla_materia} para refresco: {e}")
+
+    async def mark_dirty_many(self, pares: Iterable[Tuple[str, str]]) -> None:
+        miembros = [f"{codigo_periodo}|{sigla_materia}" for codigo_periodo, sigla_materia in pares]
+        if not miembros:
+            return
+        try:
+            await self.redis_client.sadd(PENDING_KEY, *miembros)
+        except Exception as e:
+            logger.warning(f"No se pudieron marcar {len(miembros)} reportes para refresco: {e}")
+
+    async def claim_rebuild(self, ttl_seconds: int = 300) -> bool:
+        """Tomar el turno para encolar una reconstrucción (evita encolar una por request)"""
+        return bool(await self.redis_client.set(REBUILD_LOCK_KEY, 1, nx=True, ex=ttl_seconds))
+
+    async def last_rebuild(self) -> Optional[str]:
+        """Fecha de la última reconstrucción completa (None si nunca corrió)"""
+        raw = await self.redis_client.get(GENERATED_KEY)
+        return raw.decode() if isinstance(raw, bytes) else raw
+
+    async def get_periodo(self, codigo_periodo: str) -> Optional[Dict[str, Any]]:
+        raw = await self.redis_client.get(f"{PERIODO_PREFIX}{codigo_periodo}")
+        return json.loads(raw) if raw is not None else None
+
+    async def get_materia(self, sigla_materia: str) -> Optional[Dict[str, Any]]:
+        raw = await self.redis_client.get(f"{MATERIA_PREFIX}{sigla_materia}")
+        return json.loads(raw) if raw is not None else None
+
+    async def _write(
+        self,
+        por_periodo: Dict[str, Dict[str, Any]],
+        por_materia: Dict[str, Dict[str, Any]],
+        periodos: Set[str],
+        siglas: Set[str]
+    ) -> None:
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for codigo, report in por_periodo.items():
+                pipe.set(f"{PERIODO_PREFIX}{codigo}", json.dumps(report, default=str))
+            for sigla, report in por_materia.items():
+                pipe.set(f"{MATERIA_PREFIX}{sigla}", json.dumps(report, default=str))
+            # Períodos/materias sin registros restantes
+            for codigo in periodos - set(por_periodo):
+                pipe.delete(f"{PERIODO_PREFIX}{codigo}")
+            for sigla in siglas - set(por_materia):
+                pipe.delete(f"{MATERIA_PREFIX}{sigla}")
+            await pipe.execute()
+
+    async def rebuild(self, db: AsyncSession) -> Dict[str, int]:
+        """Recalcular todos los reportes"""
+        # Lo pendiente hasta aquí queda cubierto por el recálculo completo
+        await self.redis_client.delete(PENDING_KEY)
+        por_periodo, por_materia = await compute_reports(db)
+
+        existentes_periodo = {
+            k.decode().split(":", 2)[2] if isinstance(k, bytes) else k.split(":", 2)[2]
+            async for k in self.redis_client.scan_iter(match=f"{PERIODO_PREFIX}*")
+        }
+        existentes_materia = {
+            k.decode().split(":", 2)[2] if isinstance(k, bytes) else k.split(":", 2)[2]
+            async for k in self.redis_client.scan_iter(match=f"{MATERIA_PREFIX}*")
+        }
+        await self._write(por_periodo, por_materia, existentes_periodo, existentes_materia)
+        await self.redis_client.set(GENERATED_KEY, datetime.now(timezone.utc).isoformat())
+        await self.redis_client.delete(REBUILD_LOCK_KEY)
+        logger.info(f"Reportes reconstruidos: {len(por_periodo)} períodos, {len(por_materia)} materias")
+        return {"periodos": len(por_periodo), "materias": len(por_materia)}
+
+    async def refresh(self, db: AsyncSession, max_pairs: int = 5000) -> Dict[str, int]:
+        """Recalcular solo los períodos y materias con cambios pendientes"""
+        pares = await self.redis_client.spop(PENDING_KEY, max_pairs)
+        if not pares:
+            return {"periodos": 0, "materias": 0}
+
+        periodos: Set[str] = set()
+        siglas: Set[str] = set()
+        for par in pares:
+            codigo, sigla = (par.decode() if isinstance(par, bytes) else par).split("|", 1)
+            periodos.add(codigo)
+            siglas.add(sigla)
+
+        try:
+            por_periodo, por_materia = await compute_reports(db, periodos, siglas)
+            await self._write(por_periodo, por_materia, periodos, siglas)
+        except Exception:
+            # Devolver los pares para el próximo ciclo
+            await self.redis_client.sadd(PENDING_KEY, *pares)
+            raise
+
+        logger.debug(f"Reportes refrescados: {len(periodos)} períodos, {len(siglas)} materias")
+        return {"periodos": len(periodos), "materias": len(siglas)}
+
+
+_report_store: Optional[HistorialReportStore] = None
+
+
+def get_historial_report_store() -> HistorialReportStore:
+    """Obtener el almacén de reportes del proceso actual"""
+    global _report_store
+    if _report_store is None:
+        _report_store = HistorialReportStore(get_async_redis())
+    return _report_store
@@ -1,6 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, desc, distinct
+from sqlalchemy import select, and_, desc
 from sqlalchemy.orm import selectinload
+from itertools import groupby
 from typing import List, Optional, Dict, Any
 from datetime import date
 from decimal import Decimal
@@ -19,6 +20,9 @@ from app.exceptions import (
     NotaInvalidaException, DatabaseException
 )
 from app.core.logging import get_logger, log_service_operation, log_database_operation, log_execution_time
+from app.services.academic_summary import get_academic_summary_store, historial_contribution
+from app.services.historial_reports import get_historial_report_store
+from app.services.transcript_cache import get_transcript_cache
 
 # Logger específico para este servicio
 logger = get_logger(__name__)
@@ -68,7 +72,8 @@ class HistorialAcademicoService:
             result = await self.db.execute(
                 select(Materia).where(Materia.sigla == historial_data.sigla_materia)
             )
-            if not result.scalar_one_or_none():
+            materia = result.scalar_one_or_none()
+            if not materia:
                 self.logger.warning(f"Materia no encontrada: {historial_data.sigla_materia}")
                 raise MateriaNoEncontradaException(historial_data.sigla_materia)
             
@@ -110,6 +115,13 @@ class HistorialAcademicoService:
             self.db.add(historial)
             await self.db.commit()
             await self.db.refresh(historial)
+            await get_transcript_cache().invalidate(historial.registro_academico)
+            await get_academic_summary_store().apply(
+                historial.registro_academico,
+                {},
+                historial_contribution(historial.estado, historial.nota_final, materia.creditos)
+            )
+            await get_historial_report_store().mark_dirty(historial.codigo_periodo, historial.sigla_materia)
             
             self.logger.info(
                 f"Registro de historial creado exitosamente: ID {historial.id_historial}",
@@ -230,41 +242,34 @@ class HistorialAcademicoService:
         
         self.logger.info(f"Consultando historial por período para estudiante {registro_academico}")
         
+        cache = get_transcript_cache()
+        cached = await cache.get(registro_academico)
+        if cached is not None:
+            self.logger.debug(f"Historial por período servido desde caché para estudiante {registro_academico}")
+            return cached
+        
         try:
-            # Obtener períodos únicos del estudiante
+            # Una sola consulta: materias del estudiante con su período, ya ordenadas para agrupar
             result = await self.db.execute(
-                select(distinct(HistorialAcademico.codigo_periodo))
+                select(HistorialAcademico, PeriodoAcademico.semestre)
+                .outerjoin(PeriodoAcademico, PeriodoAcademico.codigo_periodo == HistorialAcademico.codigo_periodo)
                 .where(HistorialAcademico.registro_academico == registro_academico)
-                .order_by(HistorialAcademico.codigo_periodo)
+                .order_by(HistorialAcademico.codigo_periodo, HistorialAcademico.sigla_materia)
             )
-            periodos = result.scalars().all()
             
             historial_por_periodo = []
             
-            for codigo_periodo in periodos:
-                # Obtener materias del período
-                materias_resultado = await self.db.execute(
-                    select(HistorialAcademico)
-                    .where(
-                        and_(
-                            HistorialAcademico.registro_academico == registro_academico,
-                            HistorialAcademico.codigo_periodo == codigo_periodo
-                        )
-                    )
-                    .order_by(HistorialAcademico.sigla_materia)
-                )
-                materias = materias_resultado.scalars().all()
+            for codigo_periodo, filas in groupby(result.all(), key=lambda fila: fila[0].codigo_periodo):
+                filas = list(filas)
+                materias = [fila[0] for fila in filas]
                 
                 # Calcular promedio del período
                 notas_validas = [m.nota_final for m in materias if m.nota_final is not None and m.estado == 'APROBADA']
                 promedio_periodo = sum(notas_validas) / len(notas_validas) if notas_validas else None
                 
-                # Obtener nombre del período
-                periodo_resultado = await self.db.execute(
-                    select(PeriodoAcademico).where(PeriodoAcademico.codigo_periodo == codigo_periodo)
-                )
-                periodo = periodo_resultado.scalar_one_or_none()
-                periodo_nombre = f"{periodo.gestion} - {periodo.semestre}" if periodo else codigo_periodo
+                # PeriodoAcademico no tiene columna de gestión; el código del período la incluye
+                semestre = filas[0][1]
+                periodo_nombre = f"{codigo_periodo} - {semestre}" if semestre else codigo_periodo
                 
                 historial_por_periodo.append(HistorialPorPeriodo(
                     codigo_periodo=codigo_periodo,
@@ -281,13 +286,14 @@ class HistorialAcademicoService:
                 }
             )
             
-            return historial_por_periodo
-            
         except Exception as exc:
             self.logger.error(
                 f"Error al consultar historial por período para estudiante {registro_academico}: {str(exc)}"
             )
             raise DatabaseException("Error al consultar historial por período", exc, "READ")
+        
+        await cache.set(registro_academico, historial_por_periodo)
+        return historial_por_periodo
 
     @log_service_operation("historial")
     @log_execution_time
@@ -297,41 +303,8 @@ class HistorialAcademicoService:
         self.logger.info(f"Generando resumen académico para estudiante {registro_academico}")
         
         try:
-            # Contar materias por estado
-            result = await self.db.execute(
-                select(
-                    func.count(HistorialAcademico.id_historial).label('total'),
-                    func.sum(func.case((HistorialAcademico.estado == 'APROBADA', 1), else_=0)).label('aprobadas'),
-                    func.sum(func.case((HistorialAcademico.estado == 'REPROBADA', 1), else_=0)).label('reprobadas'),
-                    func.sum(func.case((HistorialAcademico.estado == 'RETIRADA', 1), else_=0)).label('retiradas'),
-                    func.avg(func.case((HistorialAcademico.estado == 'APROBADA', HistorialAcademico.nota_final))).label('promedio')
-                )
-                .where(HistorialAcademico.registro_academico == registro_academico)
-            )
-            stats = result.one()
-            
-            # Calcular créditos aprobados
-            result = await self.db.execute(
-                select(func.sum(Materia.creditos))
-                .select_from(HistorialAcademico.join(Materia))
-                .where(
-                    and_(
-                        HistorialAcademico.registro_academico == registro_academico,
-                        HistorialAcademico.estado == 'APROBADA'
-                    )
-                )
-            )
-            creditos_aprobados = result.scalar() or 0
-            
-            resumen = ResumenAcademico(
-                registro_academico=registro_academico,
-                total_materias=stats.total or 0,
-                materias_aprobadas=stats.aprobadas or 0,
-                materias_reprobadas=stats.reprobadas or 0,
-                materias_retiradas=stats.retiradas or 0,
-                promedio_general=stats.promedio,
-                creditos_aprobados=creditos_aprobados
-            )
+            # Lectura puntual del resumen materializado (se calcula solo si no existe)
+            resumen = await get_academic_summary_store().get(self.db, registro_academico)
             
             self.logger.info(
                 f"Resumen académico generado",
@@ -364,8 +337,13 @@ class HistorialAcademicoService:
         self.logger.info(f"Actualizando registro de historial ID: {id_historial}")
         
         try:
+            # Bloquear la fila: el aporte anterior al resumen debe ser el de la
+            # última versión confirmada, no el de otra actualización concurrente
             result = await self.db.execute(
-                select(HistorialAcademico).where(HistorialAcademico.id_historial == id_historial)
+                select(HistorialAcademico)
+                .where(HistorialAcademico.id_historial == id_historial)
+                .with_for_update()
+                .execution_options(populate_existing=True)
             )
             historial = result.scalar_one_or_none()
             
@@ -382,6 +360,9 @@ class HistorialAcademicoService:
                 if not (0 <= historial_data.nota_final <= 100):
                     raise NotaInvalidaException(historial_data.nota_final)
             
+            creditos = await self._creditos_materia(historial.sigla_materia)
+            aporte_anterior = historial_contribution(historial.estado, historial.nota_final, creditos)
+            
             # Actualizar campos
             update_data = historial_data.dict(exclude_unset=True)
             campos_actualizados = []
@@ -393,6 +374,13 @@ class HistorialAcademicoService:
             
             await self.db.commit()
             await self.db.refresh(historial)
+            await get_transcript_cache().invalidate(historial.registro_academico)
+            await get_academic_summary_store().apply(
+                historial.registro_academico,
+                aporte_anterior,
+                historial_contribution(historial.estado, historial.nota_final, creditos)
+            )
+            await get_historial_report_store().mark_dirty(historial.codigo_periodo, historial.sigla_materia)
             
             self.logger.info(
                 f"Registro de historial actualizado exitosamente",
@@ -419,8 +407,13 @@ class HistorialAcademicoService:
         self.logger.info(f"Eliminando registro de historial ID: {id_historial}")
         
         try:
+            # Bloquear la fila: el aporte anterior al resumen debe ser el de la
+            # última versión confirmada, no el de otra actualización concurrente
             result = await self.db.execute(
-                select(HistorialAcademico).where(HistorialAcademico.id_historial == id_historial)
+                select(HistorialAcademico)
+                .where(HistorialAcademico.id_historial == id_historial)
+                .with_for_update()
+                .execution_options(populate_existing=True)
             )
             historial = result.scalar_one_or_none()
             
@@ -430,9 +423,16 @@ class HistorialAcademicoService:
             
             registro_academico = historial.registro_academico
             sigla_materia = historial.sigla_materia
+            codigo_periodo = historial.codigo_periodo
+            aporte_anterior = historial_contribution(
+                historial.estado, historial.nota_final, await self._creditos_materia(sigla_materia)
+            )
             
             await self.db.delete(historial)
             await self.db.commit()
+            await get_transcript_cache().invalidate(registro_academico)
+            await get_academic_summary_store().apply(registro_academico, aporte_anterior, {})
+            await get_historial_report_store().mark_dirty(codigo_periodo, sigla_materia)
             
             self.logger.info(
                 f"Registro de historial eliminado exitosamente",
@@ -450,6 +450,10 @@ class HistorialAcademicoService:
             await self.db.rollback()
             raise DatabaseException("Error al eliminar registro de historial", exc, "DELETE")
 
+    async def _creditos_materia(self, sigla_materia: str) -> Optional[int]:
+        result = await self.db.execute(select(Materia.creditos).where(Materia.sigla == sigla_materia))
+        return result.scalar_one_or_none()
+
     @log_service_operation("historial")
     @log_database_operation("READ")
     async def get_materias_por_estado(
@@ -0,0 +1,222 @@
+"""
+Snapshot de estadísticas de colas y workers refrescado en segundo plano.
+
+Cada `inspect()` de Celery es un broadcast que espera el timeout completo; los
+endpoints de estadísticas hacían varios seguidos por request. Aquí un único
+colector por proceso lanza una ronda por intervalo (stats, active, scheduled,
+reserved y active_queues en paralelo, con un solo timeout) y lee las longitudes
+de las colas en el broker con LLEN, junto con las métricas de tareas que los
+workers vuelcan a Redis. Los endpoints solo leen el último snapshot.
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import redis.asyncio as aioredis
+
+from app.core import task_metrics
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.metrics import instrument_redis
+
+logger = get_logger(__name__)
+
+_INSPECT_METHODS = ("stats", "active", "scheduled", "reserved", "active_queues")
+
+# Totales de tareas mantenidos en Redis por los workers
+_COUNTER_KEYS = ("completed_tasks", "failed_tasks")
+
+
+def _empty_snapshot() -> Dict[str, Any]:
+    return {
+        "collected_at": None,
+        "workers": {},
+        "active_tasks": 0,
+        "pending_tasks": 0,
+        "workers_online": 0,
+        "completed_tasks": 0,
+        "failed_tasks": 0,
+        "queue_lengths": {},
+        "queues": [],
+        "task_metrics": None,
+        "error": None,
+    }
+
+
+class QueueStatsCollector:
+    """Refresca periódicamente un snapshot de colas/workers"""
+
+    def __init__(self, interval: float = 5.0, inspect_timeout: float = 1.0, throughput_window: int = 60):
+        self.interval = interval
+        self.inspect_timeout = inspect_timeout
+        self.throughput_window = throughput_window
+        self._snapshot: Dict[str, Any] = _empty_snapshot()
+        self._collected_monotonic: Optional[float] = None
+        self._clients: Dict[str, aioredis.Redis] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    # ----- lectura -----
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Último snapshot con su antigüedad; arranca el colector si no corre"""
+        self.ensure_started()
+        snapshot = dict(self._snapshot)
+        if self._collected_monotonic is None:
+            snapshot["age_seconds"] = None
+            snapshot["stale"] = True
+        else:
+            age = time.monotonic() - self._collected_monotonic
+            snapshot["age_seconds"] = round(age, 3)
+            snapshot["stale"] = age > self.interval * 3
+        return snapshot
+
+    # ----- recolección -----
+
+    def _queue_names(self) -> List[str]:
+        return [q.name for q in celery_app.conf.task_queues or ()]
+
+    def _inspect(self, method: str) -> Dict[str, Any]:
+        # Un Inspect por hilo: cada uno usa su propia conexión al broker
+        inspect = celery_app.control.inspect(timeout=self.inspect_timeout)
+        return getattr(inspect, method)() or {}
+
+    async def _inspect_round(self) -> Dict[str, Dict[str, Any]]:
+        results = await asyncio.gather(
+            *(asyncio.to_thread(self._inspect, method) for method in _INSPECT_METHODS)
+        )
+        return dict(zip(_INSPECT_METHODS, results))
+
+    def _client(self, url: str) -> aioredis.Redis:
+        if url not in self._clients:
+            self._clients[url] = instrument_redis(aioredis.Redis.from_url(url))
+        return self._clients[url]
+
+    async def _broker_reads(self, queue_names: List[str]) -> Dict[str, int]:
+        async with self._client(settings.CELERY_BROKER_URL).pipeline(transaction=False) as pipe:
+            for name in queue_names:
+                pipe.llen(name)
+            results = await pipe.execute()
+        return dict(zip(queue_names, (int(n) for n in results)))
+
+    async def _metrics_reads(self):
+        """Contadores y métricas de tareas volcados por los workers (app.core.task_metrics)"""
+        second = int(time.time())
+        async with self._client(settings.REDIS_URL).pipeline(transaction=False) as pipe:
+            pipe.mget(_COUNTER_KEYS)
+            pipe.hgetall(task_metrics.COUNTERS_KEY)
+            pipe.hgetall(task_metrics.RUNTIME_KEY)
+            pipe.hgetall(task_metrics.WAIT_KEY)
+            # Ventana de throughput: segundos completos, sin el actual
+            for s in range(second - self.throughput_window, second):
+                pipe.hgetall(f"{task_metrics.DONE_KEY_PREFIX}{s}")
+            results = await pipe.execute()
+        counters = {key: int(value or 0) for key, value in zip(_COUNTER_KEYS, results[0])}
+        summary = task_metrics.summarize(
+            results[1], results[2], results[3], results[4:], self.throughput_window
+        )
+        return counters, summary
+
+    async def collect(self) -> Dict[str, Any]:
+        """Una ronda de inspect + lecturas del broker; publica el snapshot"""
+        queue_names = self._queue_names()
+        inspected, lengths, (counters, metrics) = await asyncio.gather(
+            self._inspect_round(), self._broker_reads(queue_names), self._metrics_reads()
+        )
+        stats, active = inspected["stats"], inspected["active"]
+        scheduled, reserved = inspected["scheduled"], inspected["reserved"]
+
+        workers = {}
+        for worker_name, worker_stats in stats.items():
+            workers[worker_name] = {
+                "name": worker_name,
+                "status": "online",
+                "active_tasks": len(active.get(worker_name, [])),
+                "processed_tasks": worker_stats.get("total", {}).get(
+                    "tasks.inscription_worker.create_inscription_task", 0
+                ),
+                "load_avg": worker_stats.get("rusage", {}).get("utime", 0),
+                "pool": worker_stats.get("pool", {}),
+            }
+
+        queues: Dict[str, Dict[str, Any]] = {}
+        for worker_name, worker_queues in inspected["active_queues"].items():
+            for queue in worker_queues:
+                queue_name = queue.get("name", "unknown")
+                if queue_name not in queues:
+                    queues[queue_name] = {
+                        "name": queue_name,
+                        "workers": [],
+                        "routing_key": queue.get("routing_key"),
+                        "exchange": queue.get("exchange", {}).get("name"),
+                        "length": lengths.get(queue_name),
+                    }
+                queues[queue_name]["workers"].append(worker_name)
+
+        self._snapshot = {
+            "collected_at": datetime.now(timezone.utc).isoformat(),
+            "workers": workers,
+            "active_tasks": sum(len(t) for t in active.values()),
+            "pending_tasks": (
+                sum(len(t) for t in scheduled.values())
+                + sum(len(t) for t in reserved.values())
+            ),
+            "workers_online": len(stats),
+            "completed_tasks": counters["completed_tasks"],
+            "failed_tasks": counters["failed_tasks"],
+            "queue_lengths": lengths,
+            "queues": list(queues.values()),
+            "task_metrics": metrics,
+            "error": None,
+        }
+        self._collected_monotonic = time.monotonic()
+        return self._snapshot
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                await self.collect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Se conserva el último snapshot; su antigüedad delata el fallo
+                logger.warning(f"No se pudieron recolectar estadísticas de colas: {e}")
+                self._snapshot = {**self._snapshot, "error": f"{type(e).__name__}: {e}"}
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    # ----- ciclo de vida -----
+
+    def ensure_started(self) -> None:
+        """Arrancar el colector en el loop actual (una vez)"""
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+
+
+queue_stats_collector = QueueStatsCollector(
+    interval=settings.QUEUE_STATS_INTERVAL,
+    inspect_timeout=settings.QUEUE_STATS_INSPECT_TIMEOUT,
+)
+
+
+def get_queue_stats_collector() -> QueueStatsCollector:
+    """Obtener el colector de estadísticas del proceso actual"""
+    return queue_stats_collector
@@ -0,0 +1,182 @@
+"""
+Índice en memoria de horarios de grupos para validar conflictos.
+
+Cada grupo se representa como una máscara de bits por día con granularidad de
+minuto (bit i = minuto i del día, intervalo semiabierto [inicio, fin)). Validar
+k grupos es O(k) operaciones AND/OR sobre enteros, sin consultas a la base.
+
+El índice se carga con una sola consulta Grupo JOIN Horario, se comparte entre
+InscripcionService y las tareas de Celery del mismo proceso, y se recarga al
+vencer su TTL o cuando se modifican filas de `grupo`/`horario` en una sesión
+de este proceso (ver `invalidate()`).
+
+Nota: en este esquema `grupo` no tiene columna de período, por lo que el
+índice cubre todo el catálogo de grupos.
+"""
+import asyncio
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.models import Grupo, Horario
+
+logger = get_logger(__name__)
+
+
+def _normalizar_dia(dia: str) -> str:
+    """'Miércoles ' -> 'MIERCOLES'"""
+    sin_tildes = unicodedata.normalize("NFKD", dia).encode("ascii", "ignore").decode()
+    return sin_tildes.strip().upper()
+
+
+def _minutos(hora) -> int:
+    return hora.hour * 60 + hora.minute
+
+
+@dataclass
+class ScheduleSlot:
+    """Horario semanal de un grupo como máscaras de minutos por día"""
+    codigo_grupo: str
+    dias_semana: List[str]
+    hora_inicio: object
+    hora_fin: object
+    masks: Dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, codigo_grupo: str, dias_semana: Iterable[str], hora_inicio, hora_fin) -> "ScheduleSlot":
+        dias = list(dias_semana or [])
+        inicio, fin = _minutos(hora_inicio), _minutos(hora_fin)
+        mask = ((1 << (fin - inicio)) - 1) << inicio if fin > inicio else 0
+        masks = {_normalizar_dia(d): mask for d in dias} if mask else {}
+        return cls(codigo_grupo, dias, hora_inicio, hora_fin, masks)
+
+    def dias_comunes(self, other: "ScheduleSlot") -> List[str]:
+        comunes = set(self.masks) & set(other.masks)
+        return [d for d in self.dias_semana if _normalizar_dia(d) in comunes]
+
+    def overlaps(self, other: "ScheduleSlot") -> bool:
+        return any(other.masks.get(dia, 0) & mask for dia, mask in self.masks.items())
+
+
+class ScheduleConflictIndex:
+    """Índice de horarios por grupo con recarga perezosa"""
+
+    def __init__(self, ttl_seconds: float = 300.0, min_reload_interval: float = 1.0):
+        self.ttl_seconds = ttl_seconds
+        self.min_reload_interval = min_reload_interval
+        self._slots: Dict[str, ScheduleSlot] = {}
+        self._loaded_at = 0.0
+        self._stale = True
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def is_fresh(self) -> bool:
+        return not self._stale and (time.monotonic() - self._loaded_at) < self.ttl_seconds
+
+    def invalidate(self) -> None:
+        """Marcar el índice para recarga en la próxima validación"""
+        self._stale = True
+
+    async def load(self, db: AsyncSession) -> int:
+        """Cargar todos los horarios de grupos con una sola consulta"""
+        result = await db.execute(
+            select(Grupo.codigo_grupo, Horario.dias_semana, Horario.hora_inicio, Horario.hora_fin)
+            .join(Horario, Grupo.codigo_horario == Horario.codigo_horario)
+        )
+        # Construir fuera del dict publicado para que los lectores nunca vean un índice a medias
+        slots = {
+            codigo: ScheduleSlot.build(codigo, dias, inicio, fin)
+            for codigo, dias, inicio, fin in result
+        }
+        self._slots = slots
+        self._loaded_at = time.monotonic()
+        self._stale = False
+        logger.info(f"Índice de horarios cargado: {len(slots)} grupos")
+        return len(slots)
+
+    async def ensure_loaded(self, db: AsyncSession, codigos_grupos: Iterable[str] = ()) -> None:
+        """
+        Recargar si el índice venció, fue invalidado o no conoce alguno de los
+        grupos pedidos (p. ej. un grupo creado después de la última carga).
+        """
+        desconocidos = any(c not in self._slots for c in codigos_grupos)
+        if self.is_fresh and not desconocidos:
+            return
+        if self.is_fresh and (time.monotonic() - self._loaded_at) < self.min_reload_interval:
+            return
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.is_fresh and (time.monotonic() - self._loaded_at) < self.min_reload_interval:
+                return
+            await self.load(db)
+
+    def get(self, codigo_grupo: str) -> Optional[ScheduleSlot]:
+        return self._slots.get(codigo_grupo)
+
+    def find_conflict(
+        self,
+        codigos_nuevos: Iterable[str],
+        codigos_existentes: Iterable[str] = (),
+        check_among_new: bool = True
+    ) -> Optional[Tuple[ScheduleSlot, ScheduleSlot]]:
+        """
+        Buscar el primer par en conflicto. Devuelve (grupo_previo, grupo_nuevo),
+        donde grupo_previo es un grupo existente o un nuevo anterior en la lista.
+        Los grupos sin horario se ignoran, igual que con el JOIN original.
+        """
+        slots = self._slots
+        existentes = [slots[c] for c in codigos_existentes if c in slots]
+        ocupado_existentes: Dict[str, int] = {}
+        for slot in existentes:
+            for dia, mask in slot.masks.items():
+                ocupado_existentes[dia] = ocupado_existentes.get(dia, 0) | mask
+
+        vistos: List[ScheduleSlot] = []
+        ocupado_nuevos: Dict[str, int] = {}
+        for codigo in codigos_nuevos:
+            slot = slots.get(codigo)
+            if slot is None:
+                continue
+            for dia, mask in slot.masks.items():
+                if ocupado_existentes.get(dia, 0) & mask:
+                    return next(e for e in existentes if e.overlaps(slot)), slot
+                if check_among_new and ocupado_nuevos.get(dia, 0) & mask:
+                    return next(v for v in vistos if v.overlaps(slot)), slot
+            if check_among_new:
+                for dia, mask in slot.masks.items():
+                    ocupado_nuevos[dia] = ocupado_nuevos.get(dia, 0) | mask
+                vistos.append(slot)
+        return None
+
+
+schedule_index = ScheduleConflictIndex(ttl_seconds=settings.SCHEDULE_INDEX_TTL)
+
+
+def get_schedule_index() -> ScheduleConflictIndex:
+    """Obtener el índice de horarios del proceso actual"""
+    return schedule_index
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_catalog_change(session, flush_context):
+    """Invalidar el índice cuando una sesión de este proceso modifica grupo/horario"""
+    for obj in (*session.new, *session.deleted):
+        if isinstance(obj, (Grupo, Horario)):
+            schedule_index.invalidate()
+            return
+    for obj in session.dirty:
+        # Los cambios de inscritos_actuales no afectan horarios
+        if isinstance(obj, Horario) or (
+            isinstance(obj, Grupo) and inspect(obj).attrs.codigo_horario.history.has_changes()
+        ):
+            schedule_index.invalidate()
+            return
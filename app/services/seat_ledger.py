@@ -0,0 +1,465 @@
+"""
+Ledger de cupos en Redis con write-behind hacia Postgres.
+
+En modo ledger (SEAT_LEDGER_ENABLED) el cupo libre de cada grupo vive en Redis
+(`seat_ledger:remaining:<codigo_grupo>`). Un script Lua descuenta atómicamente
+los cupos de todos los grupos de una solicitud (todo o nada), de modo que las
+solicitudes rechazadas nunca tocan la base de datos. Cada reserva/liberación
+acumula un delta en `seat_ledger:pending`, que una tarea de Celery aplica
+periódicamente a `grupo.inscritos_actuales`.
+
+Junto al cupo libre se guardan el cupo total de cada grupo (`seat_ledger:cupo`,
+para informar un rechazo sin consultar la base) y los grupos confirmados de cada
+estudiante por período (`seat_ledger:inscritos:<registro>:<periodo>`), para no
+retener cupo en grupos en los que ya está inscrito. Ese set puede sobrar (un
+retiro no lo limpia; la ruta de base de datos vuelve a reservar el grupo) pero
+no faltar: `repair` lo reconstruye desde detalle_inscripcion.
+
+Uso como comando de reparación:
+    python -m app.services.seat_ledger reconcile
+    python -m app.services.seat_ledger repair [--recount]
+"""
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import redis.asyncio as aioredis
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.redis_client import close_async_redis, get_async_redis
+from app.services.seat_reservation import SeatReservation, release_grupo_seats, reserve_grupo_seats_or_raise
+
+logger = get_logger(__name__)
+
+REMAINING_PREFIX = "seat_ledger:remaining:"
+PENDING_KEY = "seat_ledger:pending"
+CUPO_KEY = "seat_ledger:cupo"
+ENROLLED_PREFIX = "seat_ledger:inscritos:"
+
+# KEYS[1] = pending, KEYS[2..] = remaining por grupo; ARGV = códigos de grupo.
+# Devuelve {reservado, estado_1, ..., estado_n} con estado 1=ok, 0=lleno, -1=no cargado.
+_RESERVE_LUA = """
+local statuses = {}
+local ok = 1
+for i = 2, #KEYS do
+    local value = redis.call('GET', KEYS[i])
+    if not value then
+        statuses[i - 1] = -1
+        ok = 0
+    elseif tonumber(value) <= 0 then
+        statuses[i - 1] = 0
+        ok = 0
+    else
+        statuses[i - 1] = 1
+    end
+end
+if ok == 1 then
+    for i = 2, #KEYS do
+        redis.call('DECR', KEYS[i])
+        redis.call('HINCRBY', KEYS[1], ARGV[i - 1], 1)
+    end
+end
+table.insert(statuses, 1, ok)
+return statuses
+"""
+
+_RELEASE_LUA = """
+for i = 2, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('INCR', KEYS[i])
+    end
+    redis.call('HINCRBY', KEYS[1], ARGV[i - 1], -1)
+end
+return #KEYS - 1
+"""
+
+# KEYS[1] = pending, KEYS[2] = cupo, KEYS[3..] = remaining por grupo.
+# ARGV = tríos (codigo_grupo, cupo_libre_en_bd, cupo). No sobrescribe el cupo
+# libre existente y descuenta los deltas aún no aplicados a Postgres.
+_PRIME_LUA = """
+for i = 3, #KEYS do
+    local codigo = ARGV[(i - 3) * 3 + 1]
+    local libre = tonumber(ARGV[(i - 3) * 3 + 2])
+    local pendiente = tonumber(redis.call('HGET', KEYS[1], codigo) or '0')
+    redis.call('SET', KEYS[i], libre - pendiente, 'NX')
+    redis.call('HSET', KEYS[2], codigo, ARGV[(i - 3) * 3 + 3])
+end
+return #KEYS - 2
+"""
+
+_DRAIN_LUA = """
+local data = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return data
+"""
+
+_APPLY_DELTAS_SQL = text("""
+    WITH deltas AS (
+        SELECT unnest(CAST(:ids AS varchar[])) AS codigo_grupo,
+               unnest(CAST(:deltas AS integer[])) AS delta
+    ),
+    objetivo AS (
+        SELECT g.codigo_grupo
+        FROM grupo g
+        JOIN deltas d ON d.codigo_grupo = g.codigo_grupo
+        ORDER BY g.codigo_grupo
+        FOR UPDATE
+    )
+    UPDATE grupo g
+    SET inscritos_actuales = GREATEST(COALESCE(g.inscritos_actuales, 0) + d.delta, 0)
+    FROM deltas d, objetivo o
+    WHERE g.codigo_grupo = d.codigo_grupo AND o.codigo_grupo = g.codigo_grupo
+""")
+
+_RECOUNT_SQL = text("""
+    UPDATE grupo g
+    SET inscritos_actuales = c.total
+    FROM (
+        SELECT g2.codigo_grupo, count(d.codigo_detalle) AS total
+        FROM grupo g2
+        LEFT JOIN detalle_inscripcion d ON d.codigo_grupo = g2.codigo_grupo
+        GROUP BY g2.codigo_grupo
+    ) c
+    WHERE g.codigo_grupo = c.codigo_grupo
+""")
+
+
+_ENROLLED_SQL = text("""
+    SELECT i.registro_academico, i.codigo_periodo, d.codigo_grupo
+    FROM detalle_inscripcion d
+    JOIN inscripcion i ON i.codigo_inscripcion = d.codigo_inscripcion
+""")
+
+
+def _remaining_key(codigo_grupo: str) -> str:
+    return f"{REMAINING_PREFIX}{codigo_grupo}"
+
+
+def _enrolled_key(registro_academico: str, codigo_periodo: str) -> str:
+    return f"{ENROLLED_PREFIX}{registro_academico}:{codigo_periodo}"
+
+
+class SeatHold:
+    """Cupos retenidos en el ledger durante una solicitud"""
+
+    def __init__(self, ledger: "SeatLedger", reserved: Iterable[str]):
+        self.ledger = ledger
+        self.reserved = set(reserved)
+        self.committed: set = set()
+        self.enrolled: set = set()
+
+    async def extend(self, codigos_grupos: Iterable[str], db: Optional[AsyncSession] = None) -> None:
+        """Retener también los grupos que aún no estaban en la retención"""
+        faltantes = set(codigos_grupos) - self.reserved
+        if faltantes:
+            self.reserved.update(await self.ledger.reserve_or_raise(faltantes, db))
+
+    def commit(self, codigos_grupos: Iterable[str]) -> None:
+        """Marcar cupos como usados; el resto se devuelve al cerrar la retención"""
+        self.committed.update(c for c in codigos_grupos if c in self.reserved)
+
+    def mark_enrolled(self, codigos_grupos: Iterable[str]) -> None:
+        """Grupos ya inscritos encontrados en la base, para registrarlos en el ledger"""
+        self.enrolled.update(codigos_grupos)
+
+    async def release_uncommitted(self) -> None:
+        sobrantes = self.reserved - self.committed
+        if sobrantes:
+            await self.ledger.release(sobrantes)
+        self.reserved = set(self.committed)
+
+    async def release_all(self) -> None:
+        if self.reserved:
+            await self.ledger.release(self.reserved)
+        self.reserved = set()
+        self.committed = set()
+
+
+class SeatLedger:
+    """Contadores de cupo libre en Redis con reconciliación hacia Postgres"""
+
+    def __init__(self, redis_client: aioredis.Redis):
+        self.redis_client = redis_client
+        self._reserve = redis_client.register_script(_RESERVE_LUA)
+        self._release = redis_client.register_script(_RELEASE_LUA)
+        self._prime = redis_client.register_script(_PRIME_LUA)
+        self._drain = redis_client.register_script(_DRAIN_LUA)
+
+    async def try_reserve(self, codigos_grupos: Iterable[str]) -> SeatReservation:
+        """Intentar reservar un cupo en cada grupo (todo o nada)"""
+        ids = sorted(set(codigos_grupos))
+        reservation = SeatReservation()
+        if not ids:
+            return reservation
+
+        keys = [PENDING_KEY] + [_remaining_key(c) for c in ids]
+        ok, *statuses = await self._reserve(keys=keys, args=ids)
+        if int(ok) == 1:
+            reservation.reserved = ids
+            return reservation
+
+        for codigo_grupo, estado in zip(ids, statuses):
+            if int(estado) == -1:
+                reservation.missing.append(codigo_grupo)
+            elif int(estado) == 0:
+                reservation.full[codigo_grupo] = (0, 0)
+        return reservation
+
+    async def fill_capacity(self, reservation: SeatReservation) -> List[str]:
+        """(cupo, inscritos) de los grupos llenos según Redis; devuelve los sin cupo total cargado"""
+        ids = sorted(reservation.full)
+        cupos = await self.redis_client.hmget(CUPO_KEY, ids)
+        libres = await self.redis_client.mget([_remaining_key(c) for c in ids])
+        sin_cupo = []
+        for codigo_grupo, cupo, libre in zip(ids, cupos, libres):
+            if cupo is None:
+                sin_cupo.append(codigo_grupo)
+                continue
+            reservation.full[codigo_grupo] = (int(cupo), int(cupo) - max(int(libre or 0), 0))
+        return sin_cupo
+
+    async def reserve_or_raise(
+        self,
+        codigos_grupos: Iterable[str],
+        db: Optional[AsyncSession] = None,
+        session_factory: Optional[async_sessionmaker] = None
+    ) -> List[str]:
+        """
+        Reservar cupos en el ledger. Si algún grupo aún no está cargado se carga
+        desde Postgres (con `db` o una sesión nueva de `session_factory`) y se
+        reintenta una vez; es el único caso en que una reserva toca la base.
+        """
+        codigos_grupos = list(codigos_grupos)
+        reservation = await self.try_reserve(codigos_grupos)
+        if reservation.missing and not reservation.full:
+            if db is not None:
+                await self.prime(db, reservation.missing)
+            elif session_factory is not None:
+                async with session_factory() as session:
+                    await self.prime(session, reservation.missing)
+            if db is not None or session_factory is not None:
+                reservation = await self.try_reserve(codigos_grupos)
+
+        if reservation.full and not reservation.missing:
+            sin_cupo = await self.fill_capacity(reservation)
+            # Grupos cargados antes de que el ledger guardara el cupo total
+            if sin_cupo and db is not None:
+                await self.prime(db, sin_cupo)
+                await self.fill_capacity(reservation)
+            elif sin_cupo and session_factory is not None:
+                async with session_factory() as session:
+                    await self.prime(session, sin_cupo)
+                await self.fill_capacity(reservation)
+        reservation.raise_for_status()
+        return reservation.reserved
+
+    async def release(self, codigos_grupos: Iterable[str]) -> None:
+        """Devolver un cupo a cada grupo"""
+        ids = sorted(set(codigos_grupos))
+        if ids:
+            await self._release(keys=[PENDING_KEY] + [_remaining_key(c) for c in ids], args=ids)
+
+    async def enrolled_grupos(self, registro_academico: str, codigo_periodo: str) -> Set[str]:
+        """Grupos confirmados del estudiante en el período según el ledger"""
+        miembros = await self.redis_client.smembers(_enrolled_key(registro_academico, codigo_periodo))
+        return {m.decode() if isinstance(m, bytes) else m for m in miembros}
+
+    async def record_enrolled(self, inscritos: Iterable[Tuple[str, str, Iterable[str]]]) -> None:
+        """Registrar (registro, periodo, grupos) confirmados en Postgres"""
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for registro_academico, codigo_periodo, codigos_grupos in inscritos:
+                    codigos_grupos = sorted(set(codigos_grupos))
+                    if codigos_grupos:
+                        pipe.sadd(_enrolled_key(registro_academico, codigo_periodo), *codigos_grupos)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"No se pudieron registrar grupos inscritos en el ledger: {e}")
+
+    @asynccontextmanager
+    async def hold(
+        self,
+        codigos_grupos: Iterable[str],
+        db: Optional[AsyncSession] = None,
+        session_factory: Optional[async_sessionmaker] = None,
+        owner: Optional[Tuple[str, str]] = None
+    ):
+        """
+        Retener cupos durante una operación. Si la operación falla se liberan
+        todos; si termina bien se liberan solo los no confirmados con commit().
+        Con `owner` (registro, periodo) los grupos ya inscritos según el ledger
+        no se retienen, y los confirmados quedan registrados al terminar.
+        """
+        codigos_grupos = list(codigos_grupos)
+        if owner is not None:
+            ya_inscritos = await self.enrolled_grupos(*owner)
+            codigos_grupos = [c for c in codigos_grupos if c not in ya_inscritos]
+        reserved = await self.reserve_or_raise(codigos_grupos, db, session_factory)
+        seat_hold = SeatHold(self, reserved)
+        try:
+            yield seat_hold
+        except BaseException:
+            await seat_hold.release_all()
+            raise
+        await seat_hold.release_uncommitted()
+        if owner is not None:
+            await self.record_enrolled([(*owner, seat_hold.committed | seat_hold.enrolled)])
+
+    async def prime(self, db: AsyncSession, codigos_grupos: Optional[Iterable[str]] = None) -> int:
+        """Cargar en Redis el cupo libre de los grupos que aún no están en el ledger"""
+        query = "SELECT codigo_grupo, cupo, COALESCE(inscritos_actuales, 0) FROM grupo"
+        params: Dict[str, object] = {}
+        if codigos_grupos is not None:
+            query += " WHERE codigo_grupo = ANY(:ids)"
+            params["ids"] = sorted(set(codigos_grupos))
+        result = await db.execute(text(query), params)
+        rows = result.all()
+        if not rows:
+            return 0
+
+        keys = [PENDING_KEY, CUPO_KEY] + [_remaining_key(r[0]) for r in rows]
+        args: List[object] = []
+        for codigo_grupo, cupo, inscritos in rows:
+            args.extend([codigo_grupo, max((cupo or 0) - inscritos, 0), cupo or 0])
+        return int(await self._prime(keys=keys, args=args))
+
+    async def reconcile(self, db: AsyncSession) -> Dict[str, int]:
+        """Aplicar a grupo.inscritos_actuales los deltas acumulados en Redis"""
+        raw = await self._drain(keys=[PENDING_KEY])
+        deltas: Dict[str, int] = {}
+        for i in range(0, len(raw), 2):
+            codigo = raw[i].decode() if isinstance(raw[i], bytes) else raw[i]
+            delta = int(raw[i + 1])
+            if delta:
+                deltas[codigo] = delta
+        if not deltas:
+            return {}
+
+        try:
+            ids = sorted(deltas)
+            await db.execute(_APPLY_DELTAS_SQL, {"ids": ids, "deltas": [deltas[c] for c in ids]})
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            # Devolver los deltas para el próximo ciclo
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                for codigo, delta in deltas.items():
+                    pipe.hincrby(PENDING_KEY, codigo, delta)
+                await pipe.execute()
+            raise
+
+        logger.debug(f"Ledger de cupos reconciliado: {len(deltas)} grupos")
+        return deltas
+
+    async def repair(self, db: AsyncSession, recount: bool = False) -> int:
+        """
+        Reconstruir el ledger desde Postgres. Con recount=True primero recalcula
+        grupo.inscritos_actuales contando detalle_inscripcion. Debe ejecutarse
+        con el tráfico de inscripción detenido.
+        """
+        await self.reconcile(db)
+        if recount:
+            await db.execute(_RECOUNT_SQL)
+            await db.commit()
+
+        result = await db.execute(text("SELECT codigo_grupo, cupo, COALESCE(inscritos_actuales, 0) FROM grupo"))
+        rows = result.all()
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(CUPO_KEY)
+            for codigo_grupo, cupo, inscritos in rows:
+                pipe.set(_remaining_key(codigo_grupo), max((cupo or 0) - inscritos, 0))
+                pipe.hset(CUPO_KEY, codigo_grupo, cupo or 0)
+            await pipe.execute()
+
+        async for key in self.redis_client.scan_iter(match=f"{ENROLLED_PREFIX}*"):
+            await self.redis_client.delete(key)
+        result = await db.execute(_ENROLLED_SQL)
+        inscritos: Dict[Tuple[str, str], List[str]] = {}
+        for registro_academico, codigo_periodo, codigo_grupo in result.all():
+            inscritos.setdefault((registro_academico, codigo_periodo), []).append(codigo_grupo)
+        await self.record_enrolled((r, p, g) for (r, p), g in inscritos.items())
+        logger.info(f"Ledger de cupos reconstruido para {len(rows)} grupos")
+        return len(rows)
+
+    async def snapshot(self, codigos_grupos: Iterable[str]) -> Dict[str, Optional[int]]:
+        """Cupo libre actual según el ledger"""
+        ids = sorted(set(codigos_grupos))
+        if not ids:
+            return {}
+        values = await self.redis_client.mget([_remaining_key(c) for c in ids])
+        return {c: (int(v) if v is not None else None) for c, v in zip(ids, values)}
+
+
+_seat_ledger: Optional[SeatLedger] = None
+
+
+def get_seat_ledger() -> SeatLedger:
+    """Obtener el ledger de cupos del proceso actual"""
+    global _seat_ledger
+    if _seat_ledger is None:
+        _seat_ledger = SeatLedger(get_async_redis())
+    return _seat_ledger
+
+
+@asynccontextmanager
+async def hold_grupo_seats(
+    db: AsyncSession,
+    codigos_grupos: Iterable[str],
+    owner: Optional[Tuple[str, str]] = None
+):
+    """
+    Reservar cupos según el modo configurado: ledger en Redis o UPDATE
+    condicional dentro de la transacción actual. `owner` = (registro, periodo).
+    """
+    codigos_grupos = list(codigos_grupos)
+    if settings.SEAT_LEDGER_ENABLED:
+        async with get_seat_ledger().hold(codigos_grupos, db, owner=owner) as seat_hold:
+            # Quien llama ya descartó duplicados: todos los grupos llevan cupo,
+            # incluso los que el ledger recuerda de una inscripción retirada
+            await seat_hold.extend(codigos_grupos, db)
+            yield seat_hold
+            seat_hold.commit(codigos_grupos)
+    else:
+        await reserve_grupo_seats_or_raise(db, codigos_grupos)
+        yield None
+
+
+async def commit_releasing_seats(db: AsyncSession, codigos_grupos: Iterable[str]) -> None:
+    """
+    Liberar cupos y confirmar la transacción. En modo ledger el cupo se devuelve
+    a Redis solo después del commit, para no reofrecerlo si el commit falla.
+    """
+    codigos_grupos = list(codigos_grupos)
+    if settings.SEAT_LEDGER_ENABLED:
+        await db.commit()
+        await get_seat_ledger().release(codigos_grupos)
+    else:
+        await release_grupo_seats(db, codigos_grupos)
+        await db.commit()
+
+
+async def _main(argv: Optional[List[str]] = None) -> None:
+    from app.core.database import AsyncSessionLocal
+
+    parser = argparse.ArgumentParser(description="Reconciliación del ledger de cupos")
+    parser.add_argument("command", choices=["reconcile", "repair"])
+    parser.add_argument("--recount", action="store_true", help="Recalcular inscritos desde detalle_inscripcion")
+    args = parser.parse_args(argv)
+
+    ledger = get_seat_ledger()
+    async with AsyncSessionLocal() as db:
+        if args.command == "reconcile":
+            deltas = await ledger.reconcile(db)
+            print(f"Deltas aplicados: {deltas}")
+        else:
+            total = await ledger.repair(db, recount=args.recount)
+            print(f"Ledger reconstruido para {total} grupos")
+    await close_async_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,160 @@
+"""
+Reserva atómica de cupos en grupos.
+
+Reemplaza el patrón SELECT ... FOR UPDATE + incremento por grupo (2N viajes a la
+base de datos con filas bloqueadas) por una única sentencia que bloquea los
+grupos en orden determinista, verifica el cupo de todos y solo incrementa si
+todos tienen lugar (todo o nada).
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.exceptions import GrupoNoEncontradoException, GrupoSinCupoException
+
+# Los grupos se bloquean ordenados por código: dos inscripciones concurrentes
+# que comparten grupos siempre adquieren los locks en el mismo orden.
+_RESERVAR_CUPOS_SQL = text("""
+    WITH objetivo AS (
+        SELECT codigo_grupo, cupo, COALESCE(inscritos_actuales, 0) AS inscritos
+        FROM grupo
+        WHERE codigo_grupo = ANY(:ids)
+        ORDER BY codigo_grupo
+        FOR UPDATE
+    ),
+    reservables AS (
+        SELECT o.codigo_grupo
+        FROM objetivo o
+        WHERE (SELECT count(*) FROM objetivo) = :total
+          AND NOT EXISTS (SELECT 1 FROM objetivo WHERE inscritos >= cupo)
+    ),
+    actualizados AS (
+        UPDATE grupo g
+        SET inscritos_actuales = COALESCE(g.inscritos_actuales, 0) + 1
+        FROM reservables r
+        WHERE g.codigo_grupo = r.codigo_grupo
+        RETURNING g.codigo_grupo
+    )
+    SELECT o.codigo_grupo, o.cupo, o.inscritos, (a.codigo_grupo IS NOT NULL) AS reservado
+    FROM objetivo o
+    LEFT JOIN actualizados a ON a.codigo_grupo = o.codigo_grupo
+    ORDER BY o.codigo_grupo
+""")
+
+_LIBERAR_CUPOS_SQL = text("""
+    WITH objetivo AS (
+        SELECT codigo_grupo
+        FROM grupo
+        WHERE codigo_grupo = ANY(:ids)
+        ORDER BY codigo_grupo
+        FOR UPDATE
+    )
+    UPDATE grupo g
+    SET inscritos_actuales = GREATEST(COALESCE(g.inscritos_actuales, 0) - 1, 0)
+    FROM objetivo o
+    WHERE g.codigo_grupo = o.codigo_grupo
+    RETURNING g.codigo_grupo
+""")
+
+_BLOQUEAR_GRUPOS_SQL = text("""
+    SELECT codigo_grupo, cupo, COALESCE(inscritos_actuales, 0)
+    FROM grupo
+    WHERE codigo_grupo = ANY(:ids)
+    ORDER BY codigo_grupo
+    FOR UPDATE
+""")
+
+_SUMAR_CUPOS_SQL = text("""
+    UPDATE grupo g
+    SET inscritos_actuales = COALESCE(g.inscritos_actuales, 0) + v.delta
+    FROM (
+        SELECT unnest(CAST(:ids AS varchar[])) AS codigo_grupo,
+               unnest(CAST(:deltas AS integer[])) AS delta
+    ) v
+    WHERE g.codigo_grupo = v.codigo_grupo
+""")
+
+
+@dataclass
+class SeatReservation:
+    """Resultado de una reserva de cupos"""
+    reserved: List[str] = field(default_factory=list)
+    full: Dict[str, Tuple[int, int]] = field(default_factory=dict)  # codigo -> (cupo, inscritos)
+    missing: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.full and not self.missing
+
+    def raise_for_status(self) -> None:
+        """Lanzar la excepción de dominio correspondiente si la reserva falló"""
+        if self.missing:
+            raise GrupoNoEncontradoException(self.missing[0])
+        if self.full:
+            codigo_grupo = sorted(self.full)[0]
+            cupo, inscritos = self.full[codigo_grupo]
+            exc = GrupoSinCupoException(codigo_grupo, cupo, inscritos)
+            exc.details["grupos_sin_cupo"] = sorted(self.full)
+            raise exc
+
+
+async def reserve_grupo_seats(db: AsyncSession, codigos_grupos: Iterable[str]) -> SeatReservation:
+    """
+    Reservar un cupo en cada grupo con una sola sentencia UPDATE ... RETURNING.
+
+    No incrementa ningún grupo si alguno no existe o está lleno, y reporta
+    exactamente cuáles fallaron.
+    """
+    ids = sorted(set(codigos_grupos))
+    reservation = SeatReservation()
+    if not ids:
+        return reservation
+
+    result = await db.execute(_RESERVAR_CUPOS_SQL, {"ids": ids, "total": len(ids)})
+    encontrados = set()
+    for codigo_grupo, cupo, inscritos, reservado in result:
+        encontrados.add(codigo_grupo)
+        if reservado:
+            reservation.reserved.append(codigo_grupo)
+        elif inscritos >= cupo:
+            reservation.full[codigo_grupo] = (cupo, inscritos)
+
+    reservation.missing = [codigo for codigo in ids if codigo not in encontrados]
+    return reservation
+
+
+async def reserve_grupo_seats_or_raise(db: AsyncSession, codigos_grupos: Iterable[str]) -> List[str]:
+    """Reservar cupos y lanzar GrupoNoEncontrado/GrupoSinCupo si no fue posible"""
+    reservation = await reserve_grupo_seats(db, codigos_grupos)
+    reservation.raise_for_status()
+    return reservation.reserved
+
+
+async def release_grupo_seats(db: AsyncSession, codigos_grupos: Iterable[str]) -> List[str]:
+    """Liberar un cupo en cada grupo (sin bajar de cero) con una sola sentencia"""
+    ids = sorted(set(codigos_grupos))
+    if not ids:
+        return []
+    result = await db.execute(_LIBERAR_CUPOS_SQL, {"ids": ids})
+    return [row[0] for row in result]
+
+
+async def lock_grupo_capacities(db: AsyncSession, codigos_grupos: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+    """
+    Bloquear los grupos (en orden de código) y devolver codigo -> (cupo, inscritos)
+    para asignar cupos en memoria dentro de la misma transacción.
+    """
+    ids = sorted(set(codigos_grupos))
+    if not ids:
+        return {}
+    result = await db.execute(_BLOQUEAR_GRUPOS_SQL, {"ids": ids})
+    return {codigo: (cupo or 0, inscritos) for codigo, cupo, inscritos in result}
+
+
+async def add_grupo_seats(db: AsyncSession, deltas: Dict[str, int]) -> None:
+    """Sumar a cada grupo su delta de inscritos con una sola sentencia"""
+    ids = sorted(codigo for codigo, delta in deltas.items() if delta)
+    if ids:
+        await db.execute(_SUMAR_CUPOS_SQL, {"ids": ids, "deltas": [deltas[c] for c in ids]})
@@ -0,0 +1,162 @@
+"""
+Consulta de estado de tareas Celery sin bloquear el loop.
+
+`AsyncResult` hace un GET síncrono por tarea contra el backend de resultados.
+Aquí las claves `celery-task-meta-<id>` y `task_metadata:<id>` de toda la lista
+se piden con un solo MGET (uno por servidor si backend y REDIS_URL difieren) y
+los payloads (codec binario o JSON comprimido anterior) se decodifican en un hilo.
+"""
+import asyncio
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
+
+import redis.asyncio as aioredis
+
+from app.core import codec
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.metrics import instrument_redis
+
+logger = get_logger(__name__)
+
+TASK_METADATA_PREFIX = "task_metadata:"
+
+# Por debajo de este número de payloads decodificar en el loop es más barato que el salto a un hilo
+_OFFLOOP_THRESHOLD = 16
+
+
+def _decode_payload(raw: Optional[bytes]) -> Optional[Any]:
+    """Payload del codec, o JSON plano/gzip/zlib de antes del codec"""
+    if raw is None:
+        return None
+    return codec.loads(raw)
+
+
+def _exception_meta(result: Any) -> Dict[str, Any]:
+    """Traducir la excepción serializada por Celery al formato de la API"""
+    if isinstance(result, dict) and "exc_type" in result:
+        message = result.get("exc_message")
+        if isinstance(message, (list, tuple)):
+            message = " ".join(str(m) for m in message)
+        return {"error_type": result["exc_type"], "error_message": str(message)}
+    if isinstance(result, dict):
+        return result
+    if result is not None:
+        return {"error_type": type(result).__name__, "error_message": str(result)}
+    return {
+        "error_type": "UnknownError",
+        "error_message": "Task failed with no error information",
+    }
+
+
+def build_task_status(task_id: str, meta: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Estado de una tarea con la misma forma que devolvían los endpoints con AsyncResult"""
+    if meta is None:
+        meta = {"status": "PENDING", "result": None}
+    state = meta.get("status", "PENDING")
+    result = meta.get("result")
+    status: Dict[str, Any] = {"task_id": task_id, "status": state, "meta": None, "result": None}
+
+    if state in ("SUCCESS", "FAILURE"):
+        status["completed_at"] = meta.get("date_done")
+
+    if state == "SUCCESS":
+        status["result"] = result if isinstance(result, dict) or result is None else {"value": result}
+    elif state == "FAILURE":
+        status["meta"] = _exception_meta(result)
+    elif isinstance(result, dict):
+        status["meta"] = result
+        status["current"] = result.get("current")
+        status["total"] = result.get("total")
+    else:
+        status["meta"] = {"message": f"Task is in {state} state"}
+    return status
+
+
+def _decode_all(task_ids: Sequence[str], metas: List[Optional[bytes]], extras: List[Optional[bytes]]):
+    statuses = []
+    for task_id, raw_meta, raw_extra in zip(task_ids, metas, extras):
+        try:
+            status = build_task_status(task_id, _decode_payload(raw_meta))
+        except (ValueError, zlib.error, OSError) as e:
+            status = {
+                "task_id": task_id,
+                "status": "ERROR",
+                "meta": {"error_type": "TaskInfoError", "error_message": f"Error accessing task info: {e}"},
+                "result": None,
+            }
+        metadata = {}
+        if raw_extra is not None:
+            try:
+                metadata = _decode_payload(raw_extra) or {}
+            except (ValueError, zlib.error, OSError):
+                logger.warning(f"Invalid metadata JSON for task {task_id}")
+        status["metadata"] = metadata
+        statuses.append(status)
+    return statuses
+
+
+class TaskStatusService:
+    """Estado de N tareas en un round trip por servidor Redis"""
+
+    def __init__(self, backend_url: str, metadata_url: str):
+        self.backend_url = backend_url
+        self.metadata_url = metadata_url
+        self._clients: Dict[str, aioredis.Redis] = {}
+
+    def _client(self, url: str) -> aioredis.Redis:
+        if url not in self._clients:
+            self._clients[url] = instrument_redis(aioredis.Redis.from_url(url))
+        return self._clients[url]
+
+    @staticmethod
+    def _meta_key(task_id: str):
+        # Respeta el prefijo configurado en el backend (global_keyprefix)
+        return celery_app.backend.get_key_for_task(task_id)
+
+    async def get_statuses(self, task_ids: Sequence[str], with_metadata: bool = True) -> List[Dict[str, Any]]:
+        """Estados en el mismo orden que `task_ids`; las claves ausentes son PENDING"""
+        task_ids = list(task_ids)
+        if not task_ids:
+            return []
+
+        meta_keys = [self._meta_key(t) for t in task_ids]
+        extra_keys = [f"{TASK_METADATA_PREFIX}{t}" for t in task_ids] if with_metadata else []
+
+        if not extra_keys or self.backend_url == self.metadata_url:
+            raw = await self._client(self.backend_url).mget(meta_keys + extra_keys)
+            metas, extras = raw[:len(task_ids)], raw[len(task_ids):]
+        else:
+            metas, extras = await asyncio.gather(
+                self._client(self.backend_url).mget(meta_keys),
+                self._client(self.metadata_url).mget(extra_keys),
+            )
+        if not extras:
+            extras = [None] * len(task_ids)
+
+        if len(task_ids) < _OFFLOOP_THRESHOLD:
+            return _decode_all(task_ids, metas, extras)
+        return await asyncio.to_thread(_decode_all, task_ids, metas, extras)
+
+    async def get_status(self, task_id: str, with_metadata: bool = False) -> Dict[str, Any]:
+        return (await self.get_statuses([task_id], with_metadata=with_metadata))[0]
+
+    async def close(self) -> None:
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+
+
+_task_status_service: Optional[TaskStatusService] = None
+
+
+def get_task_status_service() -> TaskStatusService:
+    """Servicio de estado de tareas del proceso actual"""
+    global _task_status_service
+    if _task_status_service is None:
+        _task_status_service = TaskStatusService(
+            backend_url=settings.CELERY_RESULT_BACKEND,
+            metadata_url=settings.REDIS_URL,
+        )
+    return _task_status_service
@@ -0,0 +1,84 @@
+"""
+Caché en Redis del historial agrupado por período (kardex) de cada estudiante.
+
+Se guarda la proyección ya armada (lista de `HistorialPorPeriodo` en JSON) en
+`historial:kardex:<registro_academico>` con TTL. `HistorialAcademicoService`
+borra la clave después de cada commit de create/update/delete_historial; el TTL
+acota la ventana en la que un lector concurrente puede volver a guardar una
+versión anterior. Con `HISTORIAL_CACHE_TTL = 0` la caché queda deshabilitada.
+
+Redis no es crítico aquí: cualquier error se registra y se lee de la base.
+"""
+import json
+from typing import List, Optional
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.redis_client import get_async_redis
+from app.schemas import HistorialPorPeriodo
+
+logger = get_logger(__name__)
+
+KEY_PREFIX = "historial:kardex:"
+
+
+class TranscriptCache:
+    """Historial por período de cada estudiante, compartido entre procesos"""
+
+    def __init__(self, ttl_seconds: int = 300):
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def _get_redis(self) -> aioredis.Redis:
+        return get_async_redis()
+
+    async def get(self, registro_academico: str) -> Optional[List[HistorialPorPeriodo]]:
+        if not self.enabled:
+            return None
+        try:
+            raw = await self._get_redis().get(KEY_PREFIX + registro_academico)
+        except Exception as e:
+            logger.warning(f"No se pudo leer el historial cacheado de {registro_academico}: {e}")
+            return None
+        if raw is None:
+            return None
+        return [HistorialPorPeriodo.model_validate(p) for p in json.loads(raw)]
+
+    async def set(self, registro_academico: str, historial: List[HistorialPorPeriodo]) -> None:
+        if not self.enabled:
+            return
+        payload = json.dumps([p.model_dump(mode="json") for p in historial])
+        try:
+            await self._get_redis().set(KEY_PREFIX + registro_academico, payload, ex=self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"No se pudo cachear el historial de {registro_academico}: {e}")
+
+    async def invalidate(self, registro_academico: str) -> None:
+        if not self.enabled:
+            return
+        try:
+            await self._get_redis().delete(KEY_PREFIX + registro_academico)
+        except Exception as e:
+            logger.warning(f"No se pudo invalidar el historial cacheado de {registro_academico}: {e}")
+
+    async def invalidate_many(self, registros: List[str], batch_size: int = 1000) -> None:
+        if not self.enabled:
+            return
+        try:
+            for i in range(0, len(registros), batch_size):
+                await self._get_redis().delete(*(KEY_PREFIX + r for r in registros[i:i + batch_size]))
+        except Exception as e:
+            logger.warning(f"No se pudo invalidar el historial cacheado de {len(registros)} estudiantes: {e}")
+
+
+transcript_cache = TranscriptCache(ttl_seconds=settings.HISTORIAL_CACHE_TTL)
+
+
+def get_transcript_cache() -> TranscriptCache:
+    """Obtener la caché de historial del proceso actual"""
+    return transcript_cache
@@ -1,16 +1,24 @@
 import asyncio
-import concurrent.futures
-import uuid
 from datetime import date, datetime
 from typing import Any, Dict, List, Optional
 
-from celery import current_task
-from sqlalchemy import and_, select, update
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from celery import chord, current_task, group
+from celery.signals import worker_ready
+from sqlalchemy import and_, delete, exists, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.celery_app import celery_app
-from app.core.database import get_db, AsyncSessionLocal
 from app.core.config import settings
+from app.core.id_generator import ensure_id_sequence, new_detalle_codes, new_inscripcion_code
+from app.core.saga_pattern import recover_orphaned_sagas
+from app.core.worker_runtime import get_worker_runtime
+from app.services.seat_ledger import SeatHold, get_seat_ledger
+from app.services.bulk_enrollment import BulkEnrollmentEngine
+from app.services.catalog_cache import get_catalog_cache
+from app.services.historial_import import HistorialImporter, discard_staged_payload, load_staged_payload
+from app.services.historial_reports import get_historial_report_store
+from app.services.schedule_index import get_schedule_index
+from app.services.seat_reservation import reserve_grupo_seats_or_raise
 from app.models import DetalleInscripcion, Grupo, Inscripcion, PeriodoAcademico, Estudiante, Horario
 from app.schemas import InscripcionCreate
 
@@ -27,64 +35,16 @@ logger = logging.getLogger(__name__)
 # Database session helper (not currently used but keeping for future use)
 async def get_db_session():
     """Get database session - wrapper for async session"""
-    session = AsyncSessionLocal()
+    session = get_worker_runtime().session_factory()
     try:
         return session
     finally:
         await session.close()
 
-# Helper functions for group management
-async def _decrement_grupo_inscritos(db: AsyncSession, codigo_grupo: str) -> None:
-    """Decrement the number of enrolled students in a group"""
-    try:
-        result = await db.execute(
-            select(Grupo).where(Grupo.codigo_grupo == codigo_grupo).with_for_update()
-        )
-        grupo = result.scalar_one_or_none()
-
-        if grupo and getattr(grupo, 'inscritos_actuales', None) is not None and grupo.inscritos_actuales > 0:
-            grupo.inscritos_actuales = grupo.inscritos_actuales - 1
-            await db.flush()
-    except Exception as e:
-        logger.warning(f"Error decrementing group enrollment: {str(e)}")
-
-async def _increment_grupo_inscritos(db: AsyncSession, codigo_grupo: str) -> None:
-    """Increment the number of enrolled students in a group"""
-    try:
-        result = await db.execute(
-            select(Grupo).where(Grupo.codigo_grupo == codigo_grupo).with_for_update()
-        )
-        grupo = result.scalar_one_or_none()
-
-        if grupo:
-            if getattr(grupo, 'inscritos_actuales', None) is None:
-                grupo.inscritos_actuales = 1
-            else:
-                grupo.inscritos_actuales = grupo.inscritos_actuales + 1
-            await db.flush()
-    except Exception as e:
-        logger.warning(f"Error incrementing group enrollment: {str(e)}")
-
-# Helper para ejecutar funciones async en un subproceso y evitar conflicto de event loop
+# Helper para ejecutar funciones async en el runtime persistente del worker
 def run_async_in_process(func, *args, **kwargs):
-    """Run async function in a thread pool to avoid event loop issues"""
-    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-        # Create a closure that properly runs the coroutine
-        def run_in_thread():
-            # Get or create event loop
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            # Run the coroutine
-            return loop.run_until_complete(func(*args, **kwargs))
-        
-        # Execute in thread and wait for result
-        future = executor.submit(run_in_thread)
-        result = future.result()  # This blocks until result is available
-        return result
+    """Run async function on the worker-lifetime event loop (shared loop and engine)"""
+    return get_worker_runtime().call(func, *args, **kwargs)
 
 # Helper para ejecutar funciones async correctamente según el estado del event loop
 def run_async(func, *args, **kwargs):
@@ -119,18 +79,6 @@ from app.exceptions import (
     GrupoDuplicadoException
 )
 
-# Configurar motor de base de datos para las tareas
-engine = create_async_engine(
-    settings.DATABASE_URL.replace("postgresql://", "postgresql+psycopg://"),
-    pool_pre_ping=True
-)
-
-AsyncSessionLocal = async_sessionmaker(
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False
-)
-
 @celery_app.task(name="app.tasks.create_inscription_task")
 def create_inscription_task(inscription_data: Dict[str, Any]) -> Dict[str, Any]:
     """Task for creating a single inscription"""
@@ -146,18 +94,13 @@ def create_inscription_task(inscription_data: Dict[str, Any]) -> Dict[str, Any]:
             "error": str(e)
         }
 
-@celery_app.task(bind=True, name="app.tasks.bulk_create_inscriptions_task")
-
 @celery_app.task(bind=True, name="app.tasks.bulk_create_inscriptions_task")
 def bulk_create_inscriptions_task(self, inscriptions_data: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Tarea para crear múltiples inscripciones en lote"""
     try:
         total_inscriptions = len(inscriptions_data)
-        processed = 0
-        successful = 0
-        failed = 0
-        results = []
-        if hasattr(self, 'request') and getattr(self.request, 'id', None):
+        has_request_id = hasattr(self, 'request') and getattr(self.request, 'id', None)
+        if has_request_id:
             self.update_state(
                 state="STARTED", 
                 meta={
@@ -168,36 +111,29 @@ def bulk_create_inscriptions_task(self, inscriptions_data: List[Dict[str, Any]])
                     "failed": 0
                 }
             )
-        for i, inscription_data in enumerate(inscriptions_data):
-            try:
-                result = run_async_in_process(_create_inscription_async, inscription_data, self)
-                results.append({
-                    "status": "success",
-                    "data": result,
-                    "registro_academico": inscription_data.get("registro_academico")
-                })
-                successful += 1
-            except Exception as e:
-                results.append({
-                    "status": "error",
-                    "error": str(e),
-                    "registro_academico": inscription_data.get("registro_academico")
-                })
-                failed += 1
-            processed += 1
-            if processed % 5 == 0 or processed == total_inscriptions:
-                if hasattr(self, 'request') and getattr(self.request, 'id', None):
-                    self.update_state(
-                        state="PROGRESS",
-                        meta={
-                            "message": f"Procesadas {processed}/{total_inscriptions} inscripciones",
-                            "total": total_inscriptions,
-                            "processed": processed,
-                            "successful": successful,
-                            "failed": failed,
-                            "progress": int((processed / total_inscriptions) * 100)
-                        }
-                    )
+        
+        # report_progress corre en otro hilo (asyncio.to_thread) y self.request es
+        # local al hilo: el id de la tarea se captura aquí y se pasa explícito
+        task_id = self.request.id if has_request_id else None
+
+        def report_progress(processed: int, successful: int, failed: int):
+            if task_id:
+                self.update_state(
+                    task_id=task_id,
+                    state="PROGRESS",
+                    meta={
+                        "message": f"Procesadas {processed}/{total_inscriptions} inscripciones",
+                        "total": total_inscriptions,
+                        "processed": processed,
+                        "successful": successful,
+                        "failed": failed,
+                        "progress": int((processed / total_inscriptions) * 100)
+                    }
+                )
+        
+        results = run_async_in_process(_bulk_create_inscriptions_async, inscriptions_data, report_progress)
+        successful = sum(1 for r in results if r["status"] == "success")
+        failed = total_inscriptions - successful
         return {
             "status": "SUCCESS",
             "message": f"Procesamiento completado: {successful} exitosas, {failed} fallidas",
@@ -217,25 +153,48 @@ def bulk_create_inscriptions_task(self, inscriptions_data: List[Dict[str, Any]])
             )
         raise exc
 
+async def _bulk_create_inscriptions_async(inscriptions_data: List[Dict[str, Any]], on_progress=None) -> List[Dict[str, Any]]:
+    """Procesar el lote con el motor por bloques (precarga, validación en memoria, INSERT multi-fila)"""
+    engine = BulkEnrollmentEngine(
+        get_worker_runtime().session_factory,
+        chunk_size=settings.BULK_INSCRIPTION_CHUNK_SIZE,
+        seat_ledger=get_seat_ledger() if settings.SEAT_LEDGER_ENABLED else None,
+        fallback=_create_inscription_async
+    )
+    return await engine.run(inscriptions_data, on_progress)
+
 # Removed problematic saga function - using simplified version later in file
 
+async def _reserve_seats(db: AsyncSession, codigos_grupos: List[str], seat_hold: Optional[SeatHold]) -> None:
+    """Reservar cupos en Postgres, o confirmar los ya retenidos en el ledger de Redis"""
+    if seat_hold is None:
+        await reserve_grupo_seats_or_raise(db, codigos_grupos)
+    else:
+        await seat_hold.extend(codigos_grupos, db)
+        seat_hold.commit(codigos_grupos)
+
 # Removed the circuit_breaker decorator that was causing issues
 async def _create_inscription_async(inscription_data: Dict[str, Any]) -> Dict[str, Any]:
     """Función auxiliar para crear inscripción de forma asíncrona"""
+    if not settings.SEAT_LEDGER_ENABLED:
+        return await _create_inscription_db(inscription_data)
     
-    # Inicializar motor y sesión dentro del subproceso para evitar problemas de event loop
-    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-    from app.core.config import settings
-    engine = create_async_engine(
-        settings.DATABASE_URL.replace("postgresql://", "postgresql+psycopg://"),
-        pool_pre_ping=True
-    )
-    AsyncSessionLocal = async_sessionmaker(
-        bind=engine,
-        class_=AsyncSession,
-        expire_on_commit=False
-    )
-    async with AsyncSessionLocal() as db:
+    # Fast path: retener cupos en Redis antes de tocar la base; las solicitudes
+    # sin cupo se rechazan aquí sin abrir sesión. Los grupos ya inscritos según
+    # el ledger no se retienen (_create_inscription_db los omite), así un
+    # reenvío que agrega un grupo no falla porque uno ya inscrito esté lleno.
+    async with get_seat_ledger().hold(
+        inscription_data.get("grupos", []),
+        session_factory=get_worker_runtime().session_factory,
+        owner=(inscription_data["registro_academico"], inscription_data["codigo_periodo"])
+    ) as seat_hold:
+        return await _create_inscription_db(inscription_data, seat_hold)
+
+async def _create_inscription_db(inscription_data: Dict[str, Any], seat_hold: Optional[SeatHold] = None) -> Dict[str, Any]:
+    """Crear inscripción en la base de datos (con cupos ya retenidos si seat_hold)"""
+    
+    # Usar el engine compartido del runtime del worker (un pool por proceso)
+    async with get_worker_runtime().session_factory() as db:
         try:
             # Verificar que el estudiante existe y no esté bloqueado
             result = await db.execute(
@@ -250,16 +209,13 @@ async def _create_inscription_async(inscription_data: Dict[str, Any]) -> Dict[st
                 raise EstudianteBloqueadoException(inscription_data["registro_academico"])
             
             # Verificar que el período académico existe y está activo
-            result = await db.execute(
-                select(PeriodoAcademico).where(PeriodoAcademico.codigo_periodo == inscription_data["codigo_periodo"])
-            )
-            periodo = result.scalar_one_or_none()
+            periodo = await get_catalog_cache().get_periodo(db, inscription_data["codigo_periodo"])
             
             if not periodo:
                 raise PeriodoNoEncontradoException(inscription_data["codigo_periodo"])
             
-            if periodo.estado != "ACTIVO":
-                raise PeriodoInactivoException(inscription_data["codigo_periodo"], periodo.estado)
+            if periodo["estado"] != "ACTIVO":
+                raise PeriodoInactivoException(inscription_data["codigo_periodo"], periodo["estado"])
             
             # Obtener grupos a inscribir
             grupos = inscription_data.get("grupos", [])
@@ -287,6 +243,8 @@ async def _create_inscription_async(inscription_data: Dict[str, Any]) -> Dict[st
                     )
                 )
                 grupos_ya_inscritos = [row[0] for row in result_detalles]
+                if seat_hold is not None:
+                    seat_hold.mark_enrolled(grupos_ya_inscritos)
                 
                 # Filtrar grupos que ya están inscritos
                 grupos_nuevos = [g for g in grupos if g not in grupos_ya_inscritos]
@@ -314,8 +272,6 @@ async def _create_inscription_async(inscription_data: Dict[str, Any]) -> Dict[st
                         "mensaje": "Todos los grupos ya estaban inscritos"
                     }
                 
-                # Validar disponibilidad de nuevos grupos
-                await _validate_grupos_disponibilidad(db, grupos_nuevos)
                 # Validar conflictos entre nuevos grupos
                 await _validate_horarios_conflicto(db, grupos_nuevos)
                 # Validar conflictos con grupos ya inscritos
@@ -331,13 +287,10 @@ async def _create_inscription_async(inscription_data: Dict[str, Any]) -> Dict[st
                 materias_existentes = [row[0] for row in result_materias_existentes]
                 
                 # Obtener materias de los nuevos grupos
-                result_nuevas_materias = await db.execute(
-                    select(Grupo.codigo_grupo, Grupo.sigla_materia).where(
-                        Grupo.codigo_grupo.in_(grupos_nuevos)
-                    )
-                )
+                catalogo = await get_catalog_cache().get_grupos(db, grupos_nuevos)
                 
-                for codigo_grupo, sigla_materia in result_nuevas_materias:
+                for codigo_grupo, grupo_catalogo in catalogo.items():
+                    sigla_materia = grupo_catalogo["sigla_materia"]
                     if sigla_materia in materias_existentes:
                         raise GrupoDuplicadoException(
                             codigo_grupo,
@@ -345,10 +298,12 @@ async def _create_inscription_async(inscription_data: Dict[str, Any]) -> Dict[st
                             codigo_grupo
                         )
                 
+                # Reservar cupos de todos los nuevos grupos en una sola sentencia
+                await _reserve_seats(db, grupos_nuevos, seat_hold)
+                
                 # Agregar los nuevos grupos
-                for codigo_grupo in grupos_nuevos:
-                    codigo_detalle = f"D{datetime.now().strftime('%y%m%d')}{str(uuid.uuid4())[:3].upper()}"
-                    
+                codigos_detalle = await new_detalle_codes(len(grupos_nuevos), db)
+                for codigo_grupo, codigo_detalle in zip(grupos_nuevos, codigos_detalle):
                     detalle = DetalleInscripcion(
                         codigo_detalle=codigo_detalle,
                         codigo_inscripcion=codigo_inscripcion,
@@ -360,9 +315,6 @@ async def _create_inscription_async(inscription_data: Dict[str, Any]) -> Dict[st
                         "codigo_detalle": codigo_detalle,
                         "codigo_grupo": codigo_grupo
                     })
-                    
-                    # Actualizar contador de inscritos en el grupo
-                    await _increment_grupo_inscritos(db, codigo_grupo)
                 
                 await db.commit()
                 
@@ -376,10 +328,8 @@ async def _create_inscription_async(inscription_data: Dict[str, Any]) -> Dict[st
                 }
             else:
                 # Crear nueva inscripción
-                codigo_inscripcion = f"I{datetime.now().strftime('%y%m%d')}{str(uuid.uuid4())[:3].upper()}"
+                codigo_inscripcion = await new_inscripcion_code(db)
                 
-                # Validar grupos y disponibilidad
-                await _validate_grupos_disponibilidad(db, grupos)
                 # Validar conflictos entre nuevos grupos
                 await _validate_horarios_conflicto(db, grupos)
                 # Validar conflictos con grupos ya inscritos
@@ -388,6 +338,9 @@ async def _create_inscription_async(inscription_data: Dict[str, Any]) -> Dict[st
                 # Validar que no haya duplicados de materia
                 await _validate_no_duplicate_materias(db, grupos)
                 
+                # Reservar cupos de todos los grupos en una sola sentencia
+                await _reserve_seats(db, grupos, seat_hold)
+                
                 # Crear la inscripción
                 nueva_inscripcion = Inscripcion(
                     codigo_inscripcion=codigo_inscripcion,
@@ -401,9 +354,8 @@ async def _create_inscription_async(inscription_data: Dict[str, Any]) -> Dict[st
                 
                 # Crear los detalles de inscripción
                 detalles_creados = []
-                for codigo_grupo in grupos:
-                    codigo_detalle = f"D{datetime.now().strftime('%y%m%d')}{str(uuid.uuid4())[:3].upper()}"
-                    
+                codigos_detalle = await new_detalle_codes(len(grupos), db)
+                for codigo_grupo, codigo_detalle in zip(grupos, codigos_detalle):
                     detalle = DetalleInscripcion(
                         codigo_detalle=codigo_detalle,
                         codigo_inscripcion=codigo_inscripcion,
@@ -415,9 +367,6 @@ async def _create_inscription_async(inscription_data: Dict[str, Any]) -> Dict[st
                         "codigo_detalle": codigo_detalle,
                         "codigo_grupo": codigo_grupo
                     })
-                    
-                    # Actualizar contador de inscritos en el grupo
-                    await _increment_grupo_inscritos(db, codigo_grupo)
                 
                 await db.commit()
                 
@@ -433,55 +382,22 @@ async def _create_inscription_async(inscription_data: Dict[str, Any]) -> Dict[st
             await db.rollback()
             raise e
 
-async def _validate_grupos_disponibilidad(db: AsyncSession, codigos_grupos: List[str]):
-    """Validar que los grupos tengan cupo disponible"""
-    # Usar SELECT ... FOR UPDATE para bloquear la fila del grupo y evitar sobre-inscripción
-    for codigo_grupo in codigos_grupos:
-        result = await db.execute(
-            select(Grupo).where(Grupo.codigo_grupo == codigo_grupo).with_for_update()
-        )
-        grupo = result.scalar_one_or_none()
-        if not grupo:
-            raise GrupoNoEncontradoException(codigo_grupo)
-        if grupo.inscritos_actuales >= grupo.cupo:
-            raise GrupoSinCupoException(codigo_grupo, grupo.cupo, grupo.inscritos_actuales)
-
 async def _validate_horarios_conflicto(db: AsyncSession, codigos_grupos: List[str]):
-    """Validar que no haya conflictos de horarios entre grupos"""
-    # Obtener horarios de todos los grupos
-    result = await db.execute(
-        select(Grupo, Horario)
-        .join(Horario)
-        .where(Grupo.codigo_grupo.in_(codigos_grupos))
-    )
-
-    rows = result.all()
-    grupos_horarios = [(row[0], row[1]) for row in rows]
+    """Validar que no haya conflictos de horarios entre los grupos (índice en memoria)"""
+    schedule_index = get_schedule_index()
+    await schedule_index.ensure_loaded(db, codigos_grupos)
     
-    # Verificar conflictos entre todos los grupos
-    for i, (grupo1, horario1) in enumerate(grupos_horarios):
-        for j, (grupo2, horario2) in enumerate(grupos_horarios):
-            if i >= j:
-                continue
-            
-            # Verificar si hay días en común
-            dias_comunes = set(horario1.dias_semana) & set(horario2.dias_semana)
-            if not dias_comunes:
-                continue
-            
-            # Verificar solapamiento de horarios
-            if _horarios_se_solapan(horario1.hora_inicio, horario1.hora_fin, 
-                                   horario2.hora_inicio, horario2.hora_fin):
-                raise ConflictoHorarioException(
-                    grupo2.codigo_grupo,
-                    f"{horario2.dias_semana} {horario2.hora_inicio}-{horario2.hora_fin}"
-                )
+    conflicto = schedule_index.find_conflict(codigos_grupos)
+    if conflicto:
+        _, horario2 = conflicto
+        raise ConflictoHorarioException(
+            horario2.codigo_grupo,
+            f"{horario2.dias_semana} {horario2.hora_inicio}-{horario2.hora_fin}"
+        )
 
 
-async def _validate_horarios_conflicto_with_existing(db: AsyncSession, registro_academico: str, codigos_grupos_nuevos: List[str]):
-    """Validar que los nuevos grupos no tengan conflictos con grupos ya inscritos por el estudiante"""
-    
-    # Obtener todos los grupos ya inscritos del estudiante en períodos ACTIVOS
+async def _get_grupos_inscritos_activos(db: AsyncSession, registro_academico: str) -> List[str]:
+    """Grupos ya inscritos por el estudiante en períodos ACTIVOS"""
     result = await db.execute(
         select(DetalleInscripcion.codigo_grupo)
         .join(Inscripcion)
@@ -493,127 +409,60 @@ async def _validate_horarios_conflicto_with_existing(db: AsyncSession, registro_
             )
         )
     )
-    grupos_existentes = [row[0] for row in result]
+    return [row[0] for row in result]
+
+
+async def _validate_horarios_conflicto_with_existing(db: AsyncSession, registro_academico: str, codigos_grupos_nuevos: List[str]):
+    """Validar que los nuevos grupos no tengan conflictos con grupos ya inscritos por el estudiante"""
     
+    grupos_existentes = await _get_grupos_inscritos_activos(db, registro_academico)
     if not grupos_existentes:
         return  # No hay grupos existentes, sin conflictos posibles
     
-    # Obtener todos los horarios (nuevos + existentes)
-    todos_grupos = grupos_existentes + codigos_grupos_nuevos
-    result = await db.execute(
-        select(Grupo, Horario)
-        .join(Horario)
-        .where(Grupo.codigo_grupo.in_(todos_grupos))
-    )
-
-    rows = result.all()
-    grupos_horarios = [(row[0], row[1]) for row in rows]
-    
-    # Crear mapeo de grupos existentes para identificarlos
-    existentes_set = set(grupos_existentes)
-    nuevos_set = set(codigos_grupos_nuevos)
+    schedule_index = get_schedule_index()
+    await schedule_index.ensure_loaded(db, grupos_existentes + codigos_grupos_nuevos)
     
-    # Verificar conflictos entre nuevos y existentes
-    for grupo_nuevo, horario_nuevo in grupos_horarios:
-        if grupo_nuevo.codigo_grupo not in nuevos_set:
-            continue  # Skip si no es grupo nuevo
-        
-        for grupo_existente, horario_existente in grupos_horarios:
-            if grupo_existente.codigo_grupo not in existentes_set:
-                continue  # Skip si no es grupo existente
-            
-            # Verificar si hay días en común
-            dias_comunes = set(horario_nuevo.dias_semana) & set(horario_existente.dias_semana)
-            if not dias_comunes:
-                continue
-            
-            # Verificar solapamiento de horarios
-            if _horarios_se_solapan(horario_nuevo.hora_inicio, horario_nuevo.hora_fin,
-                                   horario_existente.hora_inicio, horario_existente.hora_fin):
-                raise ConflictoHorarioException(
-                    grupo_nuevo.codigo_grupo,
-                    f"Conflicto con grupo existente {grupo_existente.codigo_grupo}: "
-                    f"{horario_existente.dias_semana} {horario_existente.hora_inicio}-{horario_existente.hora_fin}"
-                )
+    conflicto = schedule_index.find_conflict(codigos_grupos_nuevos, grupos_existentes, check_among_new=False)
+    if conflicto:
+        horario_existente, horario_nuevo = conflicto
+        raise ConflictoHorarioException(
+            horario_nuevo.codigo_grupo,
+            f"Conflicto con grupo existente {horario_existente.codigo_grupo}: "
+            f"{horario_existente.dias_semana} {horario_existente.hora_inicio}-{horario_existente.hora_fin}"
+        )
 
 async def _validate_horario_conflicto_individual(db: AsyncSession, registro_academico: str, 
                                                codigo_periodo: str, nuevo_grupo_codigo: str):
     """Validar que el nuevo grupo no tenga conflictos con grupos ya inscritos del estudiante"""
     
-    # Obtener todos los grupos ya inscritos del estudiante en TODOS los períodos ACTIVOS
-    result = await db.execute(
-        select(DetalleInscripcion.codigo_grupo)
-        .join(Inscripcion)
-        .join(PeriodoAcademico, Inscripcion.codigo_periodo == PeriodoAcademico.codigo_periodo)
-        .where(
-            and_(
-                Inscripcion.registro_academico == registro_academico,
-                PeriodoAcademico.estado == "ACTIVO"  # Solo períodos activos
-            )
-        )
-    )
-    grupos_existentes = [row[0] for row in result]
-    
+    # Grupos ya inscritos del estudiante en TODOS los períodos ACTIVOS
+    grupos_existentes = await _get_grupos_inscritos_activos(db, registro_academico)
     if not grupos_existentes:
         return  # No hay grupos existentes, no puede haber conflictos
     
-    # Obtener horarios del nuevo grupo y grupos existentes
-    todos_los_grupos = grupos_existentes + [nuevo_grupo_codigo]
-    result = await db.execute(
-        select(Grupo, Horario)
-        .join(Horario)
-        .where(Grupo.codigo_grupo.in_(todos_los_grupos))
-    )
-
-    rows = result.all()
-    grupos_horarios = [(row[0], row[1]) for row in rows]
-    
-    # Encontrar el horario del nuevo grupo
-    nuevo_grupo_horario = None
-    for grupo, horario in grupos_horarios:
-        if grupo.codigo_grupo == nuevo_grupo_codigo:
-            nuevo_grupo_horario = (grupo, horario)
-            break
+    schedule_index = get_schedule_index()
+    await schedule_index.ensure_loaded(db, grupos_existentes + [nuevo_grupo_codigo])
     
-    if not nuevo_grupo_horario:
+    if schedule_index.get(nuevo_grupo_codigo) is None:
         raise GrupoNoEncontradoException(nuevo_grupo_codigo)
     
-    # Verificar conflictos con grupos existentes
-    nuevo_grupo, nuevo_horario = nuevo_grupo_horario
-    for grupo, horario in grupos_horarios:
-        if grupo.codigo_grupo == nuevo_grupo_codigo:
-            continue  # Skip self
-        
-        # Verificar si hay días en común
-        dias_comunes = set(nuevo_horario.dias_semana) & set(horario.dias_semana)
-        if not dias_comunes:
-            continue
-        
-        # Verificar solapamiento de horarios
-        if _horarios_se_solapan(nuevo_horario.hora_inicio, nuevo_horario.hora_fin, 
-                               horario.hora_inicio, horario.hora_fin):
-            raise ConflictoHorarioException(
-                grupo.codigo_grupo,
-                f"{horario.dias_semana} {horario.hora_inicio}-{horario.hora_fin}"
-            )
-
-def _horarios_se_solapan(inicio1, fin1, inicio2, fin2) -> bool:
-    """Verificar si dos horarios se solapan"""
-    return not (fin1 <= inicio2 or fin2 <= inicio1)
+    otros_grupos = [g for g in grupos_existentes if g != nuevo_grupo_codigo]
+    conflicto = schedule_index.find_conflict([nuevo_grupo_codigo], otros_grupos, check_among_new=False)
+    if conflicto:
+        horario, _ = conflicto
+        raise ConflictoHorarioException(
+            horario.codigo_grupo,
+            f"{horario.dias_semana} {horario.hora_inicio}-{horario.hora_fin}"
+        )
 
 async def _validate_no_duplicate_materias(db: AsyncSession, codigos_grupos: List[str]):
     """Validar que no haya dos grupos de la misma materia"""
-    # Obtener la materia de cada grupo
-    result = await db.execute(
-        select(Grupo.codigo_grupo, Grupo.sigla_materia).where(
-            Grupo.codigo_grupo.in_(codigos_grupos)
-        )
-    )
-    
-    grupos_materias = result.all()
+    # Obtener la materia de cada grupo desde la caché de catálogo
+    catalogo = await get_catalog_cache().get_grupos(db, codigos_grupos)
     materias_vistas = {}
     
-    for codigo_grupo, sigla_materia in grupos_materias:
+    for codigo_grupo, grupo_catalogo in catalogo.items():
+        sigla_materia = grupo_catalogo["sigla_materia"]
         if sigla_materia in materias_vistas:
             # La materia ya está en otro grupo
             raise GrupoDuplicadoException(
@@ -623,15 +472,6 @@ async def _validate_no_duplicate_materias(db: AsyncSession, codigos_grupos: List
             )
         materias_vistas[sigla_materia] = codigo_grupo
 
-async def _increment_grupo_inscritos(db: AsyncSession, codigo_grupo: str):
-    """Incrementar el contador de inscritos de un grupo"""
-    # Usar SELECT ... FOR UPDATE para asegurar que el incremento sea atómico
-    result = await db.execute(
-        select(Grupo).where(Grupo.codigo_grupo == codigo_grupo).with_for_update()
-    )
-    grupo = result.scalar_one()
-    grupo.inscritos_actuales += 1
-
 
 @celery_app.task(name="app.tasks.create_single_group_inscription_task", bind=True)
 def create_single_group_inscription_task(self, inscription_data: Dict[str, Any], grupo_codigo: str) -> Dict[str, Any]:
@@ -704,25 +544,28 @@ def create_single_group_inscription_task(self, inscription_data: Dict[str, Any],
 
 async def _add_group_to_inscription_async(inscription_data: Dict[str, Any], grupo_codigo: str) -> Dict[str, Any]:
     """Función auxiliar para agregar un grupo a una inscripción (crear inscripción si no existe)"""
+    if not settings.SEAT_LEDGER_ENABLED:
+        return await _add_group_to_inscription_db(inscription_data, grupo_codigo)
     
-    # Inicializar motor y sesión dentro del subproceso para evitar problemas de event loop
-    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-    from app.core.config import settings
-    engine = create_async_engine(
-        settings.DATABASE_URL.replace("postgresql://", "postgresql+psycopg://"),
-        pool_pre_ping=True
-    )
-    AsyncSessionLocal = async_sessionmaker(
-        bind=engine,
-        class_=AsyncSession,
-        expire_on_commit=False
-    )
-    async with AsyncSessionLocal() as db:
+    async with get_seat_ledger().hold(
+        [grupo_codigo],
+        session_factory=get_worker_runtime().session_factory,
+        owner=(inscription_data["registro_academico"], inscription_data["codigo_periodo"])
+    ) as seat_hold:
+        return await _add_group_to_inscription_db(inscription_data, grupo_codigo, seat_hold)
+
+async def _add_group_to_inscription_db(
+    inscription_data: Dict[str, Any],
+    grupo_codigo: str,
+    seat_hold: Optional[SeatHold] = None
+) -> Dict[str, Any]:
+    """Agregar un grupo en la base de datos (con el cupo ya retenido si seat_hold)"""
+    
+    # Usar el engine compartido del runtime del worker (un pool por proceso)
+    async with get_worker_runtime().session_factory() as db:
         try:
-            # Generar código único para la inscripción (si no existe)
+            # Código de inscripción recibido (se genera solo si hay que crearla)
             codigo_inscripcion = inscription_data.get("codigo_inscripcion")
-            if not codigo_inscripcion:
-                codigo_inscripcion = f"I{datetime.now().strftime('%y%m%d')}{str(uuid.uuid4())[:3].upper()}"
             
             # Validar que el estudiante existe
             result = await db.execute(
@@ -735,28 +578,19 @@ async def _add_group_to_inscription_async(inscription_data: Dict[str, Any], grup
                 raise EstudianteBloqueadoException(inscription_data["registro_academico"])
             
             # Validar que el período existe
-            result = await db.execute(
-                select(PeriodoAcademico).where(PeriodoAcademico.codigo_periodo == inscription_data["codigo_periodo"])
-            )
-            periodo = result.scalar_one_or_none()
+            periodo = await get_catalog_cache().get_periodo(db, inscription_data["codigo_periodo"])
             if not periodo:
                 raise PeriodoNoEncontradoException(inscription_data["codigo_periodo"])
-            if periodo.estado != "ACTIVO":
-                raise PeriodoInactivoException(inscription_data["codigo_periodo"], periodo.estado)
+            if periodo["estado"] != "ACTIVO":
+                raise PeriodoInactivoException(inscription_data["codigo_periodo"], periodo["estado"])
             
-            # Validar que el grupo tiene cupo disponible
-            await _validate_grupos_disponibilidad(db, [grupo_codigo])
-
             # Validar que el estudiante no esté inscrito en otro grupo de la misma materia en este periodo
             # Obtener la materia del grupo actual
-            grupo_result = await db.execute(
-                select(Grupo).where(Grupo.codigo_grupo == grupo_codigo)
-            )
-            grupo_actual = grupo_result.scalar_one_or_none()
+            grupo_actual = await get_catalog_cache().get_grupo(db, grupo_codigo)
             if not grupo_actual:
                 raise GrupoNoEncontradoException(grupo_codigo)
 
-            materia_actual = grupo_actual.sigla_materia
+            materia_actual = grupo_actual["sigla_materia"]
 
             # Buscar todas las materias inscritas por el estudiante en el periodo
             grupos_inscritos_result = await db.execute(
@@ -815,6 +649,8 @@ async def _add_group_to_inscription_async(inscription_data: Dict[str, Any], grup
             
             if not inscripcion:
                 # Crear nueva inscripción
+                if not codigo_inscripcion:
+                    codigo_inscripcion = await new_inscripcion_code(db)
                 inscripcion = Inscripcion(
                     codigo_inscripcion=codigo_inscripcion,
                     registro_academico=inscription_data["registro_academico"],
@@ -826,8 +662,11 @@ async def _add_group_to_inscription_async(inscription_data: Dict[str, Any], grup
             else:
                 codigo_inscripcion = inscripcion.codigo_inscripcion
             
+            # Reservar el cupo del grupo (falla si no existe o está lleno)
+            await _reserve_seats(db, [grupo_codigo], seat_hold)
+            
             # Crear el detalle para este grupo específico
-            codigo_detalle = f"D{datetime.now().strftime('%y%m%d')}{str(uuid.uuid4())[:3].upper()}"
+            codigo_detalle = (await new_detalle_codes(1, db))[0]
             
             detalle = DetalleInscripcion(
                 codigo_detalle=codigo_detalle,
@@ -837,9 +676,6 @@ async def _add_group_to_inscription_async(inscription_data: Dict[str, Any], grup
             
             db.add(detalle)
             
-            # Actualizar contador de inscritos en el grupo
-            await _increment_grupo_inscritos(db, grupo_codigo)
-            
             await db.commit()
             
             return {
@@ -853,6 +689,305 @@ async def _add_group_to_inscription_async(inscription_data: Dict[str, Any], grup
             await db.rollback()
             raise e
 
+# ===== INSCRIPCIÓN POR GRUPOS COMO CHORD =====
+
+@celery_app.task(name="app.tasks.group_inscription_chord_task", bind=True)
+def group_inscription_chord_task(self, inscription_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validar una sola vez (estudiante, período, horarios, materias) y despachar un
+    chord con una subtarea por grupo. La tarea se reemplaza por el chord, así que
+    su ID termina con el resultado agregado del callback.
+    """
+    try:
+        context = run_async_in_process(_prepare_group_inscription_async, inscription_data)
+    except Exception as e:
+        return {
+            "status": "ERROR",
+            "message": f"Error al validar inscripción: {str(e)}",
+            "error": str(e),
+            "registro_academico": inscription_data.get("registro_academico"),
+            "codigo_periodo": inscription_data.get("codigo_periodo"),
+            "grupos": []
+        }
+    
+    if not context["grupos"]:
+        return _aggregate_group_results([], context)
+    
+    header = group(add_validated_group_task.s(context, grupo) for grupo in context["grupos"])
+    raise self.replace(chord(header, finalize_group_inscription_task.s(context)))
+
+@celery_app.task(name="app.tasks.add_validated_group_task")
+def add_validated_group_task(context: Dict[str, Any], grupo_codigo: str) -> Dict[str, Any]:
+    """Reservar cupo e insertar el detalle de un grupo ya validado (nunca lanza)"""
+    try:
+        codigo_detalle = run_async_in_process(_add_validated_group_async, context, grupo_codigo)
+        return {"grupo": grupo_codigo, "status": "SUCCESS", "codigo_detalle": codigo_detalle}
+    except Exception as e:
+        return {"grupo": grupo_codigo, "status": "ERROR", "error": str(e)}
+
+@celery_app.task(name="app.tasks.finalize_group_inscription_task")
+def finalize_group_inscription_task(results: List[Dict[str, Any]], context: Dict[str, Any]) -> Dict[str, Any]:
+    """Callback del chord: consolidar los resultados por grupo en un solo resultado"""
+    if context.get("inscripcion_creada") and not any(r["status"] == "SUCCESS" for r in results):
+        try:
+            run_async_in_process(_discard_empty_inscription_async, context["codigo_inscripcion"])
+        except Exception as e:
+            logger.warning(f"No se pudo descartar la inscripción vacía {context['codigo_inscripcion']}: {e}")
+    return _aggregate_group_results(results, context)
+
+def _aggregate_group_results(results: List[Dict[str, Any]], context: Dict[str, Any]) -> Dict[str, Any]:
+    successful = sum(1 for r in results if r["status"] == "SUCCESS")
+    failed = len(results) - successful
+    if failed == 0:
+        status = "SUCCESS"
+    elif successful == 0:
+        status = "ERROR"
+    else:
+        status = "PARTIAL"
+    return {
+        "status": status,
+        "message": f"Inscripción por grupos: {successful} exitosos, {failed} fallidos",
+        "codigo_inscripcion": None if context.get("inscripcion_creada") and not successful else context["codigo_inscripcion"],
+        "registro_academico": context["registro_academico"],
+        "codigo_periodo": context["codigo_periodo"],
+        "fecha_inscripcion": context["fecha_inscripcion"],
+        "ya_inscritos": context["ya_inscritos"],
+        "successful": successful,
+        "failed": failed,
+        "grupos": results
+    }
+
+async def _prepare_group_inscription_async(inscription_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Validación compartida del chord; crea la inscripción si aún no existe"""
+    registro_academico = inscription_data["registro_academico"]
+    codigo_periodo = inscription_data["codigo_periodo"]
+    grupos = list(dict.fromkeys(inscription_data.get("grupos", [])))
+    
+    async with get_worker_runtime().session_factory() as db:
+        try:
+            result = await db.execute(
+                select(Estudiante.estado_academico).where(Estudiante.registro_academico == registro_academico)
+            )
+            estado_academico = result.scalar_one_or_none()
+            if estado_academico is None:
+                raise EstudianteNoEncontradoException(registro_academico)
+            if estado_academico == "BLOQUEADO":
+                raise EstudianteBloqueadoException(registro_academico)
+            
+            periodo = await get_catalog_cache().get_periodo(db, codigo_periodo)
+            if not periodo:
+                raise PeriodoNoEncontradoException(codigo_periodo)
+            if periodo["estado"] != "ACTIVO":
+                raise PeriodoInactivoException(codigo_periodo, periodo["estado"])
+            
+            catalogo = await get_catalog_cache().get_grupos(db, grupos)
+            for codigo_grupo in grupos:
+                if codigo_grupo not in catalogo:
+                    raise GrupoNoEncontradoException(codigo_grupo)
+            
+            result = await db.execute(
+                select(Inscripcion).where(
+                    and_(
+                        Inscripcion.registro_academico == registro_academico,
+                        Inscripcion.codigo_periodo == codigo_periodo
+                    )
+                )
+            )
+            inscripcion = result.scalar_one_or_none()
+            
+            grupos_ya_inscritos: List[str] = []
+            if inscripcion:
+                result = await db.execute(
+                    select(DetalleInscripcion.codigo_grupo).where(
+                        DetalleInscripcion.codigo_inscripcion == inscripcion.codigo_inscripcion
+                    )
+                )
+                grupos_ya_inscritos = [row[0] for row in result]
+            grupos_nuevos = [g for g in grupos if g not in grupos_ya_inscritos]
+            
+            # Validaciones que dependen de todos los grupos: se hacen aquí y no en
+            # cada subtarea, porque los grupos hermanos se insertan en paralelo
+            await _validate_horarios_conflicto(db, grupos_nuevos)
+            await _validate_horarios_conflicto_with_existing(db, registro_academico, grupos_nuevos)
+            await _validate_no_duplicate_materias(db, grupos_nuevos)
+            if grupos_ya_inscritos:
+                existentes = await get_catalog_cache().get_grupos(db, grupos_ya_inscritos)
+                materias_existentes = {g["sigla_materia"] for g in existentes.values()}
+                for codigo_grupo in grupos_nuevos:
+                    sigla_materia = catalogo[codigo_grupo]["sigla_materia"]
+                    if sigla_materia in materias_existentes:
+                        raise GrupoDuplicadoException(
+                            codigo_grupo,
+                            f"Materia {sigla_materia} ya está inscrita en este período",
+                            codigo_grupo
+                        )
+            
+            inscripcion_creada = False
+            if not inscripcion and grupos_nuevos:
+                inscripcion = Inscripcion(
+                    codigo_inscripcion=inscription_data.get("codigo_inscripcion") or await new_inscripcion_code(db),
+                    registro_academico=registro_academico,
+                    codigo_periodo=codigo_periodo,
+                    fecha_inscripcion=date.today()
+                )
+                db.add(inscripcion)
+                await db.commit()
+                inscripcion_creada = True
+            
+            return {
+                "registro_academico": registro_academico,
+                "codigo_periodo": codigo_periodo,
+                "codigo_inscripcion": inscripcion.codigo_inscripcion if inscripcion else None,
+                "fecha_inscripcion": (inscripcion.fecha_inscripcion if inscripcion else date.today()).isoformat(),
+                "inscripcion_creada": inscripcion_creada,
+                "grupos": grupos_nuevos,
+                "ya_inscritos": [g for g in grupos if g in grupos_ya_inscritos],
+                "correlation_id": inscription_data.get("correlation_id")
+            }
+        except Exception:
+            await db.rollback()
+            raise
+
+async def _add_validated_group_async(context: Dict[str, Any], grupo_codigo: str) -> str:
+    """Reservar el cupo de un grupo validado e insertar su detalle"""
+    if not settings.SEAT_LEDGER_ENABLED:
+        return await _add_validated_group_db(context, grupo_codigo)
+    
+    async with get_seat_ledger().hold(
+        [grupo_codigo],
+        session_factory=get_worker_runtime().session_factory,
+        owner=(context["registro_academico"], context["codigo_periodo"])
+    ) as seat_hold:
+        return await _add_validated_group_db(context, grupo_codigo, seat_hold)
+
+async def _add_validated_group_db(context: Dict[str, Any], grupo_codigo: str, seat_hold: Optional[SeatHold] = None) -> str:
+    async with get_worker_runtime().session_factory() as db:
+        try:
+            await _reserve_seats(db, [grupo_codigo], seat_hold)
+            codigo_detalle = (await new_detalle_codes(1, db))[0]
+            db.add(DetalleInscripcion(
+                codigo_detalle=codigo_detalle,
+                codigo_inscripcion=context["codigo_inscripcion"],
+                codigo_grupo=grupo_codigo
+            ))
+            await db.commit()
+            return codigo_detalle
+        except Exception:
+            await db.rollback()
+            raise
+
+async def _discard_empty_inscription_async(codigo_inscripcion: str) -> None:
+    """Eliminar una inscripción creada por el chord si quedó sin detalles"""
+    async with get_worker_runtime().session_factory() as db:
+        await db.execute(
+            delete(Inscripcion).where(
+                and_(
+                    Inscripcion.codigo_inscripcion == codigo_inscripcion,
+                    ~exists().where(DetalleInscripcion.codigo_inscripcion == codigo_inscripcion)
+                )
+            )
+        )
+        await db.commit()
+
+@celery_app.task(name="app.tasks.reconcile_seat_ledger_task")
+def reconcile_seat_ledger_task() -> Dict[str, Any]:
+    """Aplicar a grupo.inscritos_actuales los deltas acumulados en el ledger de cupos"""
+    if not settings.SEAT_LEDGER_ENABLED:
+        return {"status": "DISABLED"}
+    deltas = run_async_in_process(_reconcile_seat_ledger_async)
+    return {"status": "SUCCESS", "grupos_actualizados": len(deltas), "deltas": deltas}
+
+async def _reconcile_seat_ledger_async() -> Dict[str, int]:
+    async with get_worker_runtime().session_factory() as db:
+        return await get_seat_ledger().reconcile(db)
+
+@celery_app.task(name="app.tasks.repair_seat_ledger_task")
+def repair_seat_ledger_task(recount: bool = False) -> Dict[str, Any]:
+    """Reconstruir el ledger de cupos desde Postgres"""
+    total = run_async_in_process(_repair_seat_ledger_async, recount)
+    return {"status": "SUCCESS", "grupos": total}
+
+async def _repair_seat_ledger_async(recount: bool) -> int:
+    async with get_worker_runtime().session_factory() as db:
+        return await get_seat_ledger().repair(db, recount=recount)
+
+@celery_app.task(name="app.tasks.refresh_historial_reports_task")
+def refresh_historial_reports_task() -> Dict[str, Any]:
+    """Recalcular los reportes de los períodos/materias con cambios de historial"""
+    refrescados = run_async_in_process(_refresh_historial_reports_async)
+    return {"status": "SUCCESS", **refrescados}
+
+async def _refresh_historial_reports_async() -> Dict[str, int]:
+    async with get_worker_runtime().session_factory() as db:
+        return await get_historial_report_store().refresh(db)
+
+@celery_app.task(name="app.tasks.rebuild_historial_reports_task")
+def rebuild_historial_reports_task() -> Dict[str, Any]:
+    """Recalcular todos los reportes de rendimiento desde historial_academico"""
+    totales = run_async_in_process(_rebuild_historial_reports_async)
+    return {"status": "SUCCESS", **totales}
+
+async def _rebuild_historial_reports_async() -> Dict[str, int]:
+    async with get_worker_runtime().session_factory() as db:
+        return await get_historial_report_store().rebuild(db)
+
+@celery_app.task(name="app.tasks.recover_orphaned_sagas_task")
+def recover_orphaned_sagas_task() -> Dict[str, Any]:
+    """Compensar sagas que quedaron a medias por la caída de un worker"""
+    resultado = run_async_in_process(recover_orphaned_sagas, get_worker_runtime().session_factory)
+    return {"status": "SUCCESS", **resultado}
+
+@worker_ready.connect
+def _ensure_id_sequence_on_worker_start(**kwargs):
+    # Crear la secuencia de códigos aquí y no en la ruta de cada inscripción
+    try:
+        get_worker_runtime().call(ensure_id_sequence)
+    except Exception as e:
+        logger.error(f"No se pudo preparar la secuencia de códigos: {e}")
+
+@worker_ready.connect
+def _recover_sagas_on_worker_start(**kwargs):
+    # Un worker nuevo puede ser el reemplazo del que se cayó: revisar el log de
+    # sagas ahora y de nuevo cuando las sagas del worker caído ya cuenten como
+    # huérfanas (sin depender de que celery beat esté corriendo)
+    if settings.SAGA_RECOVERY_ON_START:
+        recover_orphaned_sagas_task.delay()
+        recover_orphaned_sagas_task.apply_async(countdown=settings.SAGA_ORPHAN_TIMEOUT + 60)
+
+@celery_app.task(bind=True, name="app.tasks.import_historial_task")
+def import_historial_task(self, archivo_ref: str, formato: str, on_duplicate: str = "error") -> Dict[str, Any]:
+    """Importar un archivo de historial (CSV/NDJSON) guardado en Redis con COPY y validación en conjunto"""
+    has_request_id = hasattr(self, 'request') and getattr(self.request, 'id', None)
+    # report_progress corre en otro hilo (asyncio.to_thread): id explícito
+    task_id = self.request.id if has_request_id else None
+
+    def report_progress(etapa: str, filas: int):
+        if task_id:
+            self.update_state(
+                task_id=task_id,
+                state="PROGRESS",
+                meta={"message": f"Importación de historial: {etapa} ({filas} filas)", "etapa": etapa, "filas": filas}
+            )
+
+    importer = HistorialImporter(get_worker_runtime().session_factory, on_duplicate=on_duplicate)
+    resultado = run_async_in_process(_import_historial_async, importer, archivo_ref, formato, report_progress)
+    return {
+        "status": "SUCCESS",
+        "message": (
+            f"Importación completada: {resultado['insertados']} insertados, "
+            f"{resultado['actualizados']} actualizados, {resultado['fallidos']} con errores"
+        ),
+        **resultado
+    }
+
+async def _import_historial_async(importer: HistorialImporter, archivo_ref: str, formato: str, report_progress):
+    payload = await load_staged_payload(archivo_ref)
+    if payload is None:
+        raise ValueError(f"El archivo de importación {archivo_ref} ya no está disponible (expiró)")
+    resultado = await importer.run(payload, formato, report_progress)
+    await discard_staged_payload(archivo_ref)
+    return resultado
+
 @celery_app.task(name="app.tasks.health_check_task")
 def health_check_task() -> Dict[str, Any]:
     """Tarea de health check para verificar que los workers están funcionando"""
@@ -923,11 +1058,14 @@ async def _create_inscription_with_saga(
         # Return simple result without database calls for now
         return {
             "success": True,
-            "codigo_inscripcion": f"I{datetime.now().strftime('%y%m%d')}{str(uuid.uuid4())[:3].upper()}",
+            "codigo_inscripcion": await new_inscripcion_code(),
             "registro_academico": registro_academico,
             "codigo_periodo": codigo_periodo,
             "fecha_inscripcion": date.today().isoformat(),
-            "detalles": [{"codigo_grupo": g, "codigo_detalle": f"D{uuid.uuid4().hex[:8]}"} for g in grupos],
+            "detalles": [
+                {"codigo_grupo": g, "codigo_detalle": c}
+                for g, c in zip(grupos, await new_detalle_codes(len(grupos)))
+            ],
             "grupos_count": len(grupos)
         }
         
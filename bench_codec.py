@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark de serialización de payloads (app/core/codec.py)
+
+Compara tamaño y costo de codificar/decodificar contra la configuración
+anterior (json.dumps + gzip de kombu, que es zlib) para payloads típicos:
+- Mensaje de Celery de una inscripción (args de create_inscription_task)
+- Resultado cacheado de idempotencia
+- Estado de una saga (SagaManager.register_saga)
+- Metadata de tarea (task_metadata:<id>)
+- Mensaje de lote (bulk_create_inscriptions_task con 500 inscripciones)
+
+Los formatos cuyo paquete no está instalado (msgpack, orjson, zstandard) se
+omiten con un aviso.
+"""
+import json
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime
+
+ITERATIONS = 20000
+BULK_ITERATIONS = 500
+
+
+def inscripcion(i=0):
+    return {
+        "registro_academico": f"2{i:08d}",
+        "codigo_periodo": "2025-1",
+        "grupos": ["G-INF110-SA", "G-MAT101-SB", "G-FIS100-SC"],
+        "codigo_inscripcion": f"I{i:09d}",
+        "fecha_inscripcion": datetime(2025, 2, 3, 8, 30).isoformat(),
+    }
+
+
+def payloads():
+    task_id = str(uuid.uuid4())
+    now = datetime(2025, 2, 3, 8, 30, 15)
+    return [
+        ("Mensaje inscripción", [[inscripcion()], {}, {"callbacks": None, "errbacks": None,
+                                                        "chain": None, "chord": None}], ITERATIONS),
+        ("Resultado idempotencia", {
+            "result": {"codigo_inscripcion": "I000000001", "status": "SUCCESS",
+                       "grupos_inscritos": ["G-INF110-SA", "G-MAT101-SB"]},
+            "created_at": now.isoformat(),
+            "metadata": {"operation_args_count": 1, "operation_kwargs_keys": ["data"]},
+        }, ITERATIONS),
+        ("Estado saga", {
+            "transaction_id": task_id, "name": "inscription_200000001", "status": "completed",
+            "created_at": now.isoformat(), "started_at": now.isoformat(), "completed_at": now.isoformat(),
+            "error": None,
+            "steps": [{"name": name, "status": "completed", "error": None, "retry_count": 0}
+                      for name in ("validate_student", "reserve_grupos", "create_inscription",
+                                   "create_details", "commit_grupos", "send_confirmation")],
+        }, ITERATIONS),
+        ("Metadata de tarea", {
+            "correlation_id": task_id, "grupo": "G-INF110-SA", "registro_academico": "200000001",
+            "created_at": now.isoformat(), "inscription_type": "single_group",
+        }, ITERATIONS),
+        ("Mensaje lote (500)", [[[inscripcion(i) for i in range(500)]], {}, {}], BULK_ITERATIONS),
+    ]
+
+
+def legacy_dumps(obj):
+    return zlib.compress(json.dumps(obj, default=str).encode("utf-8"))
+
+
+def legacy_loads(raw):
+    return json.loads(zlib.decompress(raw))
+
+
+def measure(dumps, loads, obj, n):
+    raw = dumps(obj)
+    start = time.perf_counter()
+    for _ in range(n):
+        dumps(obj)
+    encode = (time.perf_counter() - start) / n * 1e6
+    start = time.perf_counter()
+    for _ in range(n):
+        loads(raw)
+    decode = (time.perf_counter() - start) / n * 1e6
+    return len(raw), encode, decode
+
+
+def main():
+    """Ejecutar el benchmark"""
+    from app.core import codec
+
+    variants = [("json+gzip (anterior)", legacy_dumps, legacy_loads)]
+    for fmt, available in (("json", True), ("orjson", codec.ORJSON_AVAILABLE), ("msgpack", codec.MSGPACK_AVAILABLE)):
+        if not available:
+            print(f"⚠️  {fmt} no instalado: se omite")
+            continue
+        plain = codec.PayloadCodec(fmt, compression_threshold=0)
+        compressed = codec.PayloadCodec(fmt, compression_threshold=1024)
+        variants.append((f"{fmt}", plain.dumps, plain.loads))
+        label = "zstd" if codec.ZSTD_AVAILABLE else "zlib"
+        variants.append((f"{fmt}+{label}≥1KiB", compressed.dumps, compressed.loads))
+    if not codec.ZSTD_AVAILABLE:
+        print("⚠️  zstandard no instalado: la compresión del codec usa zlib")
+
+    print(f"\n⏱️  Serialización de payloads ({ITERATIONS} iteraciones; lote {BULK_ITERATIONS})\n")
+    for name, obj, n in payloads():
+        print(f"📦 {name}")
+        base = None
+        for label, dumps, loads in variants:
+            size, encode, decode = measure(dumps, loads, obj, n)
+            base = base or (size, encode + decode)
+            print(f"  {label:<24} {size:8d} B ({size / base[0]:5.0%})  "
+                  f"enc {encode:8.2f} µs  dec {decode:8.2f} µs  "
+                  f"(total {(encode + decode) / base[1]:5.0%})")
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del middleware de logging (app/middleware/logging_middleware.py)
+
+Mide el overhead por request llamando directamente a la aplicación ASGI, sin
+servidor ni red:
+- App sin middleware (base)
+- Tres BaseHTTPMiddleware de paso (costo mínimo del stack anterior)
+- RequestLoggingMiddleware deshabilitado / muestreado al 0% / registrando todo
+
+Los registros van a un NullHandler para medir el middleware y no el I/O.
+"""
+import asyncio
+import logging
+import sys
+import time
+
+REQUESTS = 20000
+
+SCOPE = {
+    "type": "http",
+    "asgi": {"version": "3.0"},
+    "http_version": "1.1",
+    "method": "GET",
+    "scheme": "http",
+    "path": "/api/v1/inscripciones/I000000001",
+    "raw_path": b"/api/v1/inscripciones/I000000001",
+    "query_string": b"",
+    "root_path": "",
+    "headers": [
+        (b"host", b"localhost"),
+        (b"user-agent", b"bench"),
+        (b"x-forwarded-for", b"10.0.0.1"),
+    ],
+    "client": ("127.0.0.1", 50000),
+    "server": ("127.0.0.1", 8000),
+}
+
+
+async def endpoint(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", b"2")]})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+def legacy_stack(app):
+    """Tres BaseHTTPMiddleware que solo llaman a call_next"""
+    from starlette.middleware.base import BaseHTTPMiddleware
+
+    class Passthrough(BaseHTTPMiddleware):
+        async def dispatch(self, request, call_next):
+            return await call_next(request)
+
+    return Passthrough(Passthrough(Passthrough(app)))
+
+
+async def measure(app, n):
+    for _ in range(200):  # calentamiento
+        await app(dict(SCOPE), receive, send)
+    start = time.perf_counter()
+    for _ in range(n):
+        await app(dict(SCOPE), receive, send)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+async def run():
+    from app.middleware.logging_middleware import RequestLoggingMiddleware, logger
+
+    logger.handlers = [logging.NullHandler()]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    cases = [("Sin middleware", endpoint)]
+    try:
+        cases.append(("3x BaseHTTPMiddleware (paso)", legacy_stack(endpoint)))
+    except ImportError:
+        print("⚠️  starlette no instalado: se omite el stack anterior")
+    cases += [
+        ("RequestLogging deshabilitado", RequestLoggingMiddleware(endpoint, enabled=False)),
+        ("RequestLogging muestreo 0%", RequestLoggingMiddleware(endpoint, sample_rate=0.0)),
+        ("RequestLogging muestreo 100%", RequestLoggingMiddleware(endpoint, sample_rate=1.0)),
+    ]
+
+    base = None
+    for name, app in cases:
+        us = await measure(app, REQUESTS)
+        base = us if base is None else base
+        print(f"  {name:<32} {us:8.2f} µs/request  (+{us - base:6.2f} µs)")
+
+
+def main():
+    """Ejecutar el benchmark"""
+    print(f"⏱️  Overhead del middleware de logging ({REQUESTS} requests por caso)\n")
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Test de estrés de colisiones para los generadores de códigos (app/core/id_generator.py)
+
+- Formato legado: I<yymmdd><3 hex> colisiona dentro de un mismo día (el motivo
+  del reemplazo).
+- Snowflake: hilos concurrentes sobre un generador y varios procesos con nodos
+  distintos; verifica unicidad, longitud (String(10)) y orden monótono. Un
+  generador nuevo con el mismo nodo (reinicio) no repite códigos del anterior,
+  aunque este haya agotado la secuencia de un segundo.
+- Lease de nodo: dos leases nunca comparten nodo y un lease vencido detiene el
+  generador; se omite si no hay conexión a Redis.
+- Secuencia Postgres: dos generadores (como dos procesos) pidiendo códigos en
+  paralelo sobre una secuencia temporal; se omite si no hay conexión a la base.
+"""
+import asyncio
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from multiprocessing import Pool
+
+import pytest
+
+# Snowflake emite a lo sumo 1024 códigos por segundo y nodo
+CODES_PER_THREAD = 500
+THREADS = 8
+PROCESSES = 4
+
+
+def test_legacy_format():
+    """Colisiones del formato anterior en 5000 códigos del mismo día"""
+    codes = [f"I{datetime.now().strftime('%y%m%d')}{str(uuid.uuid4())[:3].upper()}" for _ in range(5000)]
+    duplicados = len(codes) - len(set(codes))
+    print(f"ℹ️  Formato legado: {duplicados} colisiones en {len(codes)} códigos")
+    # 16^3 = 4096 sufijos posibles: más códigos que sufijos garantiza colisiones
+    assert duplicados > 0
+
+
+def test_snowflake_threads():
+    """Unicidad y orden con varios hilos sobre el mismo generador"""
+    from app.core.id_generator import SnowflakeIdGenerator
+
+    generator = SnowflakeIdGenerator(node_id=1)
+    por_hilo = [[] for _ in range(THREADS)]
+
+    def worker(i):
+        for _ in range(CODES_PER_THREAD // 100):
+            por_hilo[i].extend(generator.next_codes_sync("D", 100))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    todos = [c for codes in por_hilo for c in codes]
+    assert len(todos) == len(set(todos)), f"{len(todos) - len(set(todos))} colisiones"
+    assert all(len(c) == 10 for c in todos), "códigos con longitud distinta de 10"
+    assert all(codes == sorted(codes) for codes in por_hilo), "códigos no monótonos dentro de un hilo"
+
+
+def _generate_in_process(node_id):
+    from app.core.id_generator import SnowflakeIdGenerator
+    return SnowflakeIdGenerator(node_id=node_id).next_codes_sync("I", CODES_PER_THREAD)
+
+
+def test_snowflake_processes():
+    """Unicidad entre procesos con nodos distintos"""
+    with Pool(PROCESSES) as pool:
+        resultados = pool.map(_generate_in_process, range(PROCESSES))
+    todos = [c for codes in resultados for c in codes]
+    assert len(todos) == len(set(todos)), f"{len(todos) - len(set(todos))} colisiones"
+
+
+def test_snowflake_restart_same_node():
+    """Un generador nuevo con el mismo nodo no repite los códigos del anterior"""
+    from app.core.id_generator import SnowflakeIdGenerator
+
+    anterior = SnowflakeIdGenerator(node_id=3).next_codes_sync("D", 1500)
+    nuevo = SnowflakeIdGenerator(node_id=3).next_codes_sync("D", 100)
+    assert not set(anterior) & set(nuevo)
+    assert max(anterior) < min(nuevo)
+
+
+def test_snowflake_expired_lease():
+    """Con el lease vencido el generador deja de emitir códigos"""
+    from app.core.id_generator import SnowflakeIdGenerator
+
+    class LeaseVencido:
+        valid_until = time.time() - 1
+
+    generator = SnowflakeIdGenerator(node_id=2, lease=LeaseVencido())
+    with pytest.raises(RuntimeError):
+        generator.next_codes_sync("I", 1)
+
+
+def test_node_lease_exclusive():
+    """Dos leases simultáneos toman nodos distintos y liberan su clave"""
+    import redis
+    from app.core.config import settings
+    from app.core.id_generator import NodeLease
+
+    client = redis.Redis.from_url(settings.REDIS_URL)
+    try:
+        client.ping()
+    except Exception as e:
+        pytest.skip(f"Redis no disponible: {e}")
+
+    leases = [NodeLease(client, ttl=5) for _ in range(2)]
+    try:
+        nodos = [lease.acquire() for lease in leases]
+        assert nodos[0] != nodos[1]
+        for lease in leases:
+            assert client.get(lease.key) == lease.token.encode()
+            assert lease.renew()
+    finally:
+        for lease in leases:
+            lease.release()
+    assert not any(client.exists(lease.key) for lease in leases)
+
+
+async def _sequence_stress():
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from app.core.config import settings
+    from app.core.database import build_engine_kwargs
+    from app.core.id_generator import SequenceBlockIdGenerator
+
+    engine = create_async_engine(
+        settings.DATABASE_URL.replace("postgresql://", "postgresql+psycopg://"),
+        **build_engine_kwargs()
+    )
+    sequence_name = f"codigo_seq_stress_{uuid.uuid4().hex[:8]}"
+    try:
+        generadores = [SequenceBlockIdGenerator(lambda: engine, sequence_name, block_size=50) for _ in range(2)]
+        await generadores[0].ensure_sequence()
+
+        async def pedir(generator, n):
+            codes = []
+            for _ in range(n):
+                codes.extend(await generator.next_codes("D", 7))
+            return codes
+
+        resultados = await asyncio.gather(*(pedir(g, 300) for g in generadores for _ in range(4)))
+        todos = [c for codes in resultados for c in codes]
+        return len(todos), len(set(todos))
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SEQUENCE IF EXISTS {sequence_name}"))
+        await engine.dispose()
+
+
+def test_sequence_blocks():
+    """Unicidad con dos asignadores de bloques sobre la misma secuencia"""
+    from sqlalchemy.exc import OperationalError
+
+    try:
+        total, unicos = asyncio.run(_sequence_stress())
+    except (OperationalError, OSError) as e:
+        pytest.skip(f"Postgres no disponible: {e}")
+    assert total == unicos, f"{total - unicos} colisiones"
+
+
+def main():
+    """Ejecutar todos los tests"""
+    print("🧪 Test de estrés de generación de códigos...\n")
+
+    tests = [
+        ("Formato legado", test_legacy_format),
+        ("Snowflake hilos", test_snowflake_threads),
+        ("Snowflake procesos", test_snowflake_processes),
+        ("Snowflake reinicio", test_snowflake_restart_same_node),
+        ("Snowflake lease vencido", test_snowflake_expired_lease),
+        ("Lease de nodo en Redis", test_node_lease_exclusive),
+        ("Secuencia Postgres", test_sequence_blocks),
+    ]
+
+    results = []
+    for name, test_func in tests:
+        print(f"Testing {name}...")
+        try:
+            test_func()
+            print(f"✅ {name}")
+            results.append(True)
+        except pytest.skip.Exception as e:
+            print(f"⚠️  {name} omitido: {e}")
+            results.append(True)
+        except AssertionError as e:
+            print(f"❌ {name}: {e}")
+            results.append(False)
+        print()
+
+    print(f"📊 Resultados: {sum(results)}/{len(results)} tests exitosos")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
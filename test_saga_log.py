@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test del log durable de sagas (app/core/saga_log.py) contra el Redis de REDIS_URL
+
+- Una saga creada por InscriptionSagaOrchestrator queda registrada en
+  saga:state:<id>, saga:log:<id>, saga:index y saga:active, con los nombres de
+  compensación que necesita la recuperación.
+- El listado paginado del cluster la devuelve.
+Se omite si Redis no está disponible.
+"""
+import asyncio
+import sys
+
+import pytest
+
+
+async def _created_saga_is_logged():
+    from app.core.redis_client import close_async_redis, get_async_redis
+    from app.core.saga_log import ACTIVE_KEY, INDEX_KEY, STATE_PREFIX, STREAM_PREFIX
+    from app.core.saga_pattern import InscriptionSagaOrchestrator, get_saga_manager
+
+    client = get_async_redis()
+    try:
+        await client.ping()
+    except Exception as e:
+        await close_async_redis()
+        pytest.skip(f"Redis no disponible: {e}")
+
+    orchestrator = InscriptionSagaOrchestrator(db_session=None, redis_client=client)
+    saga = await orchestrator.create_multi_group_inscription_saga(
+        {"registro_academico": "TEST000001", "codigo_periodo": "TEST-1"},
+        ["G-TEST-A", "G-TEST-B"],
+    )
+    log = get_saga_manager().log
+    state = None
+    try:
+        state = await log.load(saga.transaction_id)
+        assert state is not None, f"falta {STATE_PREFIX}{saga.transaction_id}"
+        assert state["kind"] == "inscription"
+        assert state["snapshot"]["transaction_id"] == saga.transaction_id
+        compensaciones = {s["name"]: s["compensation"] for s in state["recovery"]}
+        assert compensaciones["reserve_grupos"] == "_release_grupos"
+        assert await client.zscore(ACTIVE_KEY, saga.transaction_id) is not None
+        assert len(await log.history(saga.transaction_id)) >= 1
+
+        pagina, _ = await log.list(limit=500)
+        assert saga.transaction_id in {s["transaction_id"] for s in pagina}
+    finally:
+        await client.delete(STATE_PREFIX + saga.transaction_id, STREAM_PREFIX + saga.transaction_id)
+        await client.zrem(ACTIVE_KEY, saga.transaction_id)
+        if state is not None:
+            await client.zrem(INDEX_KEY, state["index_member"])
+        await close_async_redis()
+
+
+def test_created_saga_is_logged():
+    """Una saga creada por el orquestador deja saga:state:<id>"""
+    asyncio.run(_created_saga_is_logged())
+
+
+def main():
+    """Ejecutar todos los tests"""
+    print("🧪 Test del log durable de sagas...\n")
+    try:
+        test_created_saga_is_logged()
+    except pytest.skip.Exception as e:
+        print(f"⚠️  Omitido: {e}")
+        return 0
+    except AssertionError as e:
+        print(f"❌ Saga no registrada en el log: {e}")
+        return 1
+    print("✅ La saga creada quedó en saga:state, saga:log, saga:index y saga:active")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())